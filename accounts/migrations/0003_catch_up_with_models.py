@@ -0,0 +1,52 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='grade',
+            field=models.CharField(blank=True, choices=[('4', 'Grade 4'), ('9', 'Grade 9'), ('11', 'Grade 11'), ('0', 'None')], default='0', max_length=2, null=True, verbose_name='Grade'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='user_type',
+            field=models.CharField(choices=[('STUDENT', 'Student'), ('TEACHER', 'Teacher')], default='STUDENT', max_length=10, verbose_name='User Type'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, null=True, unique=True, verbose_name='Электронная почта'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active'], name='accounts_us_is_acti_a5841d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['balance'], name='accounts_us_balance_faeed3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['is_active', 'balance'], name='accounts_us_is_acti_396d63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['school'], name='accounts_us_school_f26a9f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['region', 'is_active'], name='accounts_us_region__ef045d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['test_is_started'], name='accounts_us_test_is_70a58e_idx'),
+        ),
+    ]
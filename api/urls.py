@@ -7,7 +7,7 @@ from test_logic.views import (
     # OptionViewSet, ResultViewSet, BookSuggestionViewSet, 
     product_tests_view, required_tests_by_product,
     complete_test_view, get_all_completed_tests,
-    get_completed_test_by_id
+    get_completed_test_by_id, submission_status_view, autosave_test_view
 )
 
 from payments.views import AddBalanceView
@@ -48,7 +48,9 @@ urlpatterns = [
 
     path('product/<uuid:product_id>/tests/', required_tests_by_product, name='required-tests-by-product'),
 
+    path('autosave/test/', autosave_test_view, name='autosave-test'),
     path('complete/test/', complete_test_view, name='complete-test'),
+    path('complete/test/<uuid:completed_test_id>/status/', submission_status_view, name='submission-status'),
     path('completed-tests/<uuid:completed_test_id>/', get_completed_test_by_id, name='get-completed-test-by-id'),
     path('completed-tests/', get_all_completed_tests, name='get-all-completed-tests'),
 
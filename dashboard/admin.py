@@ -1,3 +1,26 @@
 from django.contrib import admin
+from .models import StatisticsRollup, ExportJob, ExportWatermark
 
-# Register your models here.
+class StatisticsRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'region', 'school', 'product', 'test', 'attempts', 'correct', 'total', 'updated_at')
+    list_filter = ('date', 'region', 'product')
+    search_fields = ('school',)
+    date_hierarchy = 'date'
+    # Rows are maintained by fold_statistics_rollups and rebuild_statistics_rollups
+    readonly_fields = ('key', 'date', 'region', 'school', 'product', 'test', 'attempts', 'correct', 'total', 'updated_at')
+
+admin.site.register(StatisticsRollup, StatisticsRollupAdmin)
+
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'requested_by', 'status', 'processed', 'total', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    raw_id_fields = ('requested_by',)
+    readonly_fields = ('fingerprint',)
+
+admin.site.register(ExportJob, ExportJobAdmin)
+
+class ExportWatermarkAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'completed_date', 'shards', 'exported', 'updated_at')
+    search_fields = ('profile',)
+
+admin.site.register(ExportWatermark, ExportWatermarkAdmin)
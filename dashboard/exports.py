@@ -0,0 +1,452 @@
+"""
+Excel exports of completed attempts.
+
+write_statistics_workbook streams attempts into an xlsxwriter workbook in
+constant_memory mode: attempts are read newest first in keyset batches, each
+batch costing one query for the attempts and their students, at most two for
+scores not stored yet (see scoring.compute_scores) and one for test titles not
+seen before. Memory stays
+flat however many attempts are exported.
+
+stream_zip packs several files into a ZIP archive as it is sent, holding one
+file in memory at a time; the per-date and per-school exports use it. Their
+workbooks are built by shard_workbooks, one shard (date or school) at a time.
+With EXPORT_WORKERS above 1 these exports become ExportJobs instead of being
+streamed by the request, and the run_export_jobs worker builds the shards in
+a pool of that many processes.
+
+Statistics page exports always run as ExportJobs in the run_export_jobs
+worker. Job files end up in the default storage. A finished job is reused for
+the same kind and filters until a rollup row matching them changes, i.e.
+until an attempt in the exported range is graded or deleted.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+import xlsxwriter
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+from django.utils.timezone import now
+
+from test_logic.models import CompletedTest, Test
+from test_logic.scoring import get_scores_for
+
+from .models import ExportJob
+from .pagination import older_rows, row_key
+from .rollups import filter_rollups, fold_deltas, summarize
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+# Bytes handed to the response at a time while streaming a ZIP archive
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+HEADERS = [
+    'Пользователь', 'Регион', 'Школа', 'Дата завершения',
+    'Тест', 'Правильных', 'Неправильных', 'Всего вопросов', 'Результат (%)'
+]
+
+
+def normalize_filters(region_id=None, school=None, start_date=None, end_date=None):
+    """Statistics page filters as stored on an ExportJob."""
+    return {
+        'region': str(region_id or ''),
+        'school': school or '',
+        'start_date': start_date.isoformat() if start_date else '',
+        'end_date': end_date.isoformat() if end_date else '',
+    }
+
+
+def filter_arguments(filters):
+    """Turn stored filters back into (region_id, school, start_date, end_date)."""
+    return (
+        filters.get('region') or None,
+        filters.get('school') or None,
+        parse_date(filters.get('start_date') or ''),
+        parse_date(filters.get('end_date') or ''),
+    )
+
+
+def fingerprint(kind, filters):
+    return hashlib.sha256(json.dumps([kind, filters], sort_keys=True).encode()).hexdigest()
+
+
+def statistics_queryset(region_id=None, school=None, start_date=None, end_date=None):
+    """Completed attempts matching the statistics page filters; the end date is inclusive."""
+    completed_tests = CompletedTest.objects.select_related('user', 'user__region')
+    if region_id:
+        completed_tests = completed_tests.filter(user__region_id=region_id)
+    if school:
+        completed_tests = completed_tests.filter(user__school__icontains=school)
+    if start_date:
+        completed_tests = completed_tests.filter(completed_date__gte=start_date)
+    if end_date:
+        completed_tests = completed_tests.filter(completed_date__lt=end_date + timedelta(days=1))
+    return completed_tests
+
+
+def score_rows(batch, titles):
+    """
+    Return {completed_test_id: [(test_id, title, correct, total)]} for a batch
+    of attempts, sorted by title, leaving out tests without questions.
+
+    Stored scores come with the attempts themselves; attempts graded before
+    they were stored cost one grouped query for the whole batch plus the
+    answer key version check, and test titles not in `titles` (which is
+    updated) one more.
+    """
+    scores = get_scores_for(batch)
+
+    test_ids = {test_id for test_scores in scores.values() for test_id in test_scores} - titles.keys()
+    if test_ids:
+        for test_id, title in Test.objects.filter(id__in=test_ids).values_list('id', 'title'):
+            titles[str(test_id)] = title
+
+    rows = {}
+    for completed_test_id, test_scores in scores.items():
+        # Tests deleted since the attempt have no title left and are skipped
+        rows[completed_test_id] = sorted(
+            (
+                (test_id, titles[test_id], score['correct'], score['total'])
+                for test_id, score in test_scores.items()
+                if test_id in titles and score['total']
+            ),
+            key=lambda test_row: test_row[1],
+        )
+    return rows
+
+
+def write_statistics_workbook(completed_tests, output, progress=None, batch_size=BATCH_SIZE):
+    """
+    Write one row per attempt and test to `output` (a path or file object).
+
+    `progress`, if given, is called with the number of attempts written after
+    every batch. Returns the number of attempts written.
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format({
+        'bold': True,
+        'align': 'center',
+        'valign': 'vcenter',
+        'bg_color': '#f0f0f0'
+    })
+    worksheet = workbook.add_worksheet('Общая статистика')
+
+    # Set column widths for better readability
+    worksheet.set_column(0, 0, 30)  # User name
+    worksheet.set_column(1, 1, 20)  # Region
+    worksheet.set_column(2, 2, 20)  # School
+    worksheet.set_column(3, 3, 20)  # Date
+    worksheet.set_column(4, 4, 30)  # Test name
+    worksheet.set_column(5, 8, 15)  # Other columns
+    for col, header in enumerate(HEADERS):
+        worksheet.write(0, col, header, header_format)
+
+    # The packed answers and result snapshots are not needed and can be large
+    completed_tests = completed_tests.select_related('user', 'user__region').defer('answers', 'result_snapshot')
+    titles = {}
+    row = 1
+    written = 0
+    # constant_memory only allows writing rows in order, so batches follow the keyset;
+    # one row more than a batch tells whether another one follows
+    batch = list(completed_tests.order_by('-completed_date', '-id')[:batch_size + 1])
+    while batch:
+        has_next = len(batch) > batch_size
+        batch = batch[:batch_size]
+        rows = score_rows(batch, titles)
+
+        for completed_test in batch:
+            user = completed_test.user
+            user_name = f"{user.first_name} {user.last_name}"
+            region = str(user.region) if user.region else "Не указан"
+            school = user.school or "Не указана"
+            date = completed_test.completed_date.strftime('%Y-%m-%d %H:%M')
+
+            for _, title, correct, total in rows[completed_test.id]:
+                worksheet.write(row, 0, user_name)
+                worksheet.write(row, 1, region)
+                worksheet.write(row, 2, school)
+                worksheet.write(row, 3, date)
+                worksheet.write(row, 4, title)
+                worksheet.write(row, 5, correct)
+                worksheet.write(row, 6, total - correct)
+                worksheet.write(row, 7, total)
+                worksheet.write(row, 8, round(correct / total * 100, 2))
+                row += 1
+
+        written += len(batch)
+        if progress is not None:
+            progress(written)
+        if not has_next:
+            break
+        batch = list(older_rows(completed_tests, row_key(batch[-1]))[:batch_size + 1])
+
+    workbook.close()
+    return written
+
+
+class ZipStream:
+    """Write-only file object that keeps what zipfile writes until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=ZIP_CHUNK_SIZE):
+    """
+    Yield a ZIP archive of `entries`, (filename, write) pairs where write(file)
+    produces the entry's content. Entries are generated one at a time, as the
+    archive is consumed.
+    """
+    stream = ZipStream()
+    # zipfile sees that the stream cannot seek and writes sizes after each entry instead
+    # Workbooks are ZIP files already, so compressing them again only costs time
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as archive:
+        for filename, write in entries:
+            content = BytesIO()
+            write(content)
+            content.seek(0)
+            with archive.open(filename, 'w') as entry:
+                while chunk := content.read(chunk_size):
+                    entry.write(chunk)
+                    yield stream.drain()
+            yield stream.drain()
+    # The central directory
+    yield stream.drain()
+
+
+def export_workers():
+    return getattr(settings, 'EXPORT_WORKERS', 1)
+
+
+def close_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+def date_shards(start_date, end_date):
+    """(filename, lookup) of a workbook for every date with attempts between the dates."""
+    dates = CompletedTest.objects.filter(
+        completed_date__gte=start_date,
+        completed_date__lte=end_date
+    ).annotate(
+        date_only=TruncDate('completed_date')
+    ).values('date_only').annotate(
+        count=Count('id')
+    ).order_by('date_only')
+    return [
+        (f"tests_{date_group['date_only'].strftime('%Y-%m-%d')}_{i}.xlsx", {'completed_date__date': date_group['date_only']})
+        for i, date_group in enumerate(dates)
+    ]
+
+
+def school_shards():
+    """(filename, lookup) of a workbook for every school with attempts."""
+    schools = CompletedTest.objects.values(
+        'user__school'
+    ).annotate(
+        count=Count('id')
+    ).filter(
+        count__gt=0
+    ).order_by('user__school')
+
+    shards = []
+    # The counter keeps filenames unique
+    for i, school_group in enumerate(schools):
+        school_name = school_group['user__school'] or 'Unknown_School'
+        # Sanitize the filename and limit its length
+        safe_school_name = re.sub(r'[^\w]', '_', school_name)[:30]
+        # Students without a school are matched with IS NULL
+        shards.append((f"tests_{safe_school_name}_{i}.xlsx", {'user__school': school_group['user__school']}))
+    return shards
+
+
+def build_shard(lookup, path):
+    """Write the workbook of the attempts matching `lookup` to `path`. Returns the path and the attempts written."""
+    completed_tests = CompletedTest.objects.filter(**lookup)
+    return path, write_statistics_workbook(completed_tests, path)
+
+
+def copy_file(path):
+    def write(output):
+        with open(path, 'rb') as source:
+            shutil.copyfileobj(source, output)
+    return write
+
+
+def shard_workbooks(shards, workers=1, progress=None):
+    """
+    Build a workbook for every (filename, lookup) in `shards` and yield
+    (filename, write) pairs for stream_zip, in the order of `shards`.
+
+    `progress`, if given, is called with the number of attempts written so
+    far as each workbook is handed out.
+
+    With more than one worker the shards are built in parallel by a process
+    pool, each process with its own database connection. The pool is forked
+    from the calling process after closing its connections, so only commands
+    such as run_export_jobs use it, never a request.
+    """
+    with tempfile.TemporaryDirectory(prefix='export-') as directory:
+        paths = [os.path.join(directory, f'{index}.xlsx') for index in range(len(shards))]
+        lookups = [lookup for _, lookup in shards]
+        executor = None
+        if workers > 1 and len(shards) > 1:
+            close_connections()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=close_connections)
+            # map keeps the order of the shards; later ones are built while earlier ones are written
+            built = executor.map(build_shard, lookups, paths)
+        else:
+            built = map(build_shard, lookups, paths)
+
+        written = 0
+        try:
+            for (filename, _), (path, attempts) in zip(shards, built):
+                yield filename, copy_file(path)
+                os.remove(path)
+                written += attempts
+                if progress is not None:
+                    progress(written)
+        finally:
+            if executor is not None:
+                # Drop the queued shards when the archive is abandoned
+                executor.shutdown(cancel_futures=True)
+
+
+def write_shard_archive(shards, path, progress=None):
+    """Write the ZIP archive of the shard workbooks to `path`, built by EXPORT_WORKERS processes. Returns the attempts written."""
+    written = 0
+
+    def count(processed):
+        nonlocal written
+        written = processed
+        if progress is not None:
+            progress(processed)
+
+    with open(path, 'wb') as output:
+        for chunk in stream_zip(shard_workbooks(shards, export_workers(), count)):
+            output.write(chunk)
+    return written
+
+
+def request_export(user, region_id=None, school=None, start_date=None, end_date=None, kind=ExportJob.Kind.STATISTICS):
+    """
+    Return an ExportJob of `user` for the kind and filters: one of theirs already
+    queued or running, a finished one that is still current, or a new pending
+    job. A current file exported for someone else is handed out through a
+    finished job of the user's own, since jobs are only shown to the user who
+    requested them (and staff).
+    """
+    filters = normalize_filters(region_id, school, start_date, end_date)
+    key = fingerprint(kind, filters)
+    # Attempts graded since the last fold touch their rollup rows only once folded
+    fold_deltas()
+    rollups = filter_rollups(region_id, school, start_date, end_date)
+
+    jobs = ExportJob.objects.filter(fingerprint=key).order_by('-created_at')
+    active = jobs.filter(requested_by=user, status__in=[ExportJob.Status.PENDING, ExportJob.Status.RUNNING]).first()
+    if active is not None:
+        return active
+    done = jobs.filter(status=ExportJob.Status.DONE).first()
+    # Rollup rows are touched whenever a matching attempt is graded or deleted
+    if done is not None and done.file and not rollups.filter(updated_at__gte=done.started_at).exists():
+        if done.requested_by_id == user.id:
+            return done
+        # Shares the file, and its start time for later staleness checks
+        return ExportJob.objects.create(
+            requested_by=user, kind=kind, filters=filters, fingerprint=key, status=ExportJob.Status.DONE,
+            processed=done.processed, total=done.total, file=done.file.name,
+            started_at=done.started_at, finished_at=now(),
+        )
+
+    summary, _ = summarize(rollups)
+    return ExportJob.objects.create(requested_by=user, kind=kind, filters=filters, fingerprint=key, total=summary['attempts'])
+
+
+def claim_job(reclaim_after=timedelta(hours=1)):
+    """Mark the oldest pending job as running and return it, or None."""
+    # Jobs left running by a crashed worker are picked up again
+    stale = Q(status=ExportJob.Status.RUNNING, started_at__lt=now() - reclaim_after)
+    with transaction.atomic():
+        job = ExportJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ExportJob.Status.PENDING) | stale
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+        job.status = ExportJob.Status.RUNNING
+        job.started_at = now()
+        job.processed = 0
+        job.save(update_fields=['status', 'started_at', 'processed'])
+    return job
+
+
+def job_filename(job):
+    if job.kind == ExportJob.Kind.BY_DATE:
+        return f"tests_by_date_{job.filters['start_date']}_to_{job.filters['end_date']}.zip"
+    if job.kind == ExportJob.Kind.BY_SCHOOL:
+        return 'tests_by_school.zip'
+    return 'статистика_тестов.xlsx'
+
+
+def run_job(job):
+    """Generate the job's file. Returns True on success; failures are stored on the job."""
+    def progress(processed):
+        ExportJob.objects.filter(id=job.id).update(processed=processed)
+
+    suffix = os.path.splitext(job_filename(job))[1]
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        region_id, school, start_date, end_date = filter_arguments(job.filters)
+        if job.kind == ExportJob.Kind.BY_DATE:
+            job.processed = write_shard_archive(date_shards(start_date, end_date), path, progress)
+        elif job.kind == ExportJob.Kind.BY_SCHOOL:
+            job.processed = write_shard_archive(school_shards(), path, progress)
+        else:
+            completed_tests = statistics_queryset(region_id, school, start_date, end_date)
+            job.processed = write_statistics_workbook(completed_tests, path, progress)
+        with open(path, 'rb') as output:
+            job.file.save(f'{job.kind.lower()}_{job.id.hex}{suffix}', File(output), save=False)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.id)
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.Status.FAILED, error=str(e), finished_at=now()
+        )
+        return False
+    finally:
+        os.remove(path)
+
+    job.status = ExportJob.Status.DONE
+    job.finished_at = now()
+    job.save(update_fields=['status', 'processed', 'file', 'finished_at'])
+
+    # Older files for the same filters are out of date now
+    for old_job in ExportJob.objects.filter(fingerprint=job.fingerprint).exclude(id=job.id).exclude(file=''):
+        old_job.file.delete(save=False)
+        old_job.save(update_fields=['file'])
+    return True
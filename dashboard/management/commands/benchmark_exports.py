@@ -0,0 +1,143 @@
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from dashboard.exports import shard_workbooks, stream_zip
+from test_logic.models import CompletedTest, Product, Test
+from test_logic.scoring import totals
+
+SCHOOL_PREFIX = 'benchmark-school-'
+USER_PREFIX = 'benchmark-export-'
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-school ZIP export on synthetic schools with different numbers of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--schools',
+            type=int,
+            default=500,
+            help='Number of synthetic schools (default: 500)',
+        )
+        parser.add_argument(
+            '--attempts-per-school',
+            type=int,
+            default=40,
+            help='Completed tests per school (default: 40)',
+        )
+        parser.add_argument(
+            '--workers',
+            default='',
+            help='Comma-separated worker counts to compare (default: 1, 2, 4, ... up to the number of cores)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the synthetic data instead of deleting it',
+        )
+
+    def worker_counts(self, value):
+        if value:
+            try:
+                counts = [int(count) for count in value.split(',')]
+            except ValueError:
+                raise CommandError('--workers must be a comma-separated list of numbers')
+            if min(counts) < 1:
+                raise CommandError('--workers must be at least 1')
+            return counts
+
+        cores = os.cpu_count() or 1
+        counts = [1]
+        while counts[-1] * 2 <= cores:
+            counts.append(counts[-1] * 2)
+        if counts[-1] != cores:
+            counts.append(cores)
+        return counts
+
+    def create_dataset(self, schools, attempts_per_school, rng):
+        product = Product.objects.create(title='Benchmark export')
+        tests = [Test.objects.create(title=f'Benchmark subject {index}', product=product) for index in range(5)]
+
+        users = User.objects.bulk_create([
+            User(
+                username=f'{USER_PREFIX}{school}-{index}',
+                first_name='Benchmark',
+                last_name=f'Student {index}',
+                school=f'{SCHOOL_PREFIX}{school:04d}',
+            )
+            for school in range(schools)
+            # A handful of students per school, each with several attempts
+            for index in range(max(1, attempts_per_school // 4))
+        ], batch_size=1000)
+
+        completed_tests = []
+        started = datetime(2026, 1, 1, 9, 0)
+        for user in users:
+            for _ in range(4):
+                test_scores = {}
+                for test in tests:
+                    total = rng.randint(10, 40)
+                    test_scores[str(test.id)] = {'correct': rng.randint(0, total), 'total': total}
+                correct, total = totals(test_scores)
+                completed_tests.append(CompletedTest(
+                    user=user,
+                    product=product,
+                    test_scores=test_scores,
+                    correct_count=correct,
+                    total_count=total,
+                ))
+        with transaction.atomic():
+            CompletedTest.objects.bulk_create(completed_tests, batch_size=1000)
+            # completed_date is auto_now_add; spread the attempts over a few weeks
+            for day in range(30):
+                CompletedTest.objects.filter(
+                    product=product, id__in=[completed_test.id for completed_test in completed_tests[day::30]]
+                ).update(completed_date=started + timedelta(days=day))
+        return product, len(completed_tests)
+
+    def delete_dataset(self, product):
+        # Without stored scores the rollup signal has nothing to subtract for each deleted attempt
+        CompletedTest.objects.filter(product=product).update(test_scores=None)
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        product.delete()
+
+    def run_export(self, shards, workers):
+        started = time.perf_counter()
+        size = 0
+        for chunk in stream_zip(shard_workbooks(shards, workers)):
+            size += len(chunk)
+        return time.perf_counter() - started, size
+
+    def handle(self, *args, **options):
+        schools = options['schools']
+        attempts_per_school = options['attempts_per_school']
+        if schools < 1 or attempts_per_school < 1:
+            raise CommandError('--schools and --attempts-per-school must be at least 1')
+        worker_counts = self.worker_counts(options['workers'])
+
+        self.stdout.write(f'Creating {schools} synthetic schools')
+        product, attempts = self.create_dataset(schools, attempts_per_school, random.Random(42))
+        try:
+            shards = [
+                (f'tests_{school}.xlsx', {'product_id': product.id, 'user__school': f'{SCHOOL_PREFIX}{school:04d}'})
+                for school in range(schools)
+            ]
+            self.stdout.write(f'Exporting {attempts} completed tests in {len(shards)} workbooks on {os.cpu_count()} core(s)')
+            self.stdout.write(f"{'workers':>8} {'seconds':>10} {'speedup':>10} {'archive MB':>12}")
+
+            baseline = None
+            for workers in worker_counts:
+                seconds, size = self.run_export(shards, workers)
+                baseline = baseline or seconds
+                self.stdout.write(f'{workers:>8} {seconds:>10.2f} {baseline / seconds:>10.2f} {size / 2 ** 20:>12.1f}')
+        finally:
+            if not options['keep']:
+                self.delete_dataset(product)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
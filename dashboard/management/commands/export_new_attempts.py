@@ -0,0 +1,80 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.exports import normalize_filters
+from dashboard.models import ExportWatermark
+from dashboard.watermarks import BATCH_SIZE, CSV, DEFAULT_LAG, FORMATS, export_new_attempts
+
+
+class Command(BaseCommand):
+    help = 'Export the completed tests added since the last run of an export profile as a new append-only shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'profile',
+            help='Name of the export profile; its watermark is created on the first run',
+        )
+        parser.add_argument(
+            '--region',
+            help='Only students of this region ID (fixed when the profile is created)',
+        )
+        parser.add_argument(
+            '--school',
+            help='Only students whose school contains this text (fixed when the profile is created)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default=CSV,
+            help='Shard format (default: csv)',
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory the shards are written to (default: current directory)',
+        )
+        parser.add_argument(
+            '--lag',
+            type=int,
+            default=DEFAULT_LAG,
+            help=f'Leave attempts completed in the last LAG seconds for the next run (default: {DEFAULT_LAG})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Completed tests read per query (default: {BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Start the profile over from the first attempt; existing shards are not touched',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['lag'] < 0:
+            raise CommandError('--lag must not be negative')
+
+        filters = normalize_filters(options['region'], options['school'])
+        watermark, created = ExportWatermark.objects.get_or_create(profile=options['profile'], defaults={'filters': filters})
+        given = options['region'] is not None or options['school'] is not None
+        if not created and given and watermark.filters != filters:
+            raise CommandError(f'Profile "{watermark.profile}" was created with other filters: {watermark.filters}')
+        if options['reset']:
+            watermark.completed_date = None
+            watermark.completed_test_id = None
+            watermark.save(update_fields=['completed_date', 'completed_test_id', 'updated_at'])
+
+        os.makedirs(options['output_dir'], exist_ok=True)
+        path, attempts = export_new_attempts(
+            watermark, options['output_dir'], options['format'], options['lag'], options['batch_size']
+        )
+        if path is None:
+            self.stdout.write(self.style.SUCCESS(f'No new completed tests for profile "{watermark.profile}"'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {attempts} completed test(s) to {path}; profile "{watermark.profile}" is at {watermark.completed_date}'
+        ))
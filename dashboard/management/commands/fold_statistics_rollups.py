@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.rollups import fold_deltas
+
+
+class Command(BaseCommand):
+    help = 'Add the counters of recently graded attempts to the dashboard statistics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of deltas folded per transaction (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        folded = fold_deltas(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Folded {folded} delta(s) into the rollups'))
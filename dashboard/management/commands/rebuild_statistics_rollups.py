@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics rollups from the stored attempts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start-date',
+            help='First day to rebuild, YYYY-MM-DD (default: the whole history)',
+        )
+        parser.add_argument(
+            '--end-date',
+            help='Last day to rebuild, YYYY-MM-DD (default: the whole history)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of completed tests read per query (default: 1000)',
+        )
+
+    def parse_date(self, value, option):
+        if value is None:
+            return None
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'{option} must be a date in YYYY-MM-DD format')
+
+    def handle(self, *args, **options):
+        start_date = self.parse_date(options['start_date'], '--start-date')
+        end_date = self.parse_date(options['end_date'], '--end-date')
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        attempts, rows = rebuild_rollups(start_date, end_date, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup row(s) from {attempts} completed test(s)'))
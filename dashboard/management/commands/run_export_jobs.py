@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dashboard.exports import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Generate the Excel files and archives of queued dashboard export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2.0)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the queue is empty instead of polling for new jobs',
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        while True:
+            job = claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(f'Running export job {job.id}')
+            if run_job(job):
+                done += 1
+                self.stdout.write(f'Export job {job.id} finished with {job.processed} completed test(s)')
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Export job {job.id} failed'))
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully ran {done} export job(s), {failed} failed'))
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0016_result_snapshots'),
+        ('accounts', '0003_catch_up_with_models'),
+        ('dashboard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, max_length=40, unique=True)),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('school', models.CharField(blank=True, default='', max_length=255, verbose_name='Образовательное учреждение')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Попыток')),
+                ('correct', models.IntegerField(default=0, verbose_name='Правильных ответов')),
+                ('total', models.IntegerField(default=0, verbose_name='Всего вопросов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='test_logic.product', verbose_name='Продукт')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.region', verbose_name='Город')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='test_logic.test', verbose_name='Тест')),
+            ],
+            options={
+                'verbose_name': 'Сводная статистика',
+                'verbose_name_plural': 'Сводная статистика',
+                'indexes': [models.Index(fields=['date', 'region'], name='dashboard_s_date_1da60a_idx'), models.Index(fields=['school'], name='dashboard_s_school_9310ae_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('STATISTICS', 'Statistics'), ('BY_DATE', 'By date'), ('BY_SCHOOL', 'By school')], default='STATISTICS', max_length=10, verbose_name='Вид'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_exportjob_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile', models.CharField(max_length=100, unique=True, verbose_name='Профиль')),
+                ('filters', models.JSONField(default=dict, verbose_name='Фильтры')),
+                ('completed_date', models.DateTimeField(blank=True, null=True, verbose_name='Дата последней попытки')),
+                ('completed_test_id', models.UUIDField(blank=True, null=True)),
+                ('shards', models.IntegerField(default=0, verbose_name='Файлов')),
+                ('exported', models.IntegerField(default=0, verbose_name='Выгружено попыток')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Инкрементальный экспорт',
+                'verbose_name_plural': 'Инкрементальные экспорты',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0019_completedquestion_completed_date_not_null'),
+        ('accounts', '0003_catch_up_with_models'),
+        ('dashboard', '0005_export_watermarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsRollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(editable=False, max_length=40)),
+                ('date', models.DateField()),
+                ('school', models.CharField(blank=True, default='', max_length=255)),
+                ('attempts', models.IntegerField()),
+                ('correct', models.IntegerField()),
+                ('total', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='test_logic.product')),
+                ('region', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='accounts.region')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='test_logic.test')),
+            ],
+            options={
+                'verbose_name': 'Изменение сводной статистики',
+                'verbose_name_plural': 'Изменения сводной статистики',
+                'indexes': [models.Index(fields=['date'], name='dashboard_s_date_15c0c0_idx')],
+            },
+        ),
+    ]
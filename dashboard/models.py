@@ -1,8 +1,135 @@
+from django.conf import settings
 from django.db import models
 
+from test_logic.ids import uuid7
+
 # Create your models here.
 class AddStudent(models.Model):
     excel_file = models.FileField(upload_to='files', verbose_name="Excel ученики")
 
     class Meta:
-        verbose_name_plural = 'Список школьников'
\ No newline at end of file
+        verbose_name_plural = 'Список школьников'
+
+class StatisticsRollup(models.Model):
+    """
+    Counters of graded attempts per day, region, school, product and test.
+
+    The row with an empty test holds the attempt totals over all tests.
+    Maintained by dashboard.rollups as attempts are graded; the
+    rebuild_statistics_rollups command recomputes them from history.
+    """
+    # NULL columns cannot be part of a unique constraint on PostgreSQL, so the grouping is hashed into one key
+    key = models.CharField(max_length=40, unique=True, editable=False)
+    date = models.DateField(verbose_name="Дата")
+    region = models.ForeignKey('accounts.Region', on_delete=models.CASCADE, null=True, blank=True, verbose_name="Город")
+    school = models.CharField(max_length=255, blank=True, default='', verbose_name="Образовательное учреждение")
+    product = models.ForeignKey('test_logic.Product', on_delete=models.CASCADE, verbose_name="Продукт")
+    test = models.ForeignKey('test_logic.Test', on_delete=models.CASCADE, null=True, blank=True, verbose_name="Тест")
+    attempts = models.IntegerField(default=0, verbose_name="Попыток")
+    correct = models.IntegerField(default=0, verbose_name="Правильных ответов")
+    total = models.IntegerField(default=0, verbose_name="Всего вопросов")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = 'Сводная статистика'
+        verbose_name_plural = 'Сводная статистика'
+        indexes = [
+            models.Index(fields=['date', 'region']),
+            models.Index(fields=['school']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.school} {self.product_id}"
+
+
+class StatisticsRollupDelta(models.Model):
+    """
+    Counters of one graded attempt (negative for a deleted one) waiting to be
+    added to its StatisticsRollup row.
+
+    Grading only appends these, so submissions from one school do not queue up
+    on the school's rollup rows; dashboard.rollups.fold_deltas adds them up.
+    """
+    key = models.CharField(max_length=40, editable=False)
+    date = models.DateField()
+    region = models.ForeignKey('accounts.Region', on_delete=models.CASCADE, null=True, blank=True)
+    school = models.CharField(max_length=255, blank=True, default='')
+    product = models.ForeignKey('test_logic.Product', on_delete=models.CASCADE)
+    test = models.ForeignKey('test_logic.Test', on_delete=models.CASCADE, null=True, blank=True)
+    attempts = models.IntegerField()
+    correct = models.IntegerField()
+    total = models.IntegerField()
+
+    class Meta:
+        verbose_name = 'Изменение сводной статистики'
+        verbose_name_plural = 'Изменения сводной статистики'
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+
+class ExportJob(models.Model):
+    """
+    An Excel export of the statistics page, or a ZIP archive of workbooks per
+    date or per school, generated by the run_export_jobs worker. Jobs with the
+    same `fingerprint` (the kind and the normalized filters) share the
+    generated file while no attempt matching them changes.
+    """
+
+    class Kind(models.TextChoices):
+        STATISTICS = 'STATISTICS', 'Statistics'
+        BY_DATE = 'BY_DATE', 'By date'
+        BY_SCHOOL = 'BY_SCHOOL', 'By school'
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs', verbose_name="Пользователь")
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.STATISTICS, verbose_name="Вид")
+    filters = models.JSONField(default=dict, verbose_name="Фильтры")
+    fingerprint = models.CharField(max_length=64, db_index=True, editable=False)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Статус")
+    processed = models.IntegerField(default=0, verbose_name="Обработано")
+    # Estimated from the statistics rollups when the job is created
+    total = models.IntegerField(null=True, blank=True, verbose_name="Всего")
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name="Файл")
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Начат")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Завершён")
+
+    class Meta:
+        verbose_name = 'Экспорт'
+        verbose_name_plural = 'Экспорты'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"ExportJob {self.id} - {self.status}"
+
+
+class ExportWatermark(models.Model):
+    """
+    How far an incremental export profile has got: the (completed_date, id)
+    of the last attempt written by export_new_attempts, and the filters the
+    profile was created with.
+    """
+    profile = models.CharField(max_length=100, unique=True, verbose_name="Профиль")
+    filters = models.JSONField(default=dict, verbose_name="Фильтры")
+    completed_date = models.DateTimeField(null=True, blank=True, verbose_name="Дата последней попытки")
+    completed_test_id = models.UUIDField(null=True, blank=True)
+    shards = models.IntegerField(default=0, verbose_name="Файлов")
+    exported = models.IntegerField(default=0, verbose_name="Выгружено попыток")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+
+    class Meta:
+        verbose_name = 'Инкрементальный экспорт'
+        verbose_name_plural = 'Инкрементальные экспорты'
+
+    def __str__(self):
+        return f"{self.profile} - {self.completed_date}"
@@ -0,0 +1,93 @@
+"""
+Keyset pagination of completed attempts for the dashboard.
+
+Pages are ordered newest first by (completed_date, id) and addressed by a
+cursor holding the key of the row at the page edge, so every page is an
+index range scan of page_size + 1 rows and a one-row probe the other way:
+no COUNT(*), no OFFSET. The total shown next to the pages is an estimate
+from the statistics rollups.
+"""
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(completed_test):
+    value = f'{completed_test.completed_date.isoformat()}|{completed_test.id.hex}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (completed_date, id) from a cursor, or None when it is malformed."""
+    try:
+        completed_date, completed_test_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(completed_date), uuid.UUID(completed_test_id)
+    except (ValueError, UnicodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.object_list[-1]) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(self.object_list[0]) if self.has_previous else None
+
+
+def newer_rows(queryset, key):
+    """Rows after `key` in (completed_date, id) order, oldest first."""
+    completed_date, completed_test_id = key
+    return queryset.filter(
+        Q(completed_date__gt=completed_date) | Q(completed_date=completed_date, id__gt=completed_test_id)
+    ).order_by('completed_date', 'id')
+
+
+def older_rows(queryset, key):
+    """Rows before `key` in (completed_date, id) order, newest first."""
+    completed_date, completed_test_id = key
+    return queryset.filter(
+        Q(completed_date__lt=completed_date) | Q(completed_date=completed_date, id__lt=completed_test_id)
+    ).order_by('-completed_date', '-id')
+
+
+def row_key(completed_test):
+    return completed_test.completed_date, completed_test.id
+
+
+def keyset_page(queryset, after=None, before=None, page_size=PAGE_SIZE):
+    """
+    Return the page of `queryset` following the `after` cursor, or preceding
+    the `before` one; the first page without either.
+
+    Pages are read with page_size + 1 rows, the extra one telling whether
+    there is a page beyond, plus a one-row probe for a page in the other
+    direction.
+    """
+    key = decode_cursor(before) if before else None
+    if key is not None:
+        rows = list(newer_rows(queryset, key)[:page_size + 1])
+        # With no newer page left the previous page is the first one, which is full even when fewer rows precede the cursor
+        if len(rows) > page_size:
+            rows = rows[:page_size][::-1]
+            return KeysetPage(rows, has_next=older_rows(queryset, row_key(rows[-1])).exists(), has_previous=True)
+
+    key = decode_cursor(after) if after else None
+    if key is not None:
+        rows = list(older_rows(queryset, key)[:page_size + 1])
+        # Rows newer than the page, or than the cursor when nothing is left after it
+        has_previous = newer_rows(queryset, row_key(rows[0]) if rows else key).exists()
+    else:
+        rows = list(queryset.order_by('-completed_date', '-id')[:page_size + 1])
+        has_previous = False
+    return KeysetPage(rows[:page_size], has_next=len(rows) > page_size, has_previous=has_previous)
@@ -0,0 +1,232 @@
+"""
+Statistics rollups for the dashboard.
+
+Every graded attempt adds to the StatisticsRollup rows of its day, the
+student's region and school, its product and each of its tests, plus one row
+with an empty test for the attempt totals. Statistics pages sum these rows
+instead of scanning CompletedTest, so their cost depends on the number of
+days and schools, not on the number of attempts.
+
+When attempt_graded is sent (see signals.py), the attempt's counters are
+appended as StatisticsRollupDelta rows inside the transaction that stores
+it, so they commit or roll back with the attempt, and submissions from the
+same school never wait on each other's rollup rows. fold_deltas adds the
+deltas to the rollup rows with F() expressions and deletes them; it runs
+from the fold_statistics_rollups cron job and before statistics are read.
+rebuild_rollups recomputes a date range from the stored attempts and drops
+the range's deltas while holding a lock that keeps new deltas and folds
+waiting, so an attempt graded during a rebuild is counted exactly once.
+
+An attempt counts towards the region and school the student had when it was
+graded, while the attempt list of the statistics page filters on the
+student's current ones. After a student moves, the two disagree until the
+affected days are rebuilt, which counts the attempts under the new school.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from test_logic.models import CompletedTest, Test
+from test_logic.scoring import get_scores_for, totals
+
+from .models import StatisticsRollup, StatisticsRollupDelta
+
+
+def rollup_key(day, region_id, school, product_id, test_id):
+    parts = [day.isoformat(), str(region_id or ''), school, str(product_id), str(test_id or '')]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def rollup_counters(completed_test, test_scores):
+    """
+    Return {(date, region_id, school, product_id, test_id): [attempts, correct, total]}
+    for one attempt, including the attempt totals under test_id None.
+    """
+    user = completed_test.user
+    group = (completed_test.completed_date.date(), user.region_id, user.school or '', completed_test.product_id)
+
+    correct, total = totals(test_scores)
+    counters = {group + (None,): [1, correct, total]}
+    for test_id, score in test_scores.items():
+        counters[group + (test_id,)] = [1, score['correct'], score['total']]
+    return counters
+
+
+def record_counters(counters, sign=1):
+    """Append counters (subtracted with sign=-1) as deltas for fold_deltas to add to the rollups."""
+    StatisticsRollupDelta.objects.bulk_create([
+        StatisticsRollupDelta(
+            key=rollup_key(day, region_id, school, product_id, test_id), date=day, region_id=region_id,
+            school=school, product_id=product_id, test_id=test_id,
+            attempts=sign * attempts, correct=sign * correct, total=sign * total,
+        )
+        for (day, region_id, school, product_id, test_id), (attempts, correct, total) in counters.items()
+    ])
+
+
+def add_attempt(completed_test):
+    record_counters(rollup_counters(completed_test, completed_test.test_scores or {}))
+
+
+def fold_deltas(batch_size=1000):
+    """Add the pending deltas to their rollup rows, creating rows as needed. Returns the number folded."""
+    folded = 0
+    while True:
+        with transaction.atomic():
+            # Deltas another fold is working on are left to it; a rebuild's lock keeps this waiting
+            deltas = list(
+                StatisticsRollupDelta.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+            )
+            if not deltas:
+                return folded
+
+            groups = {}
+            for delta in deltas:
+                group = groups.setdefault(delta.key, [delta, 0, 0, 0])
+                group[1] += delta.attempts
+                group[2] += delta.correct
+                group[3] += delta.total
+            # In key order, so concurrent folds lock shared rollup rows in the same order
+            for key, (delta, attempts, correct, total) in sorted(groups.items()):
+                apply_counters(delta, attempts, correct, total)
+            StatisticsRollupDelta.objects.filter(id__in=[delta.id for delta in deltas]).delete()
+        folded += len(deltas)
+
+
+def apply_counters(delta, attempts, correct, total):
+    """Add the counters to the rollup row of `delta`'s group."""
+    changes = {
+        'attempts': F('attempts') + attempts,
+        'correct': F('correct') + correct,
+        'total': F('total') + total,
+        # update() skips auto_now; exports compare against it
+        'updated_at': now(),
+    }
+    if StatisticsRollup.objects.filter(key=delta.key).update(**changes):
+        return
+    if attempts < 0:
+        # Nothing to subtract from; a rebuild will catch up
+        return
+    try:
+        with transaction.atomic():
+            StatisticsRollup.objects.create(
+                key=delta.key, date=delta.date, region_id=delta.region_id, school=delta.school,
+                product_id=delta.product_id, test_id=delta.test_id, attempts=attempts, correct=correct, total=total,
+            )
+    except IntegrityError:
+        # Another fold created the row in the meantime
+        StatisticsRollup.objects.filter(key=delta.key).update(**changes)
+
+
+def lock_deltas():
+    """
+    Keep other transactions from adding, folding or deleting deltas until the
+    current one ends. SQLite locks the whole database on the first write instead.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {connection.ops.quote_name(StatisticsRollupDelta._meta.db_table)} IN EXCLUSIVE MODE')
+
+
+def rebuild_rollups(start_date=None, end_date=None, batch_size=1000):
+    """
+    Recompute the rollups of attempts completed between the dates start_date
+    and end_date (inclusive, either open). Returns (attempts, rows).
+
+    Runs in one transaction. Attempts graded meanwhile wait for it to commit
+    before adding their deltas; the ones that committed before it started are
+    read by it, and their pending deltas are dropped.
+    """
+    completed_tests = CompletedTest.objects.select_related('user').only(
+        'id', 'completed_date', 'product_id', 'test_scores', 'user__region_id', 'user__school'
+    ).order_by('id')
+    rollups = StatisticsRollup.objects.all()
+    deltas = StatisticsRollupDelta.objects.all()
+    if start_date:
+        completed_tests = completed_tests.filter(completed_date__gte=start_date)
+        rollups = rollups.filter(date__gte=start_date)
+        deltas = deltas.filter(date__gte=start_date)
+    if end_date:
+        completed_tests = completed_tests.filter(completed_date__lt=end_date + timedelta(days=1))
+        rollups = rollups.filter(date__lte=end_date)
+        deltas = deltas.filter(date__lte=end_date)
+
+    with transaction.atomic():
+        lock_deltas()
+        # The old rows go first, which also takes the write lock where lock_deltas cannot
+        deltas.delete()
+        rollups.delete()
+        attempts, rows = count_attempts(completed_tests, batch_size)
+        StatisticsRollup.objects.bulk_create(rows, batch_size=1000)
+    return attempts, len(rows)
+
+
+def count_attempts(completed_tests, batch_size):
+    """Return the number of attempts and the StatisticsRollup rows they add up to."""
+    counters = defaultdict(lambda: [0, 0, 0])
+    attempts = 0
+    last_id = None
+    while True:
+        # Walk the primary key instead of using OFFSET
+        batch = completed_tests if last_id is None else completed_tests.filter(id__gt=last_id)
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+        # Attempts without stored scores are computed in one query per batch
+        scores = get_scores_for(batch)
+        for completed_test in batch:
+            for group, values in rollup_counters(completed_test, scores[completed_test.id]).items():
+                row = counters[group]
+                for position, value in enumerate(values):
+                    row[position] += value
+        attempts += len(batch)
+        last_id = batch[-1].id
+
+    # Tests deleted since the attempt have nothing left to point at
+    test_ids = {group[4] for group in counters if group[4] is not None}
+    existing = {str(test_id) for test_id in Test.objects.filter(id__in=test_ids).values_list('id', flat=True)}
+    rows = [
+        StatisticsRollup(
+            key=rollup_key(*group), date=group[0], region_id=group[1], school=group[2], product_id=group[3],
+            test_id=group[4], attempts=values[0], correct=values[1], total=values[2],
+        )
+        for group, values in counters.items()
+        if group[4] is None or group[4] in existing
+    ]
+    return attempts, rows
+
+
+def filter_rollups(region_id=None, school=None, start_date=None, end_date=None):
+    """Rollup rows matching the statistics page filters."""
+    rollups = StatisticsRollup.objects.all()
+    if region_id:
+        rollups = rollups.filter(region_id=region_id)
+    if school:
+        rollups = rollups.filter(school__icontains=school)
+    if start_date:
+        rollups = rollups.filter(date__gte=start_date)
+    if end_date:
+        rollups = rollups.filter(date__lte=end_date)
+    return rollups
+
+
+def summarize(rollups):
+    """Return the overall totals and the per-test breakdown of the given rollup rows."""
+    sums = {
+        'attempts': Coalesce(Sum('attempts'), 0),
+        'correct': Coalesce(Sum('correct'), 0),
+        'total': Coalesce(Sum('total'), 0),
+    }
+    overall = rollups.filter(test__isnull=True).aggregate(**sums)
+    by_test = list(
+        rollups.filter(test__isnull=False).values('test_id', 'test__title').annotate(**sums).order_by('test__title')
+    )
+    for row in [overall] + by_test:
+        row['incorrect'] = row['total'] - row['correct']
+        row['percentage'] = round(row['correct'] / row['total'] * 100, 2) if row['total'] else 0
+    return overall, by_test
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from test_logic.models import CompletedTest
+from test_logic.signals import attempt_graded
+
+from .rollups import add_attempt, record_counters, rollup_counters
+
+
+@receiver(attempt_graded)
+def add_attempt_to_rollups(sender, completed_test, **kwargs):
+    add_attempt(completed_test)
+
+
+@receiver(post_delete, sender=CompletedTest)
+def remove_attempt_from_rollups(sender, instance, **kwargs):
+    # Attempts without stored scores were never added incrementally
+    if instance.test_scores is None:
+        return
+    # In the deleting transaction, like the additions (see rollups.rebuild_rollups)
+    record_counters(rollup_counters(instance, instance.test_scores), sign=-1)
@@ -1,3 +1,422 @@
-from django.test import TestCase
+import csv
+import gzip
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from django.test.utils import CaptureQueriesContext
+from openpyxl import load_workbook
+
+from accounts.models import User, Region
+from test_logic.answer_keys import clear_answer_keys
+from test_logic.grading import save_completed_test
+from test_logic.models import Product, Test, Question, Option, CompletedTest, CompletedQuestion, StagedSubmission
+from test_logic.submission_intake import stage_submission
+
+from . import rollups
+from .exports import request_export, run_job, statistics_queryset, write_statistics_workbook
+from .models import ExportJob, ExportWatermark, StatisticsRollup, StatisticsRollupDelta
+from .pagination import encode_cursor, keyset_page
+from .rollups import filter_rollups, fold_deltas, rebuild_rollups, summarize
+from .watermarks import export_new_attempts, export_until
+
+# Attempts query, one grouped scoring query and the answer key version check for attempts without stored scores, test titles
+QUERIES_PER_BATCH = 4
+
+
+class StatisticsFixture:
+    """A product with three tests of four questions and a student of School 1 in Almaty."""
+
+    def create_statistics_data(self):
+        clear_answer_keys()
+        self.product = Product.objects.create(title='ENT')
+        self.tests = [Test.objects.create(title=f'Subject {i}', product=self.product) for i in range(3)]
+        self.questions = []
+        for test in self.tests:
+            for i in range(4):
+                question = Question.objects.create(test=test, text=f'Question {i}', task_type=1)
+                Option.objects.bulk_create([
+                    Option(question=question, text=f'Option {j}', is_correct=j == 0) for j in range(4)
+                ])
+                self.questions.append(question)
+        region = Region.objects.create(name='Almaty')
+        self.user = User.objects.create_user(
+            username='student', password='pw', first_name='Aru', last_name='Sultan', region=region, school='School 1'
+        )
+
+    def answers(self):
+        # Two of the four questions of every subject are answered correctly
+        answers = []
+        for test in self.tests:
+            questions = [question for question in self.questions if question.test_id == test.id]
+            answers.append((test.id, [
+                (question.id, [question.options.filter(is_correct=index < 2).first().id])
+                for index, question in enumerate(questions)
+            ]))
+        return answers
+
+
+class StatisticsWorkbookTests(StatisticsFixture, TestCase):
+
+    def setUp(self):
+        self.create_statistics_data()
+
+    def create_attempts(self, count):
+        answers = self.answers()
+        for i in range(count):
+            completed_test = save_completed_test(self.user, self.product, answers)
+            if i % 2:
+                # Graded before scores were stored on the attempt
+                CompletedTest.objects.filter(id=completed_test.id).update(test_scores=None, correct_count=None, total_count=None)
+                CompletedQuestion.objects.filter(completed_test=completed_test).update(is_correct=None)
+
+    def export(self, batch_size):
+        output = BytesIO()
+        clear_answer_keys()
+        with CaptureQueriesContext(connection) as queries:
+            written = write_statistics_workbook(CompletedTest.objects.all(), output, batch_size=batch_size)
+        return written, len(queries), list(load_workbook(output).active.iter_rows(values_only=True))
+
+    def test_queries_per_batch_do_not_depend_on_batch_size(self):
+        self.create_attempts(20)
+        written, small_batches, rows = self.export(batch_size=10)
+
+        self.assertEqual(written, 20)
+        # Header plus one row per attempt and subject
+        self.assertEqual(len(rows), 1 + 20 * 3)
+        self.assertEqual(rows[1][1:3], ('Almaty (Город)', 'School 1'))
+        self.assertEqual(rows[1][4:], ('Subject 0', 2, 2, 4, 50))
+        # Two batches, plus the answer key grading the attempts without stored scores
+        self.assertLessEqual(small_batches, 2 * QUERIES_PER_BATCH + 1)
+
+        self.create_attempts(20)
+        written, large_batches, rows = self.export(batch_size=20)
+
+        self.assertEqual(written, 40)
+        self.assertEqual(len(rows), 1 + 40 * 3)
+        self.assertEqual(large_batches, small_batches)
+
+
+class StatisticsRollupTests(StatisticsFixture, TestCase):
+
+    def setUp(self):
+        self.create_statistics_data()
+
+    def attempts(self, **filters):
+        fold_deltas()
+        return summarize(filter_rollups(**filters))[0]['attempts']
+
+    def test_grading_only_appends_deltas(self):
+        save_completed_test(self.user, self.product, self.answers())
+        self.assertFalse(StatisticsRollup.objects.exists())
+        self.assertEqual(StatisticsRollupDelta.objects.count(), 4)
+
+        save_completed_test(self.user, self.product, self.answers())
+        self.assertEqual(fold_deltas(batch_size=3), 8)
+
+        self.assertFalse(StatisticsRollupDelta.objects.exists())
+        overall, by_test = summarize(StatisticsRollup.objects.all())
+        self.assertEqual((overall['attempts'], overall['correct'], overall['total']), (2, 12, 24))
+        self.assertEqual([row['attempts'] for row in by_test], [2, 2, 2])
+
+    def test_attempts_are_counted_under_the_school_they_were_graded_in(self):
+        for _ in range(2):
+            save_completed_test(self.user, self.product, self.answers())
+        self.user.school = 'School 2'
+        self.user.save()
+
+        # The rollups keep the school at grading time, the attempt list follows the student
+        self.assertEqual(self.attempts(school='School 1'), 2)
+        self.assertEqual(self.attempts(school='School 2'), 0)
+        self.assertEqual(statistics_queryset(school='School 1').count(), 0)
+        self.assertEqual(statistics_queryset(school='School 2').count(), 2)
+
+        self.assertEqual(rebuild_rollups(), (2, 4))
+        self.assertEqual(self.attempts(school='School 1'), 0)
+        self.assertEqual(self.attempts(school='School 2'), 2)
+
+    def test_deleted_attempts_are_subtracted(self):
+        completed_test = save_completed_test(self.user, self.product, self.answers())
+        save_completed_test(self.user, self.product, self.answers())
+
+        fold_deltas()
+        completed_test.delete()
+        fold_deltas()
+
+        overall, by_test = summarize(StatisticsRollup.objects.all())
+        self.assertEqual((overall['attempts'], overall['correct'], overall['total']), (1, 6, 12))
+        self.assertEqual([row['attempts'] for row in by_test], [1, 1, 1])
+
+
+class KeysetPaginationTests(StatisticsFixture, TestCase):
+
+    def setUp(self):
+        self.create_statistics_data()
+        # Newest first; the middle two share a completed_date
+        dates = [datetime(2024, 5, 5), datetime(2024, 5, 4), datetime(2024, 5, 3), datetime(2024, 5, 3), datetime(2024, 5, 1)]
+        attempts = [save_completed_test(self.user, self.product, self.answers(), completed_date=date) for date in dates]
+        self.attempts = sorted(attempts, key=lambda attempt: (attempt.completed_date, attempt.id), reverse=True)
+
+    def page(self, **cursors):
+        page = keyset_page(CompletedTest.objects.all(), page_size=2, **cursors)
+        return [attempt.id for attempt in page.object_list], page.has_previous, page.has_next
+
+    def ids(self, *positions):
+        return [self.attempts[position].id for position in positions]
+
+    def test_walking_forward_and_back(self):
+        first = keyset_page(CompletedTest.objects.all(), page_size=2)
+        self.assertEqual(self.page(), (self.ids(0, 1), False, True))
+        self.assertEqual(self.page(after=first.next_cursor), (self.ids(2, 3), True, True))
+        self.assertEqual(self.page(after=encode_cursor(self.attempts[3])), (self.ids(4), True, False))
+
+        self.assertEqual(self.page(before=encode_cursor(self.attempts[4])), (self.ids(2, 3), True, True))
+        self.assertEqual(self.page(before=encode_cursor(self.attempts[2])), (self.ids(0, 1), False, True))
+
+    def test_previous_page_near_the_top_is_the_full_first_page(self):
+        self.assertEqual(self.page(before=encode_cursor(self.attempts[1])), (self.ids(0, 1), False, True))
+
+    def test_pages_past_the_end_link_back(self):
+        self.assertEqual(self.page(after=encode_cursor(self.attempts[4])), ([], True, False))
+
+    def test_malformed_cursors_give_the_first_page(self):
+        self.assertEqual(self.page(after='not a cursor'), (self.ids(0, 1), False, True))
+
+
+class ExportJobViewTests(TestCase):
+
+    def setUp(self):
+        self.principal = self.create_user('principal', is_principal=True)
+        self.other_principal = self.create_user('other_principal', is_principal=True)
+        self.job = ExportJob.objects.create(requested_by=self.principal, fingerprint='f')
+
+    def create_user(self, username, **flags):
+        return User.objects.create_user(username=username, password='pw', first_name='A', last_name='B', **flags)
+
+    def get(self, user, name):
+        self.client.force_login(user)
+        return self.client.get(reverse(name, args=[self.job.id]))
+
+    def test_students_cannot_see_export_jobs(self):
+        student = self.create_user('student')
+        self.job.requested_by = student
+        self.job.save()
+
+        self.assertRedirects(self.get(student, 'export_job'), reverse('test_statistics'), fetch_redirect_response=False)
+        self.assertEqual(self.get(student, 'export_job_progress').status_code, 403)
+        self.assertRedirects(self.get(student, 'export_job_download'), reverse('test_statistics'), fetch_redirect_response=False)
+
+    def test_jobs_are_only_shown_to_who_requested_them_and_staff(self):
+        self.assertEqual(self.get(self.principal, 'export_job_progress').status_code, 200)
+        self.assertEqual(self.get(self.other_principal, 'export_job').status_code, 404)
+        self.assertEqual(self.get(self.other_principal, 'export_job_progress').status_code, 404)
+        self.assertEqual(self.get(self.other_principal, 'export_job_download').status_code, 404)
+        self.assertEqual(self.get(self.create_user('staff', is_staff=True), 'export_job_progress').status_code, 200)
+
+    def test_current_files_are_shared_through_a_job_of_the_requester(self):
+        done = request_export(self.principal)
+        ExportJob.objects.filter(id=done.id).update(status=ExportJob.Status.DONE, file='exports/statistics.xlsx', started_at=now())
+
+        self.assertEqual(request_export(self.principal).id, done.id)
+        shared = request_export(self.other_principal)
+
+        self.assertNotEqual(shared.id, done.id)
+        self.assertEqual((shared.requested_by, shared.status, shared.file.name), (self.other_principal, ExportJob.Status.DONE, 'exports/statistics.xlsx'))
+
+    def test_running_jobs_of_others_are_not_handed_out(self):
+        running = request_export(self.principal)
+
+        self.assertEqual(request_export(self.principal).id, running.id)
+        self.assertEqual(request_export(self.other_principal).requested_by, self.other_principal)
+
+
+class ShardExportTests(StatisticsFixture, TestCase):
+
+    def setUp(self):
+        self.create_statistics_data()
+        for school in ['School 1', 'School 2']:
+            student = User.objects.create_user(username=school, password='pw', first_name='A', last_name='B', school=school)
+            save_completed_test(student, self.product, self.answers())
+        self.principal = User.objects.create_user(username='principal', password='pw', first_name='A', last_name='B', is_principal=True)
+        self.client.force_login(self.principal)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def archive_names(self, content):
+        return sorted(zipfile.ZipFile(BytesIO(content)).namelist())
+
+    @override_settings(EXPORT_WORKERS=1)
+    def test_single_worker_exports_are_streamed_by_the_request(self):
+        response = self.client.get(reverse('export_by_school'))
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertEqual(self.archive_names(b''.join(response.streaming_content)), ['tests_School_1_0.xlsx', 'tests_School_2_1.xlsx'])
+
+    @override_settings(EXPORT_WORKERS=2)
+    def test_pooled_exports_are_left_to_the_export_worker(self):
+        response = self.client.get(reverse('export_by_school'))
+
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, reverse('export_job', args=[job.id]), fetch_redirect_response=False)
+        self.assertEqual((job.kind, job.requested_by, job.status), (ExportJob.Kind.BY_SCHOOL, self.principal, ExportJob.Status.PENDING))
+
+        # Built in process here; PooledShardExportTests covers the pool
+        with override_settings(EXPORT_WORKERS=1):
+            self.assertTrue(run_job(job))
+        self.assertEqual(job.processed, 2)
+        with job.file.open('rb') as archive:
+            self.assertEqual(self.archive_names(archive.read()), ['tests_School_1_0.xlsx', 'tests_School_2_1.xlsx'])
+        response = self.client.get(reverse('export_job_download', args=[job.id]))
+        self.assertIn('tests_by_school.zip', response['Content-Disposition'])
+
+
+@mock.patch('dashboard.watermarks.now', return_value=datetime(2024, 5, 1, 12, 0))
+class WatermarkExportTests(StatisticsFixture, TestCase):
+
+    def setUp(self):
+        self.create_statistics_data()
+        self.watermark = ExportWatermark.objects.create(profile='daily')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def attempt(self, hour, minute):
+        return save_completed_test(self.user, self.product, self.answers(), completed_date=datetime(2024, 5, 1, hour, minute))
+
+    def stage(self, hour, minute):
+        return stage_submission(self.user, self.product, [], submitted_at=datetime(2024, 5, 1, hour, minute))
+
+    def exported_ids(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as shard:
+            return {row['completed_test_id'] for row in csv.DictReader(shard)}
+
+    def test_runs_stop_lag_seconds_before_now(self, _):
+        self.assertEqual(export_until(lag=60), datetime(2024, 5, 1, 11, 59))
+
+    def test_runs_stop_at_the_oldest_submission_still_waiting(self, _):
+        staged = self.stage(11, 30)
+        self.stage(11, 45)
+        self.assertEqual(export_until(lag=60), datetime(2024, 5, 1, 11, 30))
+
+        staged.status = StagedSubmission.Status.PROCESSING
+        staged.save()
+        self.assertEqual(export_until(lag=60), datetime(2024, 5, 1, 11, 30))
+
+        StagedSubmission.objects.update(status=StagedSubmission.Status.DONE)
+        self.assertEqual(export_until(lag=60), datetime(2024, 5, 1, 11, 59))
+
+    def test_attempts_after_the_clamp_are_left_for_the_next_run(self, _):
+        early = self.attempt(11, 0)
+        late = self.attempt(11, 40)
+        # Within the lag, so never part of these runs
+        self.attempt(11, 59)
+        staged = self.stage(11, 30)
+
+        path, attempts = export_new_attempts(self.watermark, self.directory)
+
+        self.assertEqual(attempts, 1)
+        self.assertEqual(self.exported_ids(path), {str(early.id)})
+        self.assertEqual((self.watermark.completed_test_id, self.watermark.shards), (early.id, 1))
+
+        # Nothing new below the clamp
+        self.assertEqual(export_new_attempts(self.watermark, self.directory), (None, 0))
+
+        staged.status = StagedSubmission.Status.DONE
+        staged.save()
+        path, attempts = export_new_attempts(self.watermark, self.directory)
+
+        self.assertEqual(attempts, 1)
+        self.assertEqual(self.exported_ids(path), {str(late.id)})
+        self.assertTrue(path.endswith('daily-000002.csv.gz'))
+        self.watermark.refresh_from_db()
+        self.assertEqual((self.watermark.completed_date, self.watermark.exported), (late.completed_date, 2))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Locks the rollup delta table, which only PostgreSQL supports')
+class RollupRebuildLockingTests(StatisticsFixture, TransactionTestCase):
+
+    def test_attempts_graded_during_a_rebuild_are_counted_once(self):
+        self.create_statistics_data()
+        save_completed_test(self.user, self.product, self.answers())
+        get_scores_for = rollups.get_scores_for
+        graders = []
+
+        def grade_during_scan(batch):
+            def grade():
+                # Threads get their own connection
+                try:
+                    # On another day, so it needs new rows rather than ones the rebuild already holds
+                    save_completed_test(self.user, self.product, self.answers(), completed_date=datetime(2024, 5, 1, 10, 0))
+                finally:
+                    connection.close()
+
+            grader = threading.Thread(target=grade)
+            grader.start()
+            graders.append(grader)
+            time.sleep(0.5)
+            # Waiting for the rebuild's lock
+            self.assertTrue(grader.is_alive())
+            return get_scores_for(batch)
+
+        try:
+            with mock.patch.object(rollups, 'get_scores_for', grade_during_scan):
+                self.assertEqual(rebuild_rollups(), (1, 4))
+        finally:
+            for grader in graders:
+                grader.join()
+
+        self.assertEqual(CompletedTest.objects.count(), 2)
+        fold_deltas()
+        self.assertEqual(summarize(StatisticsRollup.objects.all())[0]['attempts'], 2)
+        self.assertEqual(StatisticsRollup.objects.filter(date=datetime(2024, 5, 1).date()).count(), 4)
+
+    def test_attempts_of_one_school_do_not_wait_for_each_other(self):
+        self.create_statistics_data()
+        save_completed_test(self.user, self.product, self.answers())
+        fold_deltas()
+
+        def grade():
+            try:
+                save_completed_test(self.user, self.product, self.answers())
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            save_completed_test(self.user, self.product, self.answers())
+            # Counted into the same rollup rows while the first attempt is not committed yet
+            grader = threading.Thread(target=grade)
+            grader.start()
+            grader.join(timeout=5)
+            self.assertFalse(grader.is_alive())
+
+        fold_deltas()
+        self.assertEqual(summarize(StatisticsRollup.objects.all())[0]['attempts'], 3)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Forked workers need a database server to connect to')
+class PooledShardExportTests(StatisticsFixture, TransactionTestCase):
+
+    @override_settings(EXPORT_WORKERS=2)
+    def test_export_worker_builds_the_shards_in_a_pool(self):
+        self.create_statistics_data()
+        for school in ['School 1', 'School 2', 'School 3']:
+            student = User.objects.create_user(username=school, password='pw', first_name='A', last_name='B', school=school)
+            save_completed_test(student, self.product, self.answers())
+        job = request_export(self.user, kind=ExportJob.Kind.BY_SCHOOL)
+
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            self.assertTrue(run_job(job))
+            with job.file.open('rb') as archive:
+                names = sorted(zipfile.ZipFile(archive).namelist())
+
+        self.assertEqual(job.processed, 3)
+        self.assertEqual(names, ['tests_School_1_0.xlsx', 'tests_School_2_1.xlsx', 'tests_School_3_2.xlsx'])
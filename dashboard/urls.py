@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import test_list, profile, test_history, history_detail, test_statistics, add_students, add_balance, question_management, reset_test_status, export_by_date, export_by_school
+from .views import test_list, profile, test_history, history_detail, test_statistics, add_students, add_balance, question_management, reset_test_status, export_by_date, export_by_school, export_job, export_job_progress, export_job_download
 
 urlpatterns = [
     path('', test_statistics, name='test_statistics'),
@@ -8,4 +8,7 @@ urlpatterns = [
     path('reset-test-status/', reset_test_status, name='reset_test_status'),
     path('export-by-date/', export_by_date, name='export_by_date'),
     path('export-by-school/', export_by_school, name='export_by_school'),
+    path('exports/<uuid:job_id>/', export_job, name='export_job'),
+    path('exports/<uuid:job_id>/progress/', export_job_progress, name='export_job_progress'),
+    path('exports/<uuid:job_id>/download/', export_job_download, name='export_job_download'),
 ]
\ No newline at end of file
@@ -2,7 +2,9 @@ from django.forms import IntegerField
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from test_logic.models import Test, Result, Question, Option, Product, CompletedTest, CompletedQuestion
-from django.http import HttpResponse
+from test_logic.scoring import get_scores_for, totals
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
 from openpyxl import load_workbook
 from openpyxl.styles import Font, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
@@ -13,10 +15,18 @@ import xlsxwriter
 from io import BytesIO
 from django.db.models import Avg
 from datetime import datetime
+from django.utils.dateparse import parse_date
 from django.contrib import messages
 from decimal import Decimal
 from accounts.models import User, Region
 from .forms import AddBalanceForm, AddStudentForm, ResetTestStatusForm
+from .exports import (
+    date_shards, export_workers, job_filename, request_export, school_shards, shard_workbooks, statistics_queryset,
+    stream_zip, write_statistics_workbook,
+)
+from .models import ExportJob
+from .pagination import keyset_page
+from .rollups import filter_rollups, fold_deltas, summarize
 from django.db import models
 from django.core.cache import cache
 from django.views.decorators.cache import cache_page
@@ -105,88 +115,59 @@ def test_statistics(request):
     # Get filter parameters
     region_id = request.GET.get('region')
     school = request.GET.get('school')
-    start_date = request.GET.get('start_date')
-    end_date = request.GET.get('end_date')
-    page = request.GET.get('page', 1)
+    # Malformed dates are ignored instead of failing the page
+    try:
+        start_date = parse_date(request.GET.get('start_date') or '')
+        end_date = parse_date(request.GET.get('end_date') or '')
+    except ValueError:
+        start_date = end_date = None
     
-    # Remove cache key and cache operations
-    # Base queryset with select_related and prefetch_related
-    completed_tests = CompletedTest.objects.select_related(
-        'user', 
-        'user__region',
-        'product'
-    )
+    # Filters are carried over to the next/previous links; the cursors are not
+    filter_query = request.GET.copy()
+    for param in ('after', 'before', 'page', 'export'):
+        filter_query.pop(param, None)
     
-    # Apply filters
-    if region_id and region_id != '':
-        completed_tests = completed_tests.filter(user__region_id=region_id)
-    if school:
-        completed_tests = completed_tests.filter(user__school__icontains=school)
-    if start_date:
-        completed_tests = completed_tests.filter(completed_date__gte=start_date)
-    if end_date:
-        completed_tests = completed_tests.filter(completed_date__lte=end_date)
-    
-    # Order by completed date
-    completed_tests = completed_tests.order_by('-completed_date')
-    
-    # Handle Excel export before pagination
+    # Filtered attempts; keyset_page orders and slices them
+    completed_tests = statistics_queryset(region_id, school, start_date, end_date).select_related('product')
+    
+    # Excel exports are generated by the run_export_jobs worker
     if request.GET.get('export') == 'excel':
-        return export_to_excel(completed_tests)
+        if not can_export(request.user):
+            messages.error(request, "У вас нет прав для доступа к этой странице.")
+            return redirect('test_statistics')
+        job = request_export(request.user, region_id, school, start_date, end_date)
+        return redirect('export_job', job_id=job.id)
     
-    # Count total before pagination for pagination display
-    total_count = completed_tests.count()
+    # Totals come from the rollups instead of counting the attempts. They group attempts by the student's
+    # region and school at grading time, the list below by the current ones (see rollups)
+    fold_deltas()
+    summary, test_summary = summarize(filter_rollups(region_id, school, start_date, end_date))
     
-    # Paginate the queryset
-    paginator = Paginator(completed_tests, 50)
-    page_obj = paginator.get_page(page)
+    # Seek to the page by (completed_date, id) instead of COUNT(*) and OFFSET
+    page_obj = keyset_page(completed_tests, after=request.GET.get('after'), before=request.GET.get('before'))
     
-    # Now prefetch related data only for the current page
-    current_page_tests = page_obj.object_list.prefetch_related(
-        'completed_questions',
-        'completed_questions__question',
-        'completed_questions__selected_option',
-        'completed_questions__test'
-    )
+    # Scores are stored on each attempt; only attempts not backfilled yet are computed
+    current_page_tests = page_obj.object_list
+    scores = get_scores_for(current_page_tests)
     
     # Process the test statistics directly
     statistics = []
     for completed_test in current_page_tests:
-        # Dictionary to store test-specific statistics
-        test_stats = {}
-        correct_answers = 0
-        wrong_answers = 0
+        correct_answers, total_questions = totals(scores[completed_test.id])
+        wrong_answers = total_questions - correct_answers
         
-        # Get all completed questions for this test in one query
-        completed_questions = completed_test.completed_questions.all()
+        # Use the product title or a fallback title if needed
+        test_title = completed_test.product.title if hasattr(completed_test.product, 'title') else "Completed Test"
         
-        for question in completed_questions:
-            # Use the product title or a fallback title if needed
-            test_title = completed_test.product.title if hasattr(completed_test.product, 'title') else "Completed Test"
-            
-            # Initialize test stats if not already present
-            if test_title not in test_stats:
-                test_stats[test_title] = {
-                    'correct': 0,
-                    'incorrect': 0,
-                    'total': 0
-                }
-            
-            # Check if any selected option is correct
-            selected_options = list(question.selected_option.all())
-            has_correct = any(option.is_correct for option in selected_options)
-            
-            # Update statistics
-            if has_correct:
-                correct_answers += 1
-                test_stats[test_title]['correct'] += 1
-            else:
-                wrong_answers += 1
-                test_stats[test_title]['incorrect'] += 1
-            
-            test_stats[test_title]['total'] += 1
+        # Dictionary to store test-specific statistics
+        test_stats = {}
+        if total_questions:
+            test_stats[test_title] = {
+                'correct': correct_answers,
+                'incorrect': wrong_answers,
+                'total': total_questions
+            }
         
-        total_questions = correct_answers + wrong_answers
         score_percentage = round((correct_answers / total_questions) * 100, 2) if total_questions > 0 else 0
         
         # Convert test_stats dictionary to a list
@@ -219,7 +200,10 @@ def test_statistics(request):
 
     context = {
         'statistics': statistics,
+        'summary': summary,
+        'test_summary': test_summary,
         'page_obj': page_obj,
+        'filter_query': filter_query.urlencode(),
         'regions': regions,
         'selected_region': region_id,
         'selected_school': school,
@@ -229,137 +213,6 @@ def test_statistics(request):
 
     return render(request, 'dashboard/test_statistics.html', context)
 
-def export_to_excel(completed_tests):
-    output = BytesIO()
-    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
-    
-    # Create formats
-    header_format = workbook.add_format({
-        'bold': True,
-        'align': 'center',
-        'valign': 'vcenter',
-        'bg_color': '#f0f0f0'
-    })
-    
-    # Create worksheet with basic structure first
-    worksheet = workbook.add_worksheet('Общая статистика')
-    
-    # Define base headers
-    base_headers = [
-        'Пользователь', 'Регион', 'Школа', 'Дата завершения',
-        'Тест', 'Правильных', 'Неправильных', 'Всего вопросов', 'Результат (%)'
-    ]
-    
-    # Set column widths for better readability
-    worksheet.set_column(0, 0, 30)  # User name
-    worksheet.set_column(1, 1, 20)  # Region
-    worksheet.set_column(2, 2, 20)  # School
-    worksheet.set_column(3, 3, 20)  # Date
-    worksheet.set_column(4, 4, 30)  # Test name
-    worksheet.set_column(5, 8, 15)  # Other columns
-    
-    # Write headers
-    for col, header in enumerate(base_headers):
-        worksheet.write(0, col, header, header_format)
-    
-    # Process and write data in chunks
-    row = 1
-    
-    # Limit the number of records to process to avoid timeout
-    max_records = 10000
-    record_count = 0
-    
-    for completed_test in completed_tests.iterator():
-        try:
-            if record_count >= max_records:
-                break
-                
-            record_count += 1
-            
-            # Get user info once
-            user_name = f"{completed_test.user.first_name} {completed_test.user.last_name}"
-            region = str(completed_test.user.region)
-            school = completed_test.user.school
-            date = completed_test.completed_date.strftime('%Y-%m-%d %H:%M')
-            
-            # Get all tests for this completed test
-            test_ids = completed_test.tests.values_list('id', 'title')
-            
-            # Create a dictionary to store test statistics
-            test_stats = {}
-            for test_id, test_title in test_ids:
-                test_stats[test_id] = {
-                    'title': test_title,
-                    'correct': 0,
-                    'wrong': 0,
-                    'total': 0
-                }
-            
-            # Get completed questions with their test IDs
-            from django.db import connection
-            with connection.cursor() as cursor:
-                # Execute a raw SQL query to get the correct/incorrect counts by test
-                cursor.execute("""
-                    SELECT 
-                        cq.test_id, 
-                        COUNT(CASE WHEN o.is_correct THEN 1 END) as correct_count,
-                        COUNT(CASE WHEN NOT o.is_correct THEN 1 END) as wrong_count,
-                        COUNT(cq.id) as total_count
-                    FROM 
-                        test_logic_completedquestion cq
-                    JOIN 
-                        test_logic_completedquestion_selected_option cqso ON cq.id = cqso.completedquestion_id
-                    JOIN 
-                        test_logic_option o ON cqso.option_id = o.id
-                    WHERE 
-                        cq.completed_test_id = %s
-                    GROUP BY 
-                        cq.test_id
-                """, [str(completed_test.id)])
-                
-                results = cursor.fetchall()
-            
-            # Process the results
-            for test_id, correct_count, wrong_count, total_count in results:
-                if test_id in test_stats:
-                    test_stats[test_id]['correct'] = correct_count
-                    test_stats[test_id]['wrong'] = wrong_count
-                    test_stats[test_id]['total'] = total_count
-            
-            # Write one row per test for this user
-            for test_id, stats in test_stats.items():
-                if stats['total'] > 0:  # Only write rows for tests with questions
-                    # Calculate test-specific percentage
-                    test_percentage = round((stats['correct'] / stats['total']) * 100, 2) if stats['total'] > 0 else 0
-                    
-                    # Write data
-                    worksheet.write(row, 0, user_name)
-                    worksheet.write(row, 1, region)
-                    worksheet.write(row, 2, school)
-                    worksheet.write(row, 3, date)
-                    worksheet.write(row, 4, stats['title'])
-                    worksheet.write(row, 5, stats['correct'])
-                    worksheet.write(row, 6, stats['wrong'])
-                    worksheet.write(row, 7, stats['total'])
-                    worksheet.write(row, 8, test_percentage)
-                    
-                    row += 1
-                
-        except Exception as e:
-            # Log the error but continue processing other records
-            print(f"Error processing completed test {completed_test.id}: {str(e)}")
-            continue
-    
-    workbook.close()
-    output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=статистика_тестов.xlsx'
-    return response
-
 @login_required
 def add_balance(request):
     if not (request.user.is_staff or request.user.is_superuser or request.user.is_principal):
@@ -710,66 +563,30 @@ def export_by_date(request):
         return redirect('test_statistics')
     
     try:
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
+        try:
+            start_date = parse_date(request.GET.get('start_date') or '')
+            end_date = parse_date(request.GET.get('end_date') or '')
+        except ValueError:
+            start_date = end_date = None
         
         if not start_date or not end_date:
             messages.error(request, "Необходимо указать начальную и конечную даты.")
             return redirect('test_statistics')
         
-        # Get date range information first to avoid memory issues
-        from django.db.models.functions import TruncDate
-        from django.db.models import Count
-        
-        # Get counts by date to determine which dates have data
-        date_counts = CompletedTest.objects.filter(
-            completed_date__gte=start_date,
-            completed_date__lte=end_date
-        ).annotate(
-            date_only=TruncDate('completed_date')
-        ).values('date_only').annotate(
-            count=Count('id')
-        ).order_by('date_only')
+        # One workbook per date that has data
+        shards = date_shards(start_date, end_date)
         
         # If no tests, show error
-        if not date_counts:
+        if not shards:
             messages.error(request, "Нет данных за указанный период.")
             return redirect('test_statistics')
         
-        # Create a ZIP file to hold multiple Excel files
-        import zipfile
-        import io
-        from datetime import datetime
-        
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as zip_file:
-            for i, date_group in enumerate(date_counts):
-                date_str = date_group['date_only'].strftime('%Y-%m-%d')
-                
-                # Get tests for this date in smaller batches
-                date_tests = CompletedTest.objects.select_related(
-                    'user', 
-                    'user__region',
-                    'product'
-                ).filter(
-                    completed_date__date=date_group['date_only']
-                ).order_by('-completed_date')
-                
-                # Create Excel for this date
-                excel_buffer = io.BytesIO()
-                create_excel_file(date_tests, excel_buffer)
-                
-                # Add Excel file to ZIP with unique filename
-                filename = f"tests_{date_str}_{i}.xlsx"
-                zip_file.writestr(filename, excel_buffer.getvalue())
+        # A worker pool builds the workbooks in the run_export_jobs worker, never in the request
+        if export_workers() > 1:
+            job = request_export(request.user, start_date=start_date, end_date=end_date, kind=ExportJob.Kind.BY_DATE)
+            return redirect('export_job', job_id=job.id)
         
-        # Prepare response
-        zip_buffer.seek(0)
-        response = HttpResponse(
-            zip_buffer.read(),
-            content_type='application/zip'
-        )
+        response = StreamingHttpResponse(stream_zip(shard_workbooks(shards)), content_type='application/zip')
         response['Content-Disposition'] = f'attachment; filename=tests_by_date_{start_date}_to_{end_date}.zip'
         
         return response
@@ -788,65 +605,20 @@ def export_by_school(request):
         return redirect('test_statistics')
     
     try:
-        # Get all schools with completed tests
-        from django.db.models import Count
-        
-        schools = CompletedTest.objects.values(
-            'user__school'
-        ).annotate(
-            count=Count('id')
-        ).filter(
-            count__gt=0
-        ).order_by('user__school')
+        # One workbook per school with completed tests
+        shards = school_shards()
         
         # If no schools, show error
-        if not schools:
+        if not shards:
             messages.error(request, "Нет данных для экспорта.")
             return redirect('test_statistics')
         
-        # Create a ZIP file to hold multiple Excel files
-        import zipfile
-        import io
-        import re
+        # A worker pool builds the workbooks in the run_export_jobs worker, never in the request
+        if export_workers() > 1:
+            job = request_export(request.user, kind=ExportJob.Kind.BY_SCHOOL)
+            return redirect('export_job', job_id=job.id)
         
-        zip_buffer = io.BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'a', zipfile.ZIP_DEFLATED, False) as zip_file:
-            # Use a counter to ensure filenames are unique
-            for i, school_group in enumerate(schools):
-                school_name = school_group['user__school'] or 'Unknown_School'
-                
-                # Sanitize filename more aggressively
-                safe_school_name = re.sub(r'[^\w]', '_', school_name)
-                # Limit filename length
-                if len(safe_school_name) > 30:
-                    safe_school_name = safe_school_name[:30]
-                
-                # Get tests for this school
-                school_tests = CompletedTest.objects.select_related(
-                    'user', 
-                    'user__region',
-                    'product'
-                ).filter(
-                    user__school=school_name
-                ).order_by('-completed_date')
-                
-                # Only process if there are tests
-                if school_tests.exists():
-                    # Create Excel for this school
-                    excel_buffer = io.BytesIO()
-                    create_excel_file(school_tests, excel_buffer)
-                    
-                    # Add Excel file to ZIP with unique index
-                    filename = f"tests_{safe_school_name}_{i}.xlsx"
-                    zip_file.writestr(filename, excel_buffer.getvalue())
-        
-        # Prepare response
-        zip_buffer.seek(0)
-        response = HttpResponse(
-            zip_buffer.read(),
-            content_type='application/zip'
-        )
+        response = StreamingHttpResponse(stream_zip(shard_workbooks(shards)), content_type='application/zip')
         response['Content-Disposition'] = 'attachment; filename=tests_by_school.zip'
         
         return response
@@ -859,141 +631,47 @@ def export_by_school(request):
         return redirect('test_statistics')
 
 def create_excel_file(completed_tests, output_buffer):
-    """Helper function to create Excel files with the same format as export_to_excel"""
-    try:
-        workbook = xlsxwriter.Workbook(output_buffer, {'constant_memory': True})
-        
-        # Create formats
-        header_format = workbook.add_format({
-            'bold': True,
-            'align': 'center',
-            'valign': 'vcenter',
-            'bg_color': '#f0f0f0'
-        })
-        
-        # Create worksheet with basic structure first
-        worksheet = workbook.add_worksheet('Общая статистика')
-        
-        # Define base headers
-        base_headers = [
-            'Пользователь', 'Регион', 'Школа', 'Дата завершения',
-            'Тест', 'Правильных', 'Неправильных', 'Всего вопросов', 'Результат (%)'
-        ]
-        
-        # Set column widths for better readability
-        worksheet.set_column(0, 0, 30)  # User name
-        worksheet.set_column(1, 1, 20)  # Region
-        worksheet.set_column(2, 2, 20)  # School
-        worksheet.set_column(3, 3, 20)  # Date
-        worksheet.set_column(4, 4, 30)  # Test name
-        worksheet.set_column(5, 8, 15)  # Other columns
-        
-        # Write headers
-        for col, header in enumerate(base_headers):
-            worksheet.write(0, col, header, header_format)
-        
-        # Process and write data
-        row = 1
-        
-        # Limit the number of records to process to avoid timeout
-        max_records = 5000  # Reduced from 10000
-        record_count = 0
-        
-        # Batch processing for large datasets
-        batch_size = 100
-        completed_tests_ids = completed_tests.values_list('id', flat=True)[:max_records]
-        
-        # Process in batches
-        for i in range(0, len(completed_tests_ids), batch_size):
-            batch_ids = completed_tests_ids[i:i+batch_size]
-            batch = CompletedTest.objects.select_related('user', 'user__region', 'product').filter(id__in=batch_ids)
-            
-            for completed_test in batch:
-                try:
-                    record_count += 1
-                    
-                    # Get user info once
-                    user_name = f"{completed_test.user.first_name} {completed_test.user.last_name}"
-                    region = str(completed_test.user.region) if completed_test.user.region else "Не указан"
-                    school = completed_test.user.school or "Не указана"
-                    date = completed_test.completed_date.strftime('%Y-%m-%d %H:%M')
-                    
-                    # Get all tests for this completed test
-                    test_ids = completed_test.tests.values_list('id', 'title')
-                    
-                    # Skip if no tests
-                    if not test_ids:
-                        continue
-                    
-                    # Create a dictionary to store test statistics
-                    test_stats = {}
-                    for test_id, test_title in test_ids:
-                        test_stats[test_id] = {
-                            'title': test_title,
-                            'correct': 0,
-                            'wrong': 0,
-                            'total': 0
-                        }
-                    
-                    # More efficient query to get statistics
-                    from django.db.models import Sum, Case, When, IntegerField, Count, Q
-                    
-                    # Get statistics with a more efficient query
-                    completed_questions = CompletedQuestion.objects.filter(
-                        completed_test_id=completed_test.id
-                    ).values(
-                        'test_id'
-                    ).annotate(
-                        total=Count('id'),
-                        correct=Sum(
-                            Case(
-                                When(
-                                    Q(selected_option__is_correct=True) & ~Q(selected_option__is_correct=False),
-                                    then=1
-                                ),
-                                default=0,
-                                output_field=IntegerField()
-                            )
-                        )
-                    )
-                    
-                    # Process the results
-                    for question_stat in completed_questions:
-                        test_id = question_stat['test_id']
-                        if test_id in test_stats:
-                            test_stats[test_id]['correct'] = question_stat['correct']
-                            test_stats[test_id]['total'] = question_stat['total']
-                            test_stats[test_id]['wrong'] = question_stat['total'] - question_stat['correct']
-                    
-                    # Write one row per test for this user
-                    for test_id, stats in test_stats.items():
-                        if stats['total'] > 0:  # Only write rows for tests with questions
-                            # Calculate test-specific percentage
-                            test_percentage = round((stats['correct'] / stats['total']) * 100, 2) if stats['total'] > 0 else 0
-                            
-                            # Write data
-                            worksheet.write(row, 0, user_name)
-                            worksheet.write(row, 1, region)
-                            worksheet.write(row, 2, school)
-                            worksheet.write(row, 3, date)
-                            worksheet.write(row, 4, stats['title'])
-                            worksheet.write(row, 5, stats['correct'])
-                            worksheet.write(row, 6, stats['wrong'])
-                            worksheet.write(row, 7, stats['total'])
-                            worksheet.write(row, 8, test_percentage)
-                            
-                            row += 1
-                    
-                except Exception as e:
-                    # Log the error but continue processing other records
-                    print(f"Error processing completed test {completed_test.id}: {str(e)}")
-                    continue
-        
-        workbook.close()
-    except Exception as e:
-        import traceback
-        print(f"Error in create_excel_file: {str(e)}")
-        print(traceback.format_exc())
-        # Make sure workbook is closed even on error
-        if 'workbook' in locals():
-            workbook.close()
\ No newline at end of file
+    """Helper function to create Excel files with the same format as the statistics export"""
+    write_statistics_workbook(completed_tests, output_buffer)
+
+def can_export(user):
+    return user.is_staff or user.is_superuser or user.is_principal
+
+def get_export_job(user, job_id):
+    """The job, if `user` may see it: staff see every job, others only their own."""
+    jobs = ExportJob.objects.all()
+    if not (user.is_staff or user.is_superuser):
+        jobs = jobs.filter(requested_by=user)
+    return get_object_or_404(jobs, id=job_id)
+
+@login_required
+def export_job(request, job_id):
+    if not can_export(request.user):
+        messages.error(request, "У вас нет прав для доступа к этой странице.")
+        return redirect('test_statistics')
+    job = get_export_job(request.user, job_id)
+    return render(request, 'dashboard/export_job.html', {'job': job})
+
+@login_required
+def export_job_progress(request, job_id):
+    if not can_export(request.user):
+        return JsonResponse({'error': "У вас нет прав для доступа к этой странице."}, status=403)
+    job = get_export_job(request.user, job_id)
+    return JsonResponse({
+        'id': str(job.id),
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'error': job.error,
+        'download_url': reverse('export_job_download', args=[job.id]) if job.status == ExportJob.Status.DONE and job.file else None,
+    })
+
+@login_required
+def export_job_download(request, job_id):
+    if not can_export(request.user):
+        messages.error(request, "У вас нет прав для доступа к этой странице.")
+        return redirect('test_statistics')
+    job = get_export_job(request.user, job_id)
+    if job.status != ExportJob.Status.DONE or not job.file:
+        raise Http404("Файл экспорта не готов")
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job_filename(job))
@@ -0,0 +1,141 @@
+"""
+Incremental exports of new attempts.
+
+An export profile remembers the (completed_date, id) of the last attempt it
+wrote in an ExportWatermark. Each run of export_new_attempts reads only the
+attempts after that key, in keyset batches, and writes them as one new
+gzip-compressed CSV or JSON lines shard, <profile>-<number>.<format>.gz, with
+one row per attempt and test. Shards are never rewritten, so a day's run costs
+time in proportion to the day's attempts.
+
+Attempts become visible out of order: a synchronous submission commits a
+little after its completed_date, and an asynchronous one gets the time it was
+submitted, which can be well before the worker grades it. Runs therefore
+stop `lag` seconds before now and before the oldest submission still waiting
+in the intake queue; whatever is newer is left for the next run.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import timedelta
+
+from django.db.models import Min, Q
+from django.utils.timezone import now
+
+from test_logic.models import StagedSubmission
+
+from .exports import filter_arguments, score_rows, statistics_queryset
+from .models import ExportWatermark
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = [CSV, JSONL]
+
+BATCH_SIZE = 1000
+DEFAULT_LAG = 60
+
+COLUMNS = [
+    'completed_test_id', 'user_id', 'first_name', 'last_name', 'region', 'school', 'completed_date',
+    'product_id', 'test_id', 'test', 'correct', 'total',
+]
+
+
+def shard_path(directory, profile, number, export_format):
+    return os.path.join(directory, f'{profile}-{number:06d}.{export_format}.gz')
+
+
+def export_until(lag=DEFAULT_LAG):
+    """The completed_date up to which every attempt has been committed."""
+    until = now() - timedelta(seconds=lag)
+    waiting = StagedSubmission.objects.filter(
+        status__in=[StagedSubmission.Status.PENDING, StagedSubmission.Status.PROCESSING]
+    ).aggregate(oldest=Min('submitted_at'))['oldest']
+    if waiting is not None and waiting < until:
+        until = waiting
+    return until
+
+
+def attempts_after(watermark, until):
+    completed_tests = statistics_queryset(*filter_arguments(watermark.filters)).filter(
+        completed_date__lt=until
+    ).defer('answers', 'result_snapshot')
+    if watermark.completed_date is not None:
+        completed_tests = completed_tests.filter(
+            Q(completed_date__gt=watermark.completed_date)
+            | Q(completed_date=watermark.completed_date, id__gt=watermark.completed_test_id)
+        )
+    return completed_tests.order_by('completed_date', 'id')
+
+
+def attempt_rows(batch, titles):
+    """Yield a dict of COLUMNS per attempt and test of the batch."""
+    rows = score_rows(batch, titles)
+    for completed_test in batch:
+        user = completed_test.user
+        for test_id, title, correct, total in rows[completed_test.id]:
+            yield {
+                'completed_test_id': str(completed_test.id),
+                'user_id': str(user.id),
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'region': user.region.name if user.region else '',
+                'school': user.school or '',
+                'completed_date': completed_test.completed_date.isoformat(),
+                'product_id': str(completed_test.product_id),
+                'test_id': test_id,
+                'test': title,
+                'correct': correct,
+                'total': total,
+            }
+
+
+def export_new_attempts(watermark, directory, export_format=CSV, lag=DEFAULT_LAG, batch_size=BATCH_SIZE):
+    """
+    Write the attempts added since the watermark as the profile's next shard
+    and advance the watermark. Returns (path, attempts), or (None, 0) when
+    there was nothing new.
+    """
+    completed_tests = attempts_after(watermark, export_until(lag))
+    number = watermark.shards + 1
+    path = shard_path(directory, watermark.profile, number, export_format)
+    # Written under a temporary name so a crashed run never leaves half a shard behind
+    partial_path = f'{path}.partial'
+
+    titles = {}
+    attempts = 0
+    last = None
+    with gzip.open(partial_path, 'wb') as output:
+        text = io.TextIOWrapper(output, encoding='utf-8', newline='')
+        writer = csv.DictWriter(text, COLUMNS) if export_format == CSV else None
+        if writer is not None:
+            writer.writeheader()
+
+        batch = list(completed_tests[:batch_size])
+        while batch:
+            for row in attempt_rows(batch, titles):
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    text.write(json.dumps(row, ensure_ascii=False) + '\n')
+            attempts += len(batch)
+            last = batch[-1]
+            batch = list(completed_tests.filter(
+                Q(completed_date__gt=last.completed_date) | Q(completed_date=last.completed_date, id__gt=last.id)
+            )[:batch_size])
+        text.flush()
+        text.detach()
+
+    if last is None:
+        os.remove(partial_path)
+        return None, 0
+
+    # A shard is final once the watermark counts it; if the run dies before that, the next run writes it again
+    os.replace(partial_path, path)
+    watermark.completed_date = last.completed_date
+    watermark.completed_test_id = last.id
+    watermark.shards = number
+    watermark.exported += attempts
+    watermark.save(update_fields=['completed_date', 'completed_test_id', 'shards', 'exported', 'updated_at'])
+    return path, attempts
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Test, Question, Option, Result, BookSuggestion, Product, CompletedTest, CompletedQuestion, Source
+from .models import Test, Question, Option, Result, BookSuggestion, Product, CompletedTest, CompletedQuestion, Source, ExamBlueprint, ExamVariant, ExamSession, StagedSubmission, IdempotencyRecord
 from accounts.models import User
 from django.contrib import messages
 
@@ -80,10 +80,39 @@ class SourceAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     
 class CompletedTestAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'product', 'completed_date', 'start_test_time', 'time_spent')
+    list_display = ('id', 'user', 'product', 'completed_date', 'start_test_time', 'time_spent', 'correct_count', 'total_count')
     search_fields = ('user__username', 'product__title')
     list_filter = ('completed_date', 'start_test_time')
 
+class ExamBlueprintAdmin(admin.ModelAdmin):
+    list_display = ('id', 'title', 'product', 'test', 'is_active', 'date_created')
+    search_fields = ('title', 'product__title', 'test__title')
+    list_filter = ('is_active', 'product')
+
+class ExamVariantAdmin(admin.ModelAdmin):
+    list_display = ('id', 'test', 'product', 'generation', 'number', 'is_active', 'date_created')
+    search_fields = ('test__title', 'product__title')
+    list_filter = ('is_active', 'product')
+
+class ExamSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'product', 'status', 'started_at', 'completed_test')
+    search_fields = ('user__username', 'product__title')
+    list_filter = ('status', 'started_at')
+    raw_id_fields = ('user', 'completed_test')
+
+class StagedSubmissionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'product', 'status', 'attempts', 'submitted_at', 'graded_at')
+    search_fields = ('user__username', 'completed_test_id')
+    list_filter = ('status', 'submitted_at')
+    raw_id_fields = ('user', 'session')
+
+class IdempotencyRecordAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'endpoint', 'key', 'status', 'response_status', 'created_at')
+    search_fields = ('user__username', 'key')
+    list_filter = ('endpoint', 'status', 'created_at')
+    raw_id_fields = ('user',)
+    exclude = ('response_body',)
+
 admin.site.register(Product)
 admin.site.register(Test, TestAdmin)
 admin.site.register(Question, QuestionAdmin)
@@ -91,4 +120,9 @@ admin.site.register(Result, ResultAdmin)
 admin.site.register(BookSuggestion, BookSuggestionAdmin)
 admin.site.register(CompletedTest, CompletedTestAdmin)
 admin.site.register(CompletedQuestion)
-admin.site.register(Source, SourceAdmin)
\ No newline at end of file
+admin.site.register(Source, SourceAdmin)
+admin.site.register(ExamBlueprint, ExamBlueprintAdmin)
+admin.site.register(ExamVariant, ExamVariantAdmin)
+admin.site.register(ExamSession, ExamSessionAdmin)
+admin.site.register(StagedSubmission, StagedSubmissionAdmin)
+admin.site.register(IdempotencyRecord, IdempotencyRecordAdmin)
\ No newline at end of file
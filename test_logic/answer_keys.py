@@ -0,0 +1,73 @@
+"""
+In-process answer keys for grading.
+
+Grading only needs to know which options of a question are correct, so each
+product's key is loaded with one values_list scan over its correct options and
+kept as {question_id: frozenset(option_ids)}. Grades are stored for good, so a
+key must never be stale: every option change bumps Product.answer_key_version
+in the database (see signals.py), and get_answer_key compares the cached key's
+version with it on each call, one primary key lookup, before using it.
+"""
+import threading
+from collections import defaultdict
+
+from .models import Product, Option
+
+NO_CORRECT_OPTIONS = frozenset()
+
+_keys = {}
+_lock = threading.Lock()
+
+
+class AnswerKey:
+    """Correct option IDs of every question of one product."""
+
+    def __init__(self, product_id, version, correct_options):
+        self.product_id = product_id
+        self.version = version
+        self.correct_options = correct_options
+
+    def __len__(self):
+        return len(self.correct_options)
+
+    def is_correct(self, question_id, option_ids):
+        # A question counts as correct when any selected option is correct
+        correct = self.correct_options.get(question_id, NO_CORRECT_OPTIONS)
+        return any(option_id in correct for option_id in option_ids)
+
+
+def answer_key_version(product_id):
+    return Product.objects.filter(id=product_id).values_list('answer_key_version', flat=True).first()
+
+
+def build_answer_key(product_id, version):
+    # `version` is read before the options, so a change committed in between bumps it past the key
+    correct_options = defaultdict(set)
+    rows = Option.objects.filter(
+        is_correct=True, question__test__product_id=product_id
+    ).values_list('question_id', 'id')
+    for question_id, option_id in rows:
+        correct_options[question_id].add(option_id)
+    return AnswerKey(product_id, version, {
+        question_id: frozenset(option_ids) for question_id, option_ids in correct_options.items()
+    })
+
+
+def get_answer_key(product_id):
+    version = answer_key_version(product_id)
+    key = _keys.get(product_id)
+    if key is not None and key.version == version:
+        return key
+
+    with _lock:
+        # Another thread may have rebuilt the key while we were waiting
+        key = _keys.get(product_id)
+        if key is None or key.version != version:
+            key = build_answer_key(product_id, version)
+            _keys[product_id] = key
+    return key
+
+
+def clear_answer_keys():
+    with _lock:
+        _keys.clear()
@@ -0,0 +1,203 @@
+"""
+Storage modes for the answers of a completed attempt.
+
+In "rows" mode (the default) every answered question is a CompletedQuestion
+row plus one selected_option through row per chosen option. In "packed" mode
+the whole attempt is kept in CompletedTest.answers as
+{test_id: {question_id: {"id": answer_id, "options": [option_id, ...],
+"correct": is_correct}}} (hex IDs), so an attempt costs one row instead of
+~80. The answer ID and the grade are what the CompletedQuestion row would
+hold, so packing and unpacking an attempt changes neither.
+COMPLETED_ANSWERS_STORAGE picks the mode for new attempts; readers go through
+get_completed_questions, which understands both.
+
+pack_answers and unpack_answers convert answers to and from the plain
+{test_id: {question_id: [option_id, ...]}} shape of the ExamSession manifest,
+which autosaved answers use.
+"""
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Question, CompletedTest, CompletedQuestion
+from .partitioning import month_range
+
+ROWS = 'rows'
+PACKED = 'packed'
+
+
+def storage_mode():
+    return getattr(settings, 'COMPLETED_ANSWERS_STORAGE', ROWS)
+
+
+def pack_answers(answers):
+    """Turn [(test_id, [(question_id, [option_id])])] into the manifest-shaped map."""
+    packed = {}
+    for test_id, questions in answers:
+        test_answers = packed.setdefault(test_id.hex, {})
+        for question_id, option_ids in questions:
+            test_answers[question_id.hex] = sorted({option_id.hex for option_id in option_ids})
+    return packed
+
+
+def unpack_answers(packed):
+    return [
+        (uuid.UUID(test_id), [
+            (uuid.UUID(question_id), [uuid.UUID(option_id) for option_id in option_ids])
+            for question_id, option_ids in questions.items()
+        ])
+        for test_id, questions in packed.items()
+    ]
+
+
+def packed_answer(answer_id, option_ids, is_correct):
+    """One question of CompletedTest.answers."""
+    return {'id': answer_id.hex, 'options': sorted({option_id.hex for option_id in option_ids}), 'correct': is_correct}
+
+
+def iter_packed_answers(packed):
+    """Yield (test_id, question_id, answer_id, [option_id], is_correct) from CompletedTest.answers."""
+    for test_id, questions in packed.items():
+        for question_id, answer in questions.items():
+            yield (
+                uuid.UUID(test_id),
+                uuid.UUID(question_id),
+                uuid.UUID(answer['id']),
+                [uuid.UUID(option_id) for option_id in answer['options']],
+                answer['correct'],
+            )
+
+
+class PackedQuestion:
+    """Read-only stand-in for a CompletedQuestion of a packed attempt."""
+
+    def __init__(self, answer_id, completed_test, test_id, question, selected_options, is_correct):
+        # The ID the answer's CompletedQuestion row had or will have
+        self.id = answer_id
+        self.completed_test = completed_test
+        self.test_id = test_id
+        self.question = question
+        self.question_id = question.id
+        # A plain list, which serializers iterate like a related manager
+        self.selected_option = selected_options
+        self.is_correct = is_correct
+
+
+def load_packed_questions(completed_test):
+    answers = list(iter_packed_answers(completed_test.answers))
+    questions = Question.objects.prefetch_related('options').in_bulk([answer[1] for answer in answers])
+
+    by_test = defaultdict(list)
+    for test_id, question_id, answer_id, option_ids, is_correct in answers:
+        question = questions.get(question_id)
+        if question is None:
+            # The question was deleted after the attempt
+            continue
+        selected = set(option_ids)
+        by_test[test_id].append(PackedQuestion(
+            answer_id,
+            completed_test,
+            test_id,
+            question,
+            [option for option in question.options.all() if option.id in selected],
+            # As graded when the attempt was stored
+            is_correct,
+        ))
+    return by_test
+
+
+def load_question_rows(completed_test):
+    by_test = defaultdict(list)
+    question_rows = CompletedQuestion.objects.filter(completed_test=completed_test).select_related(
+        'question'
+    ).prefetch_related('selected_option', 'question__options')
+    # The month lets PostgreSQL read a single partition
+    start, end = month_range(completed_test.completed_date)
+    rows = list(question_rows.filter(completed_date__gte=start, completed_date__lt=end))
+    if not rows:
+        # Rows stored before backfill_completed_dates ran have no date yet
+        rows = question_rows.filter(completed_date__isnull=True)
+    for completed_question in rows:
+        by_test[completed_question.test_id].append(completed_question)
+    return by_test
+
+
+def get_completed_questions(completed_test, test_id=None):
+    """
+    Return the answered questions of an attempt, in either storage mode.
+
+    Items are CompletedQuestion rows or PackedQuestions; both have question,
+    test_id, is_correct and an iterable selected_option. Loaded once per
+    instance, so serializers asking test by test do not query again.
+    """
+    if not hasattr(completed_test, '_completed_questions'):
+        if completed_test.answers is not None:
+            completed_test._completed_questions = load_packed_questions(completed_test)
+        else:
+            completed_test._completed_questions = load_question_rows(completed_test)
+
+    if test_id is not None:
+        return completed_test._completed_questions.get(test_id, [])
+    return [question for questions in completed_test._completed_questions.values() for question in questions]
+
+
+def pack_completed_tests(completed_test_ids):
+    """Move the answer rows of the given attempts into CompletedTest.answers. Returns the number packed."""
+    packed = defaultdict(lambda: defaultdict(dict))
+    rows = CompletedQuestion.objects.filter(
+        completed_test_id__in=completed_test_ids
+    ).values_list('id', 'completed_test_id', 'test_id', 'question_id', 'is_correct', 'selected_option')
+    for completed_question_id, completed_test_id, test_id, question_id, is_correct, option_id in rows:
+        if question_id is None:
+            continue
+        answer = packed[completed_test_id][test_id.hex].setdefault(
+            question_id.hex, packed_answer(completed_question_id, [], is_correct)
+        )
+        if option_id is not None:
+            answer['options'].append(option_id.hex)
+
+    completed_tests = [
+        CompletedTest(id=completed_test_id, answers=packed.get(completed_test_id, {}))
+        for completed_test_id in completed_test_ids
+    ]
+    with transaction.atomic():
+        CompletedTest.objects.bulk_update(completed_tests, ['answers'])
+        # Deleting the rows also removes their selected_option through rows
+        CompletedQuestion.objects.filter(completed_test_id__in=completed_test_ids).delete()
+    return len(completed_tests)
+
+
+def unpack_completed_tests(completed_tests):
+    """Write packed attempts back as CompletedQuestion rows. Returns the number unpacked."""
+    unpacked = [(completed_test, list(iter_packed_answers(completed_test.answers))) for completed_test in completed_tests]
+    # Questions deleted since the attempt would have taken their rows with them
+    existing = set(Question.objects.filter(id__in={
+        answer[1] for _, answers in unpacked for answer in answers
+    }).values_list('id', flat=True))
+
+    completed_questions = []
+    option_links = []
+    for completed_test, answers in unpacked:
+        for test_id, question_id, answer_id, option_ids, is_correct in answers:
+            if question_id not in existing:
+                continue
+            completed_questions.append(CompletedQuestion(
+                id=answer_id,
+                completed_test_id=completed_test.id,
+                test_id=test_id,
+                question_id=question_id,
+                is_correct=is_correct,
+                completed_date=completed_test.completed_date,
+            ))
+            option_links.extend(
+                CompletedQuestion.selected_option.through(completedquestion_id=answer_id, option_id=option_id)
+                for option_id in option_ids
+            )
+
+    with transaction.atomic():
+        CompletedQuestion.objects.bulk_create(completed_questions, batch_size=1000)
+        CompletedQuestion.selected_option.through.objects.bulk_create(option_links, batch_size=1000)
+        CompletedTest.objects.filter(id__in=[completed_test.id for completed_test in completed_tests]).update(answers=None)
+    return len(completed_tests)
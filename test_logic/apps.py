@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TestLogicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'test_logic'
+
+    def ready(self):
+        from . import signals  # noqa: F401
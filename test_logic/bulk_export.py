@@ -0,0 +1,93 @@
+"""
+Bulk export of whole tables as gzip-compressed CSV or JSON lines.
+
+On PostgreSQL each table goes through `COPY ... TO STDOUT`, which the server
+produces as one sequential stream; psycopg2 hands it over in fixed-size
+chunks that are written straight into a GzipFile, so memory stays constant
+and multi-GB tables export at the speed of the disk. JSON lines are built by
+the server with row_to_json. Other databases fall back to reading rows with
+fetchmany and writing them with the csv and json modules.
+"""
+import csv
+import gzip
+import json
+import os
+
+from django.db import connection as default_connection
+
+from .models import CompletedTest, CompletedQuestion
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FORMATS = [CSV, JSONL]
+
+# Bytes read from the COPY stream at a time
+COPY_CHUNK_SIZE = 1024 * 1024
+FETCH_SIZE = 2000
+
+# The completion tables, including the selected options of each answer
+COMPLETION_TABLES = [
+    CompletedTest._meta.db_table,
+    CompletedQuestion._meta.db_table,
+    CompletedQuestion.selected_option.through._meta.db_table,
+]
+
+
+def export_path(directory, table, export_format):
+    return os.path.join(directory, f'{table}.{export_format}.gz')
+
+
+def copy_sql(table, export_format, connection):
+    table = connection.ops.quote_name(table)
+    # COPY of a query rather than the table, which PostgreSQL refuses for partitioned tables
+    if export_format == CSV:
+        return f'COPY (SELECT * FROM {table}) TO STDOUT WITH (FORMAT csv, HEADER)'
+    # CSV with quote and delimiter characters JSON never contains unescaped, so the lines come out as is
+    return f"COPY (SELECT row_to_json(t) FROM {table} t) TO STDOUT WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+
+
+def copy_table(table, output, export_format=CSV, connection=default_connection):
+    """Write `table` to the binary file object `output` with COPY."""
+    with connection.cursor() as cursor:
+        cursor.copy_expert(copy_sql(table, export_format, connection), output, COPY_CHUNK_SIZE)
+
+
+def fetch_table(table, output, export_format=CSV, connection=default_connection):
+    """Write `table` to the binary file object `output` row by row, for databases without COPY."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT * FROM {connection.ops.quote_name(table)}')
+        columns = [column[0] for column in cursor.description]
+        writer = None
+        if export_format == CSV:
+            writer = csv.writer(_TextWriter(output))
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                if writer is not None:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(dict(zip(columns, row)), default=str).encode() + b'\n')
+
+
+class _TextWriter:
+    """Encode what csv.writer writes into a binary file object."""
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, value):
+        return self.output.write(value.encode())
+
+
+def export_table(table, directory, export_format=CSV, compresslevel=6, connection=default_connection):
+    """Export `table` to `directory` as <table>.<format>.gz. Returns the path and its size in bytes."""
+    path = export_path(directory, table, export_format)
+    with gzip.open(path, 'wb', compresslevel=compresslevel) as output:
+        if connection.vendor == 'postgresql':
+            copy_table(table, output, export_format, connection)
+        else:
+            fetch_table(table, output, export_format, connection)
+    return path, os.path.getsize(path)
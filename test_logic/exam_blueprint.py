@@ -0,0 +1,209 @@
+"""
+Blueprint-driven exam assembly.
+
+A blueprint is an ordered list of slots. Each slot asks for `count` questions
+matching optional task_type/level/theme filters; `source_group` asks for the
+whole slot to come from one Source text. Slots are filled from a QuestionPool
+(see question_pool.py) in one pass over its task_type buckets, so assembling
+an exam never touches the database.
+"""
+import random
+from bisect import bisect_right
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import ExamBlueprint
+from .question_pool import DEFAULT_POOL_TTL
+
+# The 40-question ENT layout: 25 general questions, 5 reading questions on one
+# source text, then 5 questions of task_type 8 and 5 of task_type 6.
+ENT_SLOTS = [
+    {'count': 25, 'exclude_task_types': [10, 8, 6]},
+    {'count': 5, 'task_types': [10], 'source_group': 5},
+    {'count': 5, 'task_types': [8]},
+    {'count': 5, 'task_types': [6]},
+]
+
+_blueprints = {}
+_lock = threading.Lock()
+
+
+class BlueprintSlot:
+
+    def __init__(self, count, task_types=None, exclude_task_types=None, levels=None, themes=None,
+                 source_group=0, fallback=True):
+        self.count = int(count)
+        self.task_types = set(task_types) if task_types else None
+        self.exclude_task_types = set(exclude_task_types or [])
+        self.levels = set(levels) if levels else None
+        self.themes = set(themes) if themes else None
+        self.source_group = int(source_group or 0)
+        # Fill the slot with random leftover questions when the bank runs short
+        self.fallback = fallback
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def matches(self, entry):
+        if self.task_types is not None and entry.task_type not in self.task_types:
+            return False
+        if entry.task_type in self.exclude_task_types:
+            return False
+        if self.levels is not None and entry.level not in self.levels:
+            return False
+        if self.themes is not None and entry.theme not in self.themes:
+            return False
+        return True
+
+
+def default_slots(test):
+    if test.number_of_questions == 40:
+        return ENT_SLOTS
+    return [{'count': test.number_of_questions or 0}]
+
+
+def load_blueprint_slots(tests):
+    """Return {test_id: [BlueprintSlot]} for `tests` using a single query."""
+    blueprints = ExamBlueprint.objects.filter(is_active=True).filter(
+        Q(test__in=tests) | Q(test__isnull=True, product_id__in={test.product_id for test in tests})
+    ).order_by('date_created')
+    by_test = {}
+    by_product = {}
+    for blueprint in blueprints:
+        if blueprint.test_id:
+            by_test.setdefault(blueprint.test_id, blueprint)
+        else:
+            by_product.setdefault(blueprint.product_id, blueprint)
+
+    slots = {}
+    for test in tests:
+        # A blueprint on the test itself wins over one on its product
+        blueprint = by_test.get(test.id) or by_product.get(test.product_id)
+        test_slots = blueprint.slots if blueprint else default_slots(test)
+        slots[test.id] = [BlueprintSlot.from_dict(slot) for slot in test_slots]
+    return slots
+
+
+def get_blueprints(tests):
+    ttl = getattr(settings, 'QUESTION_POOL_TTL', DEFAULT_POOL_TTL)
+    now = time.monotonic()
+    slots = {}
+    missing = []
+    for test in tests:
+        cached = _blueprints.get(test.id)
+        if cached is not None and now - cached[0] <= ttl:
+            slots[test.id] = cached[1]
+        else:
+            missing.append(test)
+
+    if missing:
+        loaded = load_blueprint_slots(missing)
+        with _lock:
+            _blueprints.update((test_id, (now, test_slots)) for test_id, test_slots in loaded.items())
+        slots.update(loaded)
+    return slots
+
+
+def get_blueprint_slots(test):
+    return get_blueprints([test])[test.id]
+
+
+def clear_blueprint_cache():
+    with _lock:
+        _blueprints.clear()
+
+
+def sample_chunks(chunks, count, used, rng):
+    """Sample up to `count` IDs from a list of entry lists without copying them."""
+    offsets = []
+    total = 0
+    for chunk in chunks:
+        offsets.append(total)
+        total += len(chunk)
+
+    # Draw a few extra positions so questions already used elsewhere can be skipped
+    positions = rng.sample(range(total), min(total, count + len(used)))
+    ids = []
+    for position in positions:
+        chunk_index = bisect_right(offsets, position) - 1
+        entry = chunks[chunk_index][position - offsets[chunk_index]]
+        if entry.id not in used:
+            ids.append(entry.id)
+            if len(ids) == count:
+                break
+    return ids
+
+
+def assemble_exam(pool, slots, rng=random):
+    """Return an ordered list of question IDs filling `slots` from `pool`."""
+    picked = [[] for _ in slots]
+    used = set()
+
+    # Source-group slots take one whole group of questions sharing a source text
+    for index, slot in enumerate(slots):
+        if not slot.source_group:
+            continue
+        groups = [
+            entries
+            for task_type, by_source in pool.source_groups.items()
+            if slot.task_types is None or task_type in slot.task_types
+            for entries in by_source.values()
+        ]
+        groups = [
+            [entry for entry in entries if slot.matches(entry)]
+            for entries in groups
+        ]
+        groups = [entries for entries in groups if len(entries) >= slot.source_group]
+        if groups:
+            chosen = rng.sample(rng.choice(groups), min(slot.count, slot.source_group))
+            picked[index] = [entry.id for entry in chosen]
+            used.update(picked[index])
+
+    # One pass over the task_type buckets: every entry is a candidate for the
+    # first open slot it matches. When that slot has no level/theme filters the
+    # whole bucket is handed over without looking at individual entries.
+    candidates = [[] for _ in slots]
+    for task_type, entries in pool.by_task_type.items():
+        open_slots = [
+            index for index, slot in enumerate(slots)
+            if not (slot.source_group and picked[index])
+            and (slot.task_types is None or task_type in slot.task_types)
+            and task_type not in slot.exclude_task_types
+        ]
+        if not open_slots:
+            continue
+        first = slots[open_slots[0]]
+        if first.levels is None and first.themes is None:
+            candidates[open_slots[0]].append(entries)
+            continue
+        for entry in entries:
+            for index in open_slots:
+                if slots[index].matches(entry):
+                    candidates[index].append([entry])
+                    break
+
+    for index, slot in enumerate(slots):
+        if not picked[index]:
+            picked[index] = sample_chunks(candidates[index], slot.count, used, rng)
+            used.update(picked[index])
+
+    # Top up short slots with random questions nobody picked
+    selected = []
+    leftovers = None
+    for index, slot in enumerate(slots):
+        missing = slot.count - len(picked[index])
+        if missing > 0 and slot.fallback:
+            if leftovers is None:
+                leftovers = [entry.id for entry in pool.entries if entry.id not in used]
+                rng.shuffle(leftovers)
+            extra = leftovers[-missing:]
+            del leftovers[-missing:]
+            picked[index].extend(extra)
+            used.update(extra)
+        selected.extend(picked[index])
+
+    return selected
@@ -0,0 +1,125 @@
+"""
+Batched builder for the exam payload returned by product_tests_view.
+
+Produces the same JSON as CurrentTestSerializer, but splices it together from
+pre-rendered question fragments (see question_fragments.py). The fragments
+are looked up by the questions' current content versions, read with one
+primary key query, so an edit made through any process is seen at once.
+Questions that are not cached yet are loaded with their source texts in one
+query and all of their options in a second one. Together with the pool and
+blueprint lookups an exam costs at most five queries, however many tests and
+questions it has, and one once everything is cached.
+"""
+import json
+import random
+import uuid
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+
+from .exam_blueprint import assemble_exam, get_blueprints
+from .models import Question, Option
+from .question_fragments import get_fragments, render_json, splice_fragment
+from .question_pool import get_question_pools
+
+QUESTION_FIELDS = ['id', 'text', 'text2', 'text3', 'img', 'task_type', 'source_text__text']
+OPTION_FIELDS = ['id', 'question_id', 'text', 'img']
+
+
+def file_url(name):
+    # Mirrors DRF's ImageField output when no request is in the context
+    return default_storage.url(name) if name else None
+
+
+def select_exam_questions(tests, pools, include_all=False, variants=None):
+    """Return {test_id: [question_id, ...]} for `tests`."""
+    variants = variants or {}
+    selection = {
+        test_id: [uuid.UUID(question_id) for question_id in variant.question_ids]
+        for test_id, variant in variants.items()
+    }
+    remaining = [test for test in tests if test.id not in selection]
+    if include_all:
+        selection.update((test.id, pools[test.id].question_ids()) for test in remaining)
+    elif remaining:
+        blueprints = get_blueprints(remaining)
+        selection.update((test.id, assemble_exam(pools[test.id], blueprints[test.id])) for test in remaining)
+    return selection
+
+
+def load_versions(question_ids):
+    """Return {question_id: content_version}; questions deleted since they were picked are left out."""
+    return dict(Question.objects.filter(id__in=question_ids).values_list('id', 'content_version'))
+
+
+def load_questions(question_ids):
+    """Return {question_id: question dict} for `question_ids`, options ordered by ID."""
+    options_by_question = defaultdict(list)
+    options = Option.objects.filter(question_id__in=question_ids).order_by('id').values(*OPTION_FIELDS)
+    for option in options:
+        options_by_question[option.pop('question_id')].append({
+            'id': str(option['id']),
+            'text': option['text'],
+            'img': file_url(option['img']),
+        })
+
+    questions = {}
+    for row in Question.objects.filter(id__in=question_ids).values(*QUESTION_FIELDS):
+        question = {
+            'id': str(row['id']),
+            'text': row['text'],
+            'text2': row['text2'],
+            'text3': row['text3'],
+            'img': file_url(row['img']),
+            'task_type': row['task_type'],
+            'options': options_by_question.get(row['id'], []),
+        }
+        # The serializer leaves the key out for questions without a source text
+        if row['source_text__text'] is not None:
+            question['source_text'] = row['source_text__text']
+        questions[row['id']] = question
+    return questions
+
+
+def render_exam_payload(tests, include_all=False, variants=None, manifest=None):
+    """
+    Render `tests` with their exam questions as a JSON array, in the shape of CurrentTestSerializer.
+
+    `variants` maps test IDs to pre-built ExamVariant rows; those tests reuse the
+    variant's questions and shuffle options with its seed instead of at random.
+    When a `manifest` dict is given it is filled with what was issued, as
+    {test_id: {question_id: [option_id, ...]}} in hex form.
+    """
+    tests = list(tests)
+    variants = variants or {}
+    pools = get_question_pools([test.id for test in tests])
+    selection = select_exam_questions(tests, pools, include_all=include_all, variants=variants)
+
+    # Pools may be a few minutes old in this process, the versions never are
+    versions = load_versions([question_id for question_ids in selection.values() for question_id in question_ids])
+    fragments = get_fragments(versions, load_questions)
+
+    rendered_tests = []
+    for test in tests:
+        variant = variants.get(test.id)
+        rng = random.Random(variant.seed) if variant else random
+        questions = []
+        for question_id in selection[test.id]:
+            fragment = fragments.get(question_id)
+            if fragment is None:
+                continue
+            order = list(range(len(fragment.options)))
+            rng.shuffle(order)
+            questions.append(splice_fragment(fragment, order))
+            if manifest is not None:
+                manifest.setdefault(test.id.hex, {})[question_id.hex] = [fragment.option_ids[position] for position in order]
+
+        head = render_json({'id': str(test.id), 'title': test.title})[:-1]
+        rendered_tests.append(b''.join((head, b',"questions":[', b','.join(questions), b']}')))
+
+    return b'[' + b','.join(rendered_tests) + b']'
+
+
+def build_exam_payload(tests, include_all=False, variants=None):
+    """Same as render_exam_payload, decoded into plain dicts."""
+    return json.loads(render_exam_payload(tests, include_all=include_all, variants=variants))
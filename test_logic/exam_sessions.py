@@ -0,0 +1,128 @@
+"""
+Validation of exam submissions against the ExamSession manifest recorded at
+exam start, and the answers autosaved into the session during the exam.
+"""
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.timezone import now
+
+from .answer_storage import pack_answers, unpack_answers
+from .models import ExamSession
+
+
+class SubmissionError(Exception):
+    """A submitted test, question or option was never issued in the session."""
+
+
+def find_session(user, product, session_id):
+    """The user's exam session `session_id` for the product in any status, or None."""
+    try:
+        return ExamSession.objects.filter(user=user, product=product, id=session_id).first()
+    except ValidationError:
+        return None
+
+
+def find_open_session(user, product, session_id=None):
+    sessions = ExamSession.objects.filter(user=user, product=product, status=ExamSession.Status.STARTED)
+    if session_id:
+        try:
+            sessions = sessions.filter(id=session_id)
+        except ValidationError:
+            return None
+    return sessions.order_by('-started_at').first()
+
+
+def normalize_option_ids(value):
+    # Clients send a single option ID, a list of them, or nothing
+    if value is None:
+        return []
+    if isinstance(value, (str, uuid.UUID)):
+        return [value]
+    if isinstance(value, list):
+        return value
+    return []
+
+
+def to_hex(value):
+    try:
+        return uuid.UUID(str(value)).hex
+    except ValueError:
+        return None
+
+
+def validate_submission(session, tests_data):
+    """
+    Check `tests_data` against the session manifest without touching the database.
+
+    Returns [(test_id, [(question_id, [option_id, ...]), ...]), ...] with UUIDs,
+    or raises SubmissionError with the same messages complete_test_view used.
+    """
+    answers = []
+    for test_data in tests_data:
+        test_id = test_data.get('id')
+        issued_questions = session.manifest.get(to_hex(test_id))
+        if issued_questions is None:
+            raise SubmissionError(f"Test with id {test_id} not found.")
+
+        questions = []
+        for question_data in test_data.get('questions') or []:
+            question_id = question_data.get('id')
+            issued_options = issued_questions.get(to_hex(question_id))
+            if issued_options is None:
+                raise SubmissionError(f"Question with id {question_id} not found in test {test_id}.")
+
+            option_ids = [to_hex(option_id) for option_id in normalize_option_ids(question_data.get('option_id'))]
+            if not set(option_ids) <= set(issued_options):
+                raise SubmissionError(f"One or more options not found for question {question_id}.")
+
+            questions.append((uuid.UUID(to_hex(question_id)), [uuid.UUID(option_id) for option_id in option_ids]))
+        answers.append((uuid.UUID(to_hex(test_id)), questions))
+    return answers
+
+
+def merge_answers(saved, delta):
+    """Overlay packed `delta` answers on packed `saved` answers, question by question."""
+    merged = {test_id: dict(questions) for test_id, questions in saved.items()}
+    for test_id, questions in delta.items():
+        merged.setdefault(test_id, {}).update(questions)
+    return merged
+
+
+def autosave_answers(session, tests_data):
+    """
+    Validate a delta of changed answers and upsert it into the session.
+
+    Returns the session as saved, or raises SubmissionError.
+    """
+    delta = pack_answers(validate_submission(session, tests_data))
+    with transaction.atomic():
+        # Lock the row so concurrent autosaves from two tabs do not drop each other's answers
+        session = ExamSession.objects.select_for_update().get(pk=session.pk)
+        session.answers = merge_answers(session.answers, delta)
+        session.answers_saved_at = now()
+        session.save(update_fields=['answers', 'answers_saved_at'])
+    return session
+
+
+def session_answers(session, tests_data):
+    """Autosaved answers of the session with the final submission `tests_data` applied on top."""
+    answers = validate_submission(session, tests_data)
+    if not session.answers:
+        return answers
+    return unpack_answers(merge_answers(session.answers, pack_answers(answers)))
+
+
+def saved_tests_data(session):
+    """Autosaved answers in the request format, so a client can restore an interrupted exam."""
+    return [
+        {
+            'id': str(uuid.UUID(test_id)),
+            'questions': [
+                {'id': str(uuid.UUID(question_id)), 'option_id': [str(uuid.UUID(option_id)) for option_id in option_ids]}
+                for question_id, option_ids in questions.items()
+            ]
+        }
+        for test_id, questions in session.answers.items()
+    ]
@@ -0,0 +1,88 @@
+"""
+Pre-built exam variants.
+
+build_exam_variants fills each test's blueprint N times ahead of an exam window
+and stores the results as ExamVariant rows. At exam start a random active
+variant is picked per test, which costs two indexed lookups instead of running
+the question selection inside the request. The variants handed out are
+recorded in ExamSession.variant_ids, so how often each one was issued is
+counted from the sessions rather than kept on the shared variant rows.
+"""
+import random
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+
+from .exam_blueprint import assemble_exam, get_blueprints
+from .models import ExamVariant
+from .question_pool import build_question_pools
+
+
+def build_variants(product, tests, count):
+    """Replace the active variants of `tests` with `count` freshly assembled ones."""
+    tests = list(tests)
+    pools = build_question_pools([test.id for test in tests])
+    blueprints = get_blueprints(tests)
+    rng = random.SystemRandom()
+
+    created = 0
+    with transaction.atomic():
+        generations = dict(
+            ExamVariant.objects.filter(test__in=tests).values('test_id').annotate(
+                generation=Max('generation')
+            ).values_list('test_id', 'generation')
+        )
+        ExamVariant.objects.filter(test__in=tests, is_active=True).update(is_active=False)
+
+        for test in tests:
+            generation = generations.get(test.id, 0) + 1
+            variants = [
+                ExamVariant(
+                    product=product,
+                    test=test,
+                    generation=generation,
+                    number=number,
+                    question_ids=[str(question_id) for question_id in assemble_exam(pools[test.id], blueprints[test.id], rng)],
+                    seed=rng.getrandbits(63),
+                )
+                for number in range(count)
+            ]
+            ExamVariant.objects.bulk_create(variants, batch_size=500)
+            created += len(variants)
+
+    return created
+
+
+def get_variant_counts(tests):
+    """Return {test_id: number of active variants}."""
+    # Read on every exam start: a rebuild in another process changes the counts at once
+    counts = dict.fromkeys((test.id for test in tests), 0)
+    counts.update(
+        ExamVariant.objects.filter(test__in=tests, is_active=True).values('test_id').annotate(
+            count=Count('id')
+        ).values_list('test_id', 'count')
+    )
+    return counts
+
+
+def pick_variants(tests):
+    """Return {test_id: ExamVariant} with one random active variant for every test that has any."""
+    counts = get_variant_counts(tests)
+    condition = Q()
+    for test_id, count in counts.items():
+        if count:
+            condition |= Q(test_id=test_id, number=random.randrange(count))
+    if not condition:
+        return {}
+
+    variants = ExamVariant.objects.filter(condition, is_active=True).only('id', 'test_id', 'question_ids', 'seed')
+    return {variant.test_id: variant for variant in variants}
+
+
+def issued_counts(sessions):
+    """Return {variant_id (hex): times issued} over the ExamSession queryset `sessions`, for offline reports."""
+    counts = Counter()
+    for variant_ids in sessions.values_list('variant_ids', flat=True).iterator():
+        counts.update(variant_ids)
+    return counts
@@ -0,0 +1,153 @@
+"""
+Set-based grading and storage of exam submissions.
+
+A submission is first turned into a list of answers, either from the
+ExamSession manifest (exam_sessions.validate_submission) or, for clients
+without a session, by resolve_submission below with three set-based lookups.
+save_completed_test then grades the answers against the product's cached
+answer key (answer_keys.py) and writes the attempt with bulk inserts inside
+one transaction.
+"""
+import uuid
+
+from django.db import transaction
+
+from .exam_sessions import SubmissionError, normalize_option_ids, to_hex
+from .models import Test, Question, Option, CompletedTest, CompletedQuestion, ExamSession
+from .scoring import add_score, totals
+from .answer_keys import get_answer_key
+from .answer_storage import PACKED, packed_answer, storage_mode
+from .ids import uuid7
+from .result_snapshots import store_snapshot_quietly
+from .signals import attempt_graded
+
+
+def resolve_submission(product, tests_data):
+    """
+    Validate `tests_data` against the database with one query per table.
+
+    Returns answers in the same shape as exam_sessions.validate_submission, or
+    raises SubmissionError.
+    """
+    test_ids = set()
+    question_ids = set()
+    option_ids = set()
+    for test_data in tests_data:
+        test_ids.add(to_hex(test_data.get('id')))
+        for question_data in test_data.get('questions') or []:
+            question_ids.add(to_hex(question_data.get('id')))
+            option_ids.update(to_hex(option_id) for option_id in normalize_option_ids(question_data.get('option_id')))
+    test_ids.discard(None)
+    question_ids.discard(None)
+    option_ids.discard(None)
+
+    known_tests = {
+        test_id.hex for test_id in Test.objects.filter(id__in=test_ids, product=product).values_list('id', flat=True)
+    }
+    question_tests = {
+        question_id.hex: test_id.hex
+        for question_id, test_id in Question.objects.filter(id__in=question_ids).values_list('id', 'test_id')
+    }
+    option_questions = {
+        option_id.hex: question_id.hex
+        for option_id, question_id in Option.objects.filter(id__in=option_ids).values_list('id', 'question_id')
+    }
+
+    answers = []
+    for test_data in tests_data:
+        test_id = test_data.get('id')
+        test_hex = to_hex(test_id)
+        if test_hex not in known_tests:
+            raise SubmissionError(f"Test with id {test_id} not found.")
+
+        questions = []
+        for question_data in test_data.get('questions') or []:
+            question_id = question_data.get('id')
+            question_hex = to_hex(question_id)
+            if question_hex is None or question_tests.get(question_hex) != test_hex:
+                raise SubmissionError(f"Question with id {question_id} not found in test {test_id}.")
+
+            selected = [to_hex(option_id) for option_id in normalize_option_ids(question_data.get('option_id'))]
+            if any(option_id is None or option_questions.get(option_id) != question_hex for option_id in selected):
+                raise SubmissionError(f"One or more options not found for question {question_id}.")
+
+            questions.append((uuid.UUID(question_hex), [uuid.UUID(option_id) for option_id in selected]))
+        answers.append((uuid.UUID(test_hex), questions))
+    return answers
+
+
+def save_completed_test(user, product, answers, session=None, completed_date=None, **fields):
+    """
+    Grade `answers` and store them as a CompletedTest with bulk inserts.
+
+    `fields` are passed to the CompletedTest (start_test_time, time_spent,
+    ...). `completed_date` defaults to now. The score columns (see scoring)
+    are filled in here. In packed storage mode the answers go to
+    CompletedTest.answers and no CompletedQuestion rows are written (see
+    answer_storage). The result document is stored as well (see
+    result_snapshots) and attempt_graded is sent before the transaction commits.
+    """
+    answer_key = get_answer_key(product.id)
+
+    packed = storage_mode() == PACKED
+    completed_test = CompletedTest(user=user, product=product, **fields)
+    if packed:
+        completed_test.answers = {}
+    test_links = []
+    completed_questions = []
+    option_links = []
+    test_scores = {}
+    seen_tests = set()
+
+    for test_id, questions in answers:
+        if test_id not in seen_tests:
+            seen_tests.add(test_id)
+            test_links.append(CompletedTest.tests.through(completedtest_id=completed_test.id, test_id=test_id))
+
+        for question_id, option_ids in questions:
+            is_correct = answer_key.is_correct(question_id, option_ids)
+            add_score(test_scores, test_id, is_correct)
+            if packed:
+                # The same ID a CompletedQuestion row would get, kept if the attempt is unpacked later
+                completed_test.answers.setdefault(test_id.hex, {})[question_id.hex] = packed_answer(uuid7(), option_ids, is_correct)
+                continue
+
+            completed_question = CompletedQuestion(
+                completed_test_id=completed_test.id,
+                test_id=test_id,
+                question_id=question_id,
+                is_correct=is_correct,
+            )
+            completed_questions.append(completed_question)
+            option_links.extend(
+                CompletedQuestion.selected_option.through(completedquestion_id=completed_question.id, option_id=option_id)
+                for option_id in set(option_ids)
+            )
+
+    completed_test.test_scores = test_scores
+    completed_test.correct_count, completed_test.total_count = totals(test_scores)
+
+    with transaction.atomic():
+        completed_test.save(force_insert=True)
+        if completed_date is not None:
+            # completed_date is auto_now_add, so a submission graded later keeps its own time
+            CompletedTest.objects.filter(id=completed_test.id).update(completed_date=completed_date)
+            completed_test.completed_date = completed_date
+        # Answer rows are partitioned by the attempt's completion date
+        for completed_question in completed_questions:
+            completed_question.completed_date = completed_test.completed_date
+        CompletedTest.tests.through.objects.bulk_create(test_links)
+        CompletedQuestion.objects.bulk_create(completed_questions, batch_size=1000)
+        CompletedQuestion.selected_option.through.objects.bulk_create(option_links, batch_size=1000)
+
+        if session is not None:
+            session.status = ExamSession.Status.COMPLETED
+            session.completed_test = completed_test
+            session.save(update_fields=['status', 'completed_test'])
+
+        # In the same transaction, so rollups never count an attempt that was not stored, or miss one that was
+        attempt_graded.send(sender=CompletedTest, completed_test=completed_test)
+
+    store_snapshot_quietly(completed_test)
+
+    return completed_test
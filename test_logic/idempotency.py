@@ -0,0 +1,143 @@
+"""
+Idempotency keys for endpoints that clients retry on timeouts.
+
+A request sent with an Idempotency-Key header claims an IdempotencyRecord for
+(user, endpoint, key) before the view runs. The first response is stored on the
+record and replayed to every retry within IDEMPOTENCY_KEY_TTL seconds, so a
+retried exam start does not charge the balance again and a retried submission
+does not store a second attempt. A duplicate that arrives while the first
+request is still running gets 409 with Retry-After straight away rather than
+holding a worker while it waits.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils.timezone import now
+from drf_yasg import openapi
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+# Default lifetime of a stored response in seconds
+DEFAULT_KEY_TTL = 24 * 60 * 60
+# Seconds a duplicate of a request still running is told to wait before retrying
+DEFAULT_RETRY_AFTER = 1
+# A pending record older than this belongs to a request that died
+DEFAULT_PENDING_TIMEOUT = 120
+
+idempotency_key_parameter = openapi.Parameter(
+    HEADER,
+    openapi.IN_HEADER,
+    type=openapi.TYPE_STRING,
+    required=False,
+    description='Client-generated key; retries with the same key get the first response instead of repeating the work'
+)
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def claim(user, endpoint, key, fingerprint):
+    """Return (record, created)."""
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(
+                    user=user, endpoint=endpoint, key=key, request_hash=fingerprint
+                ), True
+        except IntegrityError:
+            record = IdempotencyRecord.objects.filter(user=user, endpoint=endpoint, key=key).first()
+            # Otherwise the first request failed and released the key in between
+            if record is not None:
+                return record, False
+
+
+def is_stale(record):
+    if record.status == IdempotencyRecord.Status.DONE:
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_KEY_TTL)
+    else:
+        ttl = getattr(settings, 'IDEMPOTENCY_PENDING_TIMEOUT', DEFAULT_PENDING_TIMEOUT)
+    return record.created_at < now() - timedelta(seconds=ttl)
+
+
+def store(record, response):
+    if isinstance(response, Response):
+        body = JSONRenderer().render(response.data)
+        content_type = 'application/json'
+    else:
+        body = response.content
+        content_type = response.get('Content-Type', '')
+
+    record.status = IdempotencyRecord.Status.DONE
+    record.response_status = response.status_code
+    record.response_body = body
+    record.content_type = content_type
+    record.save(update_fields=['status', 'response_status', 'response_body', 'content_type'])
+
+
+def replay(record):
+    response = HttpResponse(bytes(record.response_body), content_type=record.content_type, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(endpoint):
+    """Decorator for function views, applied below @api_view."""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"detail": f"{HEADER} is too long."}, status=status.HTTP_400_BAD_REQUEST)
+
+            fingerprint = request_hash(request)
+            record, created = claim(request.user, endpoint, key, fingerprint)
+            if not created and is_stale(record):
+                # Expired response or abandoned attempt: start over
+                IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+                record, created = claim(request.user, endpoint, key, fingerprint)
+
+            if not created:
+                if record.request_hash != fingerprint:
+                    return Response(
+                        {"detail": f"{HEADER} was already used with a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                if record.status == IdempotencyRecord.Status.DONE:
+                    return replay(record)
+                response = Response(
+                    {"detail": "A request with this Idempotency-Key is still being processed."},
+                    status=status.HTTP_409_CONFLICT
+                )
+                response['Retry-After'] = str(getattr(settings, 'IDEMPOTENCY_RETRY_AFTER', DEFAULT_RETRY_AFTER))
+                return response
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+
+            # Server errors are not stored so the client can retry them
+            if response.status_code >= 500:
+                record.delete()
+            else:
+                store(record, response)
+            return response
+
+        return wrapper
+
+    return decorator
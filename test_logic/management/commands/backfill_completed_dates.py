@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from test_logic.models import CompletedTest
+from test_logic.partitioning import backfill_completed_dates
+
+
+class Command(BaseCommand):
+    help = 'Copy the completion date of every attempt onto its answer rows, the partition key of the answer table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of completed tests whose answer rows are updated per transaction (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        completed_tests = CompletedTest.objects.order_by('id')
+        total = completed_tests.count()
+        self.stdout.write(f'{total} completed test(s) to check')
+
+        checked = 0
+        updated = 0
+        last_id = None
+        while True:
+            # Walk the primary key instead of using OFFSET, which gets slower on every batch
+            batch = completed_tests if last_id is None else completed_tests.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            updated += backfill_completed_dates(ids)
+            checked += len(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'Checked {checked}/{total}, {updated} answer row(s) updated')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled {updated} answer row(s)'))
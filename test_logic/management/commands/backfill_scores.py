@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from test_logic.models import CompletedTest
+from test_logic.scoring import backfill_scores
+
+
+class Command(BaseCommand):
+    help = 'Store is_correct and the score counters for completed tests graded before they existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of completed tests updated per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many completed tests',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        pending = CompletedTest.objects.filter(correct_count__isnull=True).order_by('id')
+        total = pending.count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        self.stdout.write(f'{total} completed test(s) to backfill')
+
+        updated = 0
+        last_id = None
+        while updated < total:
+            # Walk the primary key instead of using OFFSET, which gets slower on every batch
+            batch = pending if last_id is None else pending.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:min(batch_size, total - updated)])
+            if not ids:
+                break
+
+            updated += backfill_scores(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'Backfilled {updated}/{total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled scores for {updated} completed test(s)'))
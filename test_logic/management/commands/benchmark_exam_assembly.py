@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from test_logic.exam_blueprint import ENT_SLOTS, BlueprintSlot, assemble_exam
+from test_logic.question_pool import PoolEntry, QuestionPool
+
+
+class Command(BaseCommand):
+    help = 'Measure per-exam assembly latency of the blueprint engine on synthetic question banks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[1000, 10000, 100000],
+            help='Question bank sizes to benchmark (default: 1000 10000 100000)',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=200,
+            help='Number of exams assembled per bank size (default: 200)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the synthetic bank',
+        )
+
+    def build_pool(self, size, rng):
+        # Roughly the ENT mix: most questions general, the rest split between the special task types
+        task_types = [1, 2, 3, 4, 5, 10, 8, 6]
+        weights = [20, 20, 15, 15, 10, 10, 5, 5]
+        sources = [uuid.uuid4() for _ in range(max(1, size // 50))]
+
+        entries = []
+        for _ in range(size):
+            task_type = rng.choices(task_types, weights)[0]
+            entries.append(PoolEntry(
+                id=uuid.uuid4(),
+                task_type=task_type,
+                level=rng.randint(1, 3),
+                theme=f"theme-{rng.randint(1, 30)}",
+                source_id=rng.choice(sources) if task_type == 10 else None,
+                version=1,
+            ))
+        return QuestionPool(uuid.uuid4(), entries)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        slots = [BlueprintSlot.from_dict(slot) for slot in ENT_SLOTS]
+        runs = options['runs']
+
+        self.stdout.write(f"{'bank size':>10} {'pool build ms':>14} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+
+        for size in options['sizes']:
+            started = time.perf_counter()
+            pool = self.build_pool(size, rng)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            timings = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                selected = assemble_exam(pool, slots, rng)
+                timings.append((time.perf_counter() - started) * 1000)
+
+            if len(selected) != 40:
+                self.stdout.write(self.style.WARNING(f"Bank of {size} produced {len(selected)} questions"))
+
+            timings.sort()
+            self.stdout.write(
+                f"{size:>10} {build_ms:>14.2f} {statistics.mean(timings):>10.3f} "
+                f"{timings[len(timings) // 2]:>10.3f} {timings[int(len(timings) * 0.95) - 1]:>10.3f}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
@@ -0,0 +1,120 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from test_logic.ids import uuid7
+
+SCHEMES = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare insert throughput and index size of uuid4 and uuid7 primary keys on synthetic answer rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000000,
+            help='Number of synthetic answer rows inserted per scheme (default: 1000000)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows per INSERT statement (default: 2000)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the benchmark tables instead of dropping them',
+        )
+
+    def table_name(self, scheme):
+        return f'benchmark_keys_{scheme}'
+
+    def create_table(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            # Same shape and indexes as CompletedQuestion
+            cursor.execute(f'''
+                CREATE TABLE {table} (
+                    id uuid PRIMARY KEY,
+                    completed_test_id uuid NOT NULL,
+                    test_id uuid NOT NULL,
+                    question_id uuid NOT NULL,
+                    is_correct boolean NOT NULL
+                )
+            ''')
+            cursor.execute(f'CREATE INDEX {table}_completed_test ON {table} (completed_test_id)')
+            cursor.execute(f'CREATE INDEX {table}_completed_test_test ON {table} (completed_test_id, test_id)')
+
+    def drop_table(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+    def sizes(self, table):
+        """Return (table bytes, primary key index bytes), or (None, None) where the database cannot tell."""
+        if connection.vendor != 'postgresql':
+            return None, None
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT pg_relation_size('{table}'), pg_relation_size('{table}_pkey')")
+            return cursor.fetchone()
+
+    def insert_rows(self, table, make_id, total, batch_size, rng):
+        tests = [uuid.uuid4() for _ in range(5)]
+        questions = [uuid.uuid4() for _ in range(2000)]
+        placeholders = '(%s, %s, %s, %s, %s)'
+        converter = (lambda value: value) if connection.features.has_native_uuid_field else (lambda value: value.hex)
+
+        inserted = 0
+        completed_test_id = make_id()
+        started = time.perf_counter()
+        while inserted < total:
+            count = min(batch_size, total - inserted)
+            params = []
+            for position in range(inserted, inserted + count):
+                # 40 answers per attempt, like an ENT exam
+                if position % 40 == 0:
+                    completed_test_id = make_id()
+                params.extend((
+                    converter(make_id()),
+                    converter(completed_test_id),
+                    converter(tests[position % 40 // 8]),
+                    converter(rng.choice(questions)),
+                    rng.random() < 0.5,
+                ))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f'INSERT INTO {table} VALUES {", ".join([placeholders] * count)}', params)
+            inserted += count
+        return time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        total = options['rows']
+        batch_size = options['batch_size']
+        if total < 1 or batch_size < 1:
+            raise CommandError('--rows and --batch-size must be at least 1')
+
+        self.stdout.write(f'Inserting {total} rows per scheme on {connection.vendor}')
+        self.stdout.write(f"{'scheme':>8} {'seconds':>10} {'rows/s':>12} {'table MB':>10} {'pkey MB':>10}")
+
+        for scheme, make_id in SCHEMES.items():
+            table = self.table_name(scheme)
+            self.create_table(table)
+            try:
+                seconds = self.insert_rows(table, make_id, total, batch_size, random.Random(42))
+                table_bytes, index_bytes = self.sizes(table)
+            finally:
+                if not options['keep']:
+                    self.drop_table(table)
+
+            table_mb = f'{table_bytes / 2 ** 20:.1f}' if table_bytes is not None else 'n/a'
+            index_mb = f'{index_bytes / 2 ** 20:.1f}' if index_bytes is not None else 'n/a'
+            self.stdout.write(f'{scheme:>8} {seconds:>10.2f} {total / seconds:>12.0f} {table_mb:>10} {index_mb:>10}')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark finished'))
@@ -0,0 +1,46 @@
+from uuid import UUID
+
+from django.core.management.base import BaseCommand, CommandError
+
+from test_logic.exam_variants import build_variants
+from test_logic.models import Product, Test
+
+
+class Command(BaseCommand):
+    help = 'Pre-build exam variants for the tests of a product, replacing the currently active ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=str, help='The product ID to build variants for')
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=200,
+            help='Number of variants to build per test (default: 200)',
+        )
+        parser.add_argument(
+            '--tests',
+            nargs='+',
+            help='Optional list of test IDs. If not provided, builds variants for every test of the product.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(id=UUID(options['product_id']))
+        except (ValueError, Product.DoesNotExist) as e:
+            raise CommandError(f'Invalid product: {e}')
+
+        if options['count'] < 1:
+            raise CommandError('--count must be at least 1')
+
+        tests = Test.objects.filter(product=product)
+        if options['tests']:
+            tests = tests.filter(id__in=options['tests'])
+
+        if not tests.exists():
+            self.stdout.write(self.style.WARNING('No tests found for the specified product.'))
+            return
+
+        created = build_variants(product, tests, options['count'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Successfully built {created} variant(s) for {tests.count()} test(s) of {product.title}'
+        ))
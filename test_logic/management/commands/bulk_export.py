@@ -0,0 +1,61 @@
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from test_logic.bulk_export import COMPLETION_TABLES, FORMATS, CSV, export_table
+
+
+class Command(BaseCommand):
+    help = 'Export tables as gzip-compressed CSV or JSON lines, streamed with COPY on PostgreSQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tables',
+            nargs='*',
+            help='Tables or app_label.Model names to export (default: the completion tables)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default=CSV,
+            help='Output format (default: csv)',
+        )
+        parser.add_argument(
+            '--output-dir',
+            default='.',
+            help='Directory the .gz files are written to (default: current directory)',
+        )
+        parser.add_argument(
+            '--compress-level',
+            type=int,
+            default=6,
+            help='gzip compression level from 1 (fastest) to 9 (smallest) (default: 6)',
+        )
+
+    def resolve_table(self, name):
+        if '.' not in name:
+            return name
+        try:
+            return apps.get_model(name)._meta.db_table
+        except (LookupError, ValueError):
+            raise CommandError(f'Unknown model "{name}"')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['compress_level'] <= 9:
+            raise CommandError('--compress-level must be between 1 and 9')
+        tables = [self.resolve_table(name) for name in options['tables']] or COMPLETION_TABLES
+        existing = set(connection.introspection.table_names())
+        missing = [table for table in tables if table not in existing]
+        if missing:
+            raise CommandError(f'Unknown table(s): {", ".join(missing)}')
+        os.makedirs(options['output_dir'], exist_ok=True)
+
+        for table in tables:
+            started = time.perf_counter()
+            path, size = export_table(table, options['output_dir'], options['format'], options['compress_level'])
+            self.stdout.write(f'Exported {table} to {path} ({size / 2 ** 20:.1f} MB) in {time.perf_counter() - started:.1f}s')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully exported {len(tables)} table(s)'))
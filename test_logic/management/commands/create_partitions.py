@@ -0,0 +1,58 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from test_logic.partitioning import (
+    DEFAULT_MONTHS, PARTITIONED_MODELS, convert_to_partitioned, create_month_partitions, default_partition_range,
+    is_partitioned,
+)
+
+
+class Command(BaseCommand):
+    help = 'Create the upcoming monthly partitions of the answer rows (PostgreSQL only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=DEFAULT_MONTHS,
+            help=f'Number of months to have partitions for, counting the current one (default: {DEFAULT_MONTHS})',
+        )
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert tables that are not partitioned yet. Locks them against reads and writes while the rows are '
+                 'copied, so run it in a maintenance window.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Table partitioning is only supported on PostgreSQL')
+        if options['months'] < 1:
+            raise CommandError('--months must be at least 1')
+
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+
+            if not is_partitioned(table):
+                if not options['convert']:
+                    self.stdout.write(self.style.WARNING(f'{table} is not partitioned; run with --convert to convert it'))
+                    continue
+
+                with transaction.atomic():
+                    convert_to_partitioned(table, months=options['months'])
+                self.stdout.write(self.style.SUCCESS(f'Converted {table} to monthly partitions'))
+
+            with transaction.atomic():
+                created = create_month_partitions(table, date.today(), options['months'])
+            for name in created:
+                self.stdout.write(f'Created partition {name}')
+            self.stdout.write(self.style.SUCCESS(f'{table}: {len(created)} new partition(s)'))
+
+            # Rows dated outside every monthly partition; on stderr so cron mails it
+            count, oldest, newest = default_partition_range(table)
+            if count:
+                self.stderr.write(self.style.WARNING(
+                    f'{table}: {count} row(s) from {oldest} to {newest} are in the default partition'
+                ))
@@ -1,29 +1,21 @@
 from django.core.management.base import BaseCommand
-import json
-from test_logic.models import CompletedQuestion
+from django.core import serializers
+from django.db.models import Prefetch
+from test_logic.models import CompletedQuestion, Option
 
 class Command(BaseCommand):
     help = 'Export CompletedQuestion data to a properly formatted JSON file'
 
     def handle(self, *args, **options):
-        completed_questions = CompletedQuestion.objects.all()
-        data = []
-
-        for question in completed_questions:
-            data.append({
-                "model": "test_logic.completedquestion",
-                "pk": str(question.id),
-                "fields": {
-                    "completed_test": str(question.completed_test.id),
-                    "test": str(question.test.id),
-                    "question": str(question.question.id) if question.question else None,
-                    "selected_option": str(question.selected_option.id) if question.selected_option else None
-                }
-            })
+        # selected_option is many-to-many; prefetch the option IDs per chunk instead of one query per row
+        completed_questions = CompletedQuestion.objects.order_by('id').prefetch_related(
+            Prefetch('selected_option', queryset=Option.objects.only('id'))
+        )
 
+        # Written to the file object by object rather than built up in memory
         with open('fixture_completedquestion.json', 'w') as f:
-            json.dump(data, f, indent=2)
+            serializers.serialize('json', completed_questions.iterator(chunk_size=2000), indent=2, stream=f)
 
         self.stdout.write(
-            self.style.SUCCESS(f'Successfully exported {len(data)} CompletedQuestion records')
-        ) 
\ No newline at end of file
+            self.style.SUCCESS(f'Successfully exported {completed_questions.count()} CompletedQuestion records')
+        )
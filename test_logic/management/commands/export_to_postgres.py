@@ -10,8 +10,8 @@ class Command(BaseCommand):
         models = [User, Region, Product, Test, Question, Option, CompletedTest, CompletedQuestion]
         
         for model in models:
-            data = serializers.serialize('json', model.objects.all())
             filename = f'fixture_{model.__name__.lower()}.json'
+            # Stream the fixture instead of building the whole table as one string
             with open(filename, 'w') as f:
-                f.write(data)
+                serializers.serialize('json', model.objects.order_by('pk').iterator(chunk_size=2000), stream=f)
             self.stdout.write(self.style.SUCCESS(f'Successfully exported {model.__name__}'))
\ No newline at end of file
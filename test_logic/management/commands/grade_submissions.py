@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from test_logic.submission_intake import process_batch
+
+
+def close_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Grade staged exam submissions into CompletedTest/CompletedQuestion using a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker processes (default: 4)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Submissions claimed by a worker at a time (default: 50)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty (default: 1.0)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the queue is empty instead of polling for new submissions',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        batch_size = options['batch_size']
+
+        close_connections()
+        total_claimed = total_graded = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=close_connections) as executor:
+            while True:
+                futures = [executor.submit(process_batch, batch_size) for _ in range(workers)]
+                results = [future.result() for future in futures]
+                claimed = sum(result[0] for result in results)
+                graded = sum(result[1] for result in results)
+                total_claimed += claimed
+                total_graded += graded
+
+                if claimed:
+                    self.stdout.write(f"Graded {graded} of {claimed} claimed submission(s)")
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully graded {total_graded} of {total_claimed} submission(s)'))
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from test_logic.answer_storage import pack_completed_tests, unpack_completed_tests
+from test_logic.models import CompletedTest
+from test_logic.scoring import backfill_scores
+
+
+class Command(BaseCommand):
+    help = 'Move completed test answers from CompletedQuestion rows into CompletedTest.answers, or back with --reverse'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of completed tests converted per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many completed tests',
+        )
+        parser.add_argument(
+            '--reverse',
+            action='store_true',
+            help='Write packed answers back as CompletedQuestion rows',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        reverse = options['reverse']
+        pending = CompletedTest.objects.filter(answers__isnull=not reverse).order_by('id')
+        total = pending.count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        self.stdout.write(f'{total} completed test(s) to {"unpack" if reverse else "pack"}')
+
+        converted = 0
+        last_id = None
+        while converted < total:
+            # Walk the primary key instead of using OFFSET, which gets slower on every batch
+            batch = pending if last_id is None else pending.filter(id__gt=last_id)
+            batch = list(batch.only('id', 'product_id', 'answers', 'correct_count', 'completed_date')[:min(batch_size, total - converted)])
+            if not batch:
+                break
+
+            if reverse:
+                converted += unpack_completed_tests(batch)
+            else:
+                # Scores must be stored before the rows they are computed from go away
+                unscored = [completed_test.id for completed_test in batch if completed_test.correct_count is None]
+                if unscored:
+                    backfill_scores(unscored)
+                converted += pack_completed_tests([completed_test.id for completed_test in batch])
+
+            last_id = batch[-1].id
+            self.stdout.write(f'Converted {converted}/{total}')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully converted {converted} completed test(s)'))
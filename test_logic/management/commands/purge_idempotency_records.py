@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from test_logic.idempotency import DEFAULT_KEY_TTL
+from test_logic.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = 'Delete stored idempotency responses older than IDEMPOTENCY_KEY_TTL'
+
+    def handle(self, *args, **options):
+        ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_KEY_TTL)
+        deleted, _ = IdempotencyRecord.objects.filter(created_at__lt=now() - timedelta(seconds=ttl)).delete()
+        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {deleted} expired idempotency record(s)'))
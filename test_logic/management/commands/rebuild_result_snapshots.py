@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from test_logic.models import CompletedTest
+from test_logic.result_snapshots import SNAPSHOT_VERSION, store_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Store result snapshots for completed tests that have none or an outdated one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of completed tests loaded per batch (default: 200)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Rebuild every snapshot, including current ones',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        pending = CompletedTest.objects.select_related('user', 'product').prefetch_related('tests').order_by('id')
+        if not options['all']:
+            pending = pending.filter(Q(snapshot_version__isnull=True) | ~Q(snapshot_version=SNAPSHOT_VERSION))
+        total = pending.count()
+        self.stdout.write(f'{total} snapshot(s) to build')
+
+        built = 0
+        failed = 0
+        last_id = None
+        while True:
+            # Walk the primary key instead of using OFFSET, which gets slower on every batch
+            batch = pending if last_id is None else pending.filter(id__gt=last_id)
+            batch = list(batch.defer('result_snapshot')[:batch_size])
+            if not batch:
+                break
+
+            for completed_test in batch:
+                try:
+                    store_snapshot(completed_test)
+                    built += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'Failed to build snapshot for {completed_test.id}: {e}'))
+
+            last_id = batch[-1].id
+            self.stdout.write(f'Built {built}/{total}')
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} snapshot(s) failed'))
+        self.stdout.write(self.style.SUCCESS(f'Successfully built {built} snapshot(s)'))
@@ -0,0 +1,120 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0002_alter_option_text_alter_question_category_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Source',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+            ],
+            options={
+                'verbose_name': 'Источник',
+                'verbose_name_plural': 'Источники',
+            },
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='product_actual_name',
+            field=models.CharField(choices=[('ENT', 'ENT'), ('OZP', 'OZP'), ('REZERV', 'REZERV'), ('ADMIN_SREZ', 'ADMIN_SREZ')], default='ENT', max_length=10, verbose_name='Тип продукта'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='question_usage',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='text2',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='text3',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.RemoveField(
+            model_name='completedquestion',
+            name='selected_option',
+        ),
+        migrations.AddIndex(
+            model_name='completedquestion',
+            index=models.Index(fields=['completed_test'], name='test_logic__complet_a893f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedquestion',
+            index=models.Index(fields=['test'], name='test_logic__test_id_239bfa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedquestion',
+            index=models.Index(fields=['question'], name='test_logic__questio_e2372e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedquestion',
+            index=models.Index(fields=['completed_test', 'test'], name='test_logic__complet_4da115_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedtest',
+            index=models.Index(fields=['user'], name='test_logic__user_id_b4233d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedtest',
+            index=models.Index(fields=['product'], name='test_logic__product_4a912f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedtest',
+            index=models.Index(fields=['completed_date'], name='test_logic__complet_4f1a06_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='completedtest',
+            index=models.Index(fields=['user', 'product'], name='test_logic__user_id_2c841e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='option',
+            index=models.Index(fields=['question'], name='test_logic__questio_7aa5d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='option',
+            index=models.Index(fields=['is_correct'], name='test_logic__is_corr_f39742_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='option',
+            index=models.Index(fields=['question', 'is_correct'], name='test_logic__questio_47d633_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['test'], name='test_logic__test_id_c75426_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['task_type'], name='test_logic__task_ty_d32e02_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['test', 'task_type'], name='test_logic__test_id_57f684_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['subject_id'], name='test_logic__subject_e92329_idx'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='source_text',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='test_logic.source'),
+        ),
+        migrations.AddField(
+            model_name='completedquestion',
+            name='selected_option',
+            field=models.ManyToManyField(blank=True, related_name='selected_option', to='test_logic.option'),
+        ),
+    ]
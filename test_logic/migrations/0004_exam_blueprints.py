@@ -0,0 +1,31 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0003_catch_up_with_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamBlueprint',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(blank=True, max_length=200, verbose_name='Имя')),
+                ('slots', models.JSONField(default=list, help_text='[{"count": 5, "task_types": [10], "exclude_task_types": [], "levels": [], "themes": [], "source_group": 5, "fallback": true}]', verbose_name='Слоты')),
+                ('is_active', models.BooleanField(default=True)),
+                ('date_created', models.DateField(auto_now_add=True)),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exam_blueprints', to='test_logic.product', verbose_name='Продукт')),
+                ('test', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='exam_blueprints', to='test_logic.test', verbose_name='Тест')),
+            ],
+            options={
+                'verbose_name': 'Шаблон экзамена',
+                'verbose_name_plural': 'Шаблоны экзаменов',
+            },
+        ),
+    ]
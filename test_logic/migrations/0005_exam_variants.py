@@ -0,0 +1,40 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0004_exam_blueprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamVariant',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('generation', models.IntegerField(default=1)),
+                ('number', models.IntegerField(help_text='Номер варианта внутри поколения')),
+                ('question_ids', models.JSONField(default=list)),
+                ('seed', models.BigIntegerField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('issued_count', models.IntegerField(default=0)),
+                ('last_issued_at', models.DateTimeField(blank=True, null=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_variants', to='test_logic.product', verbose_name='Продукт')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_variants', to='test_logic.test', verbose_name='Тест')),
+            ],
+            options={
+                'verbose_name': 'Вариант экзамена',
+                'verbose_name_plural': 'Варианты экзаменов',
+                'indexes': [models.Index(fields=['test', 'is_active', 'number'], name='test_logic__test_id_f3b5e3_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='examvariant',
+            constraint=models.UniqueConstraint(fields=('test', 'generation', 'number'), name='unique_exam_variant_number'),
+        ),
+    ]
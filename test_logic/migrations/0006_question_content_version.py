@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0005_exam_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='content_version',
+            field=models.PositiveIntegerField(default=1, editable=False, help_text='Растёт при каждом изменении вопроса или его вариантов'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('test_logic', '0006_question_content_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('manifest', models.JSONField(default=dict)),
+                ('variant_ids', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('STARTED', 'Started'), ('COMPLETED', 'Completed')], default='STARTED', max_length=10)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_test', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='exam_session', to='test_logic.completedtest')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_sessions', to='test_logic.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exam_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Сессия экзамена',
+                'verbose_name_plural': 'Сессии экзаменов',
+                'indexes': [models.Index(fields=['user', 'product', 'status'], name='test_logic__user_id_21d356_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('test_logic', '0007_exam_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StagedSubmission',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('completed_test_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('payload', models.JSONField(default=list)),
+                ('start_test_time', models.DateTimeField(blank=True, null=True)),
+                ('submitted_at', models.DateTimeField()),
+                ('time_spent', models.IntegerField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('graded_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_submissions', to='test_logic.product')),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='staged_submissions', to='test_logic.examsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staged_submissions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Отправка на проверку',
+                'verbose_name_plural': 'Отправки на проверку',
+                'indexes': [models.Index(fields=['status', 'submitted_at'], name='test_logic__status_560e4e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0008_staged_submissions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedquestion',
+            name='is_correct',
+            field=models.BooleanField(blank=True, null=True, verbose_name='Правильно'),
+        ),
+        migrations.AddField(
+            model_name='completedtest',
+            name='correct_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Правильных ответов'),
+        ),
+        migrations.AddField(
+            model_name='completedtest',
+            name='test_scores',
+            field=models.JSONField(blank=True, null=True, verbose_name='Результаты по тестам'),
+        ),
+        migrations.AddField(
+            model_name='completedtest',
+            name='total_count',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Всего вопросов'),
+        ),
+    ]
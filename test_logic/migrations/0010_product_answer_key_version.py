@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0009_completed_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='answer_key_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0010_product_answer_key_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedtest',
+            name='answers',
+            field=models.JSONField(blank=True, null=True, verbose_name='Ответы'),
+        ),
+    ]
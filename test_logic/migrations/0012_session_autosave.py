@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0011_packed_answers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examsession',
+            name='answers',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='examsession',
+            name='answers_saved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
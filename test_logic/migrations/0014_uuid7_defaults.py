@@ -0,0 +1,44 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:23
+
+from django.db import migrations, models
+import test_logic.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0013_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='completedquestion',
+            name='id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='completedtest',
+            name='id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='examsession',
+            name='id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='idempotencyrecord',
+            name='id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='stagedsubmission',
+            name='completed_test_id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='stagedsubmission',
+            name='id',
+            field=models.UUIDField(default=test_logic.ids.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Add the partition key of the answer rows, empty for the rows stored so far.
+
+    Only the schema changes here, which does not rewrite the table. Fill the
+    column with `manage.py backfill_completed_dates` before applying 0019; the
+    table is converted to partitions by `create_partitions --convert` (see
+    test_logic/partitioning.py for the steps and the downtime they need).
+    """
+
+    dependencies = [
+        ('test_logic', '0014_uuid7_defaults'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedquestion',
+            name='completed_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0015_partition_completed_questions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='completedtest',
+            name='result_snapshot',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='completedtest',
+            name='snapshot_version',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
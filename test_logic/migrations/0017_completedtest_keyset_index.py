@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0016_result_snapshots'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='completedtest',
+            name='test_logic__complet_4f1a06_idx',
+        ),
+        migrations.AddIndex(
+            model_name='completedtest',
+            index=models.Index(fields=['completed_date', 'id'], name='test_logic__complet_466dd2_idx'),
+        ),
+    ]
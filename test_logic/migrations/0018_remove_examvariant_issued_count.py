@@ -0,0 +1,21 @@
+# Generated by Django 4.2.14 on 2026-10-18 01:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('test_logic', '0017_completedtest_keyset_index'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='examvariant',
+            name='issued_count',
+        ),
+        migrations.RemoveField(
+            model_name='examvariant',
+            name='last_issued_at',
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.14 on 2026-10-18 02:05
+
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 500
+
+
+def copy_remaining_dates(apps, schema_editor):
+    # backfill_completed_dates has done the bulk of this; only rows it has not reached are left
+    CompletedQuestion = apps.get_model('test_logic', 'CompletedQuestion')
+    CompletedTest = apps.get_model('test_logic', 'CompletedTest')
+    pending = CompletedQuestion.objects.filter(completed_date__isnull=True)
+    while True:
+        completed_test_ids = list(pending.values_list('completed_test_id', flat=True).distinct()[:BATCH_SIZE])
+        if not completed_test_ids:
+            break
+        with transaction.atomic():
+            pending.filter(completed_test_id__in=completed_test_ids).update(
+                completed_date=Subquery(CompletedTest.objects.filter(id=OuterRef('completed_test_id')).values('completed_date')[:1])
+            )
+
+
+class Migration(migrations.Migration):
+    """
+    Make the partition key of the answer rows NOT NULL.
+
+    Apply after `manage.py backfill_completed_dates` has finished. Setting NOT
+    NULL scans the whole table under an ACCESS EXCLUSIVE lock, during which
+    answer rows can be neither read nor written.
+    """
+
+    # Each backfill batch commits on its own instead of holding every row locked until the end
+    atomic = False
+
+    dependencies = [
+        ('test_logic', '0018_remove_examvariant_issued_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_remaining_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='completedquestion',
+            name='completed_date',
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from accounts.models import User
 import uuid
 from django.utils import timezone
+from .ids import uuid7
 
 class Product(models.Model):
 
@@ -38,6 +39,8 @@ class Product(models.Model):
     )
 
     date_created = models.DateField(auto_now_add=True)
+    # Bumped whenever an option of the product changes, so cached answer keys can tell they are stale
+    answer_key_version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return self.title
@@ -75,6 +78,60 @@ class Source(models.Model):
         verbose_name = 'Источник'
         verbose_name_plural = 'Источники'
 
+class ExamBlueprint(models.Model):
+    """
+    Declarative layout of an exam: an ordered list of slots, each asking for a
+    number of questions matching task_type/level/theme filters. A blueprint
+    attached to a test wins over one attached to its product.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    title = models.CharField(max_length=200, blank=True, verbose_name='Имя')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, related_name='exam_blueprints', verbose_name="Продукт")
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, null=True, blank=True, related_name='exam_blueprints', verbose_name="Тест")
+    slots = models.JSONField(
+        default=list,
+        help_text='[{"count": 5, "task_types": [10], "exclude_task_types": [], "levels": [], "themes": [], "source_group": 5, "fallback": true}]',
+        verbose_name="Слоты"
+    )
+    is_active = models.BooleanField(default=True)
+    date_created = models.DateField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title or str(self.id)
+
+    class Meta:
+        verbose_name = 'Шаблон экзамена'
+        verbose_name_plural = 'Шаблоны экзаменов'
+
+class ExamVariant(models.Model):
+    """
+    A pre-built exam for one test: the ordered question IDs plus the seed that
+    fixes the order of their options. Built offline by build_exam_variants and
+    handed out by product_tests_view.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='exam_variants', verbose_name="Продукт")
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='exam_variants', verbose_name="Тест")
+    generation = models.IntegerField(default=1)
+    number = models.IntegerField(help_text="Номер варианта внутри поколения")
+    question_ids = models.JSONField(default=list)
+    seed = models.BigIntegerField()
+    is_active = models.BooleanField(default=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Variant {self.generation}.{self.number} of {self.test.title}"
+
+    class Meta:
+        verbose_name = 'Вариант экзамена'
+        verbose_name_plural = 'Варианты экзаменов'
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'generation', 'number'], name='unique_exam_variant_number'),
+        ]
+        indexes = [
+            models.Index(fields=['test', 'is_active', 'number']),
+        ]
+
 class Question(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
@@ -99,10 +156,20 @@ class Question(models.Model):
     subject_title = models.CharField(max_length=2000, null=True, blank=True)
     class_number = models.IntegerField(null=True, blank=True)
     question_usage = models.BooleanField(default=True)
+    content_version = models.PositiveIntegerField(default=1, editable=False, help_text="Растёт при каждом изменении вопроса или его вариантов")
 
     def __str__(self):
         return self.text
 
+    def save(self, *args, **kwargs):
+        # content_version is bumped in the database (see signals); writing back the loaded value could undo a bump
+        if not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = kwargs.get('update_fields')
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            kwargs['update_fields'] = [name for name in update_fields if name != 'content_version']
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Вопрос'
         verbose_name_plural = 'Вопросы'
@@ -164,7 +231,7 @@ class BookSuggestion(models.Model):
         verbose_name_plural = 'Литература'
 
 class CompletedTest(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='completed_tests')
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='completed_tests')
     tests = models.ManyToManyField(Test, related_name='completed_tests')
@@ -175,6 +242,17 @@ class CompletedTest(models.Model):
 
     time_spent = models.IntegerField(null=True, blank=True)
 
+    # Scores stored at grading time; NULL for attempts not yet backfilled (see backfill_scores)
+    correct_count = models.PositiveIntegerField(null=True, blank=True, verbose_name='Правильных ответов')
+    total_count = models.PositiveIntegerField(null=True, blank=True, verbose_name='Всего вопросов')
+    # {test_id: {"correct": n, "total": m}}
+    test_scores = models.JSONField(null=True, blank=True, verbose_name='Результаты по тестам')
+    # Packed answers {test_id: {question_id: {id, options, correct}}} instead of CompletedQuestion rows (see answer_storage)
+    answers = models.JSONField(null=True, blank=True, verbose_name='Ответы')
+    # zlib-compressed JSON served by get_completed_test_by_id (see result_snapshots)
+    result_snapshot = models.BinaryField(null=True, blank=True, editable=False)
+    snapshot_version = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"CompletedTest for {self.user.username} - {self.product.title}"
 
@@ -184,17 +262,22 @@ class CompletedTest(models.Model):
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['product']),
-            models.Index(fields=['completed_date']),
+            # Also serves the (completed_date, id) keyset pagination of the dashboard
+            models.Index(fields=['completed_date', 'id']),
             models.Index(fields=['user', 'product']),
         ]
 
 
 class CompletedQuestion(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     completed_test = models.ForeignKey(CompletedTest, on_delete=models.CASCADE, related_name='completed_questions')
     test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='completed_test_questions')
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='completed_test_questions',  null=True, blank=True)
     selected_option = models.ManyToManyField(Option, related_name='selected_option', blank=True)
+    # True when any selected option is correct; NULL for rows not yet backfilled
+    is_correct = models.BooleanField(null=True, blank=True, verbose_name='Правильно')
+    # Copy of completed_test.completed_date, the partition key of this table (see partitioning)
+    completed_date = models.DateTimeField()
 
     def __str__(self):
         return f"CompletedQuestion for {self.completed_test.user.username} - {self.question.text}"
@@ -207,4 +290,112 @@ class CompletedQuestion(models.Model):
             models.Index(fields=['test']),
             models.Index(fields=['question']),
             models.Index(fields=['completed_test', 'test']),
-        ]
\ No newline at end of file
+        ]
+
+class ExamSession(models.Model):
+    """
+    What the server issued to a student at exam start. `manifest` maps test IDs
+    to {question_id: [option_id, ...]} (all in hex form), so a submission can be
+    validated in memory instead of looking every question up again. `answers`
+    holds what the student has autosaved so far.
+    """
+
+    class Status(models.TextChoices):
+        STARTED = 'STARTED', 'Started'
+        COMPLETED = 'COMPLETED', 'Completed'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exam_sessions')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='exam_sessions')
+    manifest = models.JSONField(default=dict)
+    variant_ids = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.STARTED)
+    completed_test = models.OneToOneField(CompletedTest, on_delete=models.SET_NULL, null=True, blank=True, related_name='exam_session')
+    started_at = models.DateTimeField(auto_now_add=True)
+    # Answers autosaved during the exam, in the same shape as `manifest`
+    answers = models.JSONField(default=dict, blank=True)
+    answers_saved_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"ExamSession for {self.user.username} - {self.product.title}"
+
+    class Meta:
+        verbose_name = 'Сессия экзамена'
+        verbose_name_plural = 'Сессии экзаменов'
+        indexes = [
+            models.Index(fields=['user', 'product', 'status']),
+        ]
+
+
+class StagedSubmission(models.Model):
+    """
+    A raw exam submission waiting to be graded by the grade_submissions worker.
+    `completed_test_id` is allocated at intake so the client can poll for the
+    CompletedTest before it exists.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        PROCESSING = 'PROCESSING', 'Processing'
+        DONE = 'DONE', 'Done'
+        FAILED = 'FAILED', 'Failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    completed_test_id = models.UUIDField(unique=True, default=uuid7, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='staged_submissions')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='staged_submissions')
+    session = models.ForeignKey(ExamSession, on_delete=models.SET_NULL, null=True, blank=True, related_name='staged_submissions')
+    payload = models.JSONField(default=list)
+    start_test_time = models.DateTimeField(null=True, blank=True)
+    submitted_at = models.DateTimeField()
+    time_spent = models.IntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    graded_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"StagedSubmission for {self.user.username} - {self.status}"
+
+    class Meta:
+        verbose_name = 'Отправка на проверку'
+        verbose_name_plural = 'Отправки на проверку'
+        indexes = [
+            models.Index(fields=['status', 'submitted_at']),
+        ]
+
+
+class IdempotencyRecord(models.Model):
+    """
+    First response to a request sent with an Idempotency-Key header, replayed
+    to retries of the same request (see idempotency.py).
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        DONE = 'DONE', 'Done'
+
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_records')
+    endpoint = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"IdempotencyRecord {self.endpoint} {self.key} for {self.user.username}"
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
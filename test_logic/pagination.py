@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CompletedTestCursorPagination(CursorPagination):
+    """
+    Newest attempts first; the cursor stays stable while new attempts are added.
+    The id breaks ties between attempts completed at the same time, so none is
+    skipped or repeated at a page edge.
+    """
+    ordering = ('-completed_date', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
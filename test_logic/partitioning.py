@@ -0,0 +1,256 @@
+"""
+Monthly range partitioning of the answer rows on PostgreSQL.
+
+CompletedQuestion gets ~80 rows per attempt and only ever grows; its rows are
+read per attempt, together with the attempt's completed_date. Partitioning it
+by month lets those reads touch a single partition, and old months can be
+detached instead of deleted row by row. CompletedTest stays a plain table:
+sessions, answer rows and the tests M2M point at it.
+
+convert_to_partitioned rebuilds a table as `PARTITION BY RANGE (column)`.
+PostgreSQL requires the primary key of a partitioned table to contain the
+partition column, so it becomes (id, column) and nothing can reference `id`
+directly any more. A plain <table>_key table holding every id takes its place:
+its primary key keeps ids unique, triggers add and remove its rows with the
+table's, and foreign keys into the table (the selected_option M2M) are moved
+onto it, so deleting an answer row still cannot leave rows pointing at it.
+Indexes and outgoing foreign keys are recreated, monthly partitions cover the
+existing rows and the next months, and a default partition catches the rest.
+
+Rolling it out takes three steps, none of them inside `migrate` itself:
+
+1. Migration 0015 adds the nullable completed_date column, which is instant.
+   Then backfill_completed_dates copies the dates onto the existing rows in
+   small batches while the site keeps serving.
+2. Migration 0019 makes the column NOT NULL. PostgreSQL checks every row for
+   that under an ACCESS EXCLUSIVE lock, so answer rows cannot be read or
+   written for the length of one sequential scan of the table.
+3. `create_partitions --convert` converts the table. It holds the same lock
+   while every row is copied into the partitions: plan a maintenance window,
+   as exam submissions and result pages wait for it to finish.
+
+From then on create_partitions runs from cron to add the upcoming months.
+If it was missed, rows of a month without a partition have gone to the
+default partition; they are moved into the month's partition when it is
+created, and create_partitions warns about any that are left there.
+"""
+from datetime import date, datetime, time
+
+from django.db import connection as default_connection, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import CompletedTest, CompletedQuestion
+
+# Tables partitioned by completed_date
+PARTITIONED_MODELS = [CompletedQuestion]
+PARTITION_COLUMN = 'completed_date'
+# Months of partitions kept ready, counting the current one
+DEFAULT_MONTHS = 3
+
+# pg_constraint.confdeltype
+DELETE_ACTIONS = {'a': 'NO ACTION', 'r': 'RESTRICT', 'c': 'CASCADE', 'n': 'SET NULL', 'd': 'SET DEFAULT'}
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def month_range(value):
+    """The [start, end) datetimes of the month `value` falls in."""
+    return datetime.combine(month_start(value), time()), datetime.combine(add_months(value, 1), time())
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year}_{month.month:02d}'
+
+
+def key_table_name(table):
+    return f'{table}_key'
+
+
+def default_partition_name(table):
+    return f'{table}_default'
+
+
+def is_partitioned(table, connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)',
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def create_month_partitions(table, start, months, column=PARTITION_COLUMN, connection=default_connection):
+    """
+    Create the monthly partitions of `table` for `months` months from `start`'s. Returns the new ones.
+
+    Rows that went to the default partition because their month had no
+    partition yet are moved into the new one. Must run inside a transaction.
+    """
+    qn = connection.ops.quote_name
+    default = default_partition_name(table)
+    created = []
+    month = month_start(start)
+    with connection.cursor() as cursor:
+        for _ in range(months):
+            name = partition_name(table, month)
+            bounds = [month, add_months(month, 1)]
+            cursor.execute('SELECT to_regclass(%s)', [name])
+            if cursor.fetchone()[0] is None:
+                # PostgreSQL refuses to add a partition while the default one holds rows of its range
+                cursor.execute(
+                    f'CREATE TEMPORARY TABLE partition_rows AS SELECT * FROM {qn(default)} '
+                    f'WHERE {qn(column)} >= %s AND {qn(column)} < %s',
+                    bounds
+                )
+                moved = cursor.rowcount
+                if moved:
+                    # Through the parent, so the key table trigger drops and re-adds their ids;
+                    # the foreign keys into the key table are deferred until commit
+                    cursor.execute(f'DELETE FROM {qn(table)} WHERE {qn(column)} >= %s AND {qn(column)} < %s', bounds)
+                cursor.execute(f'CREATE TABLE {qn(name)} PARTITION OF {qn(table)} FOR VALUES FROM (%s) TO (%s)', bounds)
+                if moved:
+                    cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM partition_rows')
+                cursor.execute('DROP TABLE partition_rows')
+                created.append(name)
+            month = add_months(month, 1)
+    return created
+
+
+def default_partition_range(table, column=PARTITION_COLUMN, connection=default_connection):
+    """(row count, oldest, newest) of the rows in the default partition of `table`."""
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT count(*), min({qn(column)}), max({qn(column)}) FROM {qn(default_partition_name(table))}'
+        )
+        return cursor.fetchone()
+
+
+def backfill_completed_dates(completed_test_ids):
+    """Copy the completion date of the given attempts onto their answer rows. Returns the number of rows updated."""
+    with transaction.atomic():
+        return CompletedQuestion.objects.filter(
+            completed_test_id__in=completed_test_ids, completed_date__isnull=True
+        ).update(
+            completed_date=Subquery(CompletedTest.objects.filter(id=OuterRef('completed_test_id')).values('completed_date')[:1])
+        )
+
+
+def inbound_foreign_keys(cursor, table):
+    """[(referencing table, constraint, [columns], delete action, deferrable clause)] of the foreign keys into `table`."""
+    cursor.execute(
+        'SELECT c.conrelid::regclass::text, c.conname, c.confdeltype, c.condeferrable, c.condeferred, '
+        '  ARRAY(SELECT a.attname FROM unnest(c.conkey) k JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k), '
+        '  ARRAY(SELECT a.attname FROM unnest(c.confkey) k JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k) '
+        "FROM pg_constraint c WHERE c.contype = 'f' AND c.confrelid = %s::regclass",
+        [table]
+    )
+    foreign_keys = []
+    for referencing_table, name, delete_type, deferrable, deferred, columns, referenced in cursor.fetchall():
+        if referenced != ['id']:
+            raise ValueError(f'{referencing_table}.{name} references {table}({", ".join(referenced)}), not its id')
+        if deferrable:
+            timing = 'DEFERRABLE INITIALLY DEFERRED' if deferred else 'DEFERRABLE INITIALLY IMMEDIATE'
+        else:
+            timing = 'NOT DEFERRABLE'
+        foreign_keys.append((referencing_table, name, columns, DELETE_ACTIONS[delete_type], timing))
+    return foreign_keys
+
+
+def convert_to_partitioned(table, column=PARTITION_COLUMN, months=DEFAULT_MONTHS, connection=default_connection):
+    """
+    Rebuild `table` as a table partitioned by month on `column`, with
+    partitions up to `months` months counting the current one (or the month
+    of the newest row, if later).
+
+    `column` must be NOT NULL. Must run inside a transaction; the table is
+    locked throughout.
+    """
+    if connection.vendor != 'postgresql':
+        raise NotImplementedError('Table partitioning is only supported on PostgreSQL')
+    if is_partitioned(table, connection):
+        return
+
+    qn = connection.ops.quote_name
+    old_table = f'{table}_unpartitioned'
+    key_table = key_table_name(table)
+    sync_function = f'{key_table}_sync'
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE')
+
+        # Every id moves to the key table, which the foreign keys into the table point at from now on
+        cursor.execute(f'CREATE TABLE {qn(key_table)} AS SELECT id FROM {qn(table)}')
+        cursor.execute(f'ALTER TABLE {qn(key_table)} ADD PRIMARY KEY (id)')
+        for referencing_table, name, columns, on_delete, timing in inbound_foreign_keys(cursor, table):
+            # regclass text comes quoted already where needed
+            cursor.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT {qn(name)}')
+            cursor.execute(
+                f'ALTER TABLE {referencing_table} ADD CONSTRAINT {qn(name)} '
+                f'FOREIGN KEY ({", ".join(qn(referencing_column) for referencing_column in columns)}) REFERENCES {qn(key_table)} (id) '
+                f'ON DELETE {on_delete} {timing}'
+            )
+
+        # Remember indexes and outgoing foreign keys before the old table goes away
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ('
+            "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u'))",
+            [table, table]
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' AND conrelid = %s::regclass",
+            [table]
+        )
+        outbound = cursor.fetchall()
+        cursor.execute(f'SELECT min({qn(column)}), max({qn(column)}) FROM {qn(table)}')
+        first, last = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(old_table)}')
+        cursor.execute(
+            f'CREATE TABLE {qn(table)} (LIKE {qn(old_table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+            f'PARTITION BY RANGE ({qn(column)})'
+        )
+        # Rows with a far-off date land in the default partition
+        cursor.execute(f'CREATE TABLE {qn(default_partition_name(table))} PARTITION OF {qn(table)} DEFAULT')
+
+    today = month_start(date.today())
+    start = month_start(first) if first is not None else today
+    newest = max(month_start(last), today) if last is not None else today
+    create_month_partitions(
+        table, start, (newest.year - start.year) * 12 + newest.month - start.month + months, column, connection
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {qn(table)} SELECT * FROM {qn(old_table)}')
+        cursor.execute(f'DROP TABLE {qn(old_table)}')
+
+        # The primary key has to include the partition column
+        cursor.execute(f'ALTER TABLE {qn(table)} ADD PRIMARY KEY (id, {qn(column)})')
+        for definition in index_definitions:
+            cursor.execute(definition)
+        for name, definition in outbound:
+            cursor.execute(f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}')
+
+        # From now on the key table follows the table row by row; a duplicate id fails on its primary key
+        cursor.execute(
+            f'CREATE FUNCTION {qn(sync_function)}() RETURNS trigger LANGUAGE plpgsql AS $$ '
+            'BEGIN '
+            f"  IF TG_OP IN ('DELETE', 'UPDATE') THEN DELETE FROM {qn(key_table)} WHERE id = OLD.id; END IF; "
+            f"  IF TG_OP IN ('INSERT', 'UPDATE') THEN INSERT INTO {qn(key_table)} (id) VALUES (NEW.id); END IF; "
+            '  RETURN NULL; '
+            'END $$'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER {qn(sync_function)} AFTER INSERT OR DELETE OR UPDATE OF id ON {qn(table)} '
+            f'FOR EACH ROW EXECUTE FUNCTION {qn(sync_function)}()'
+        )
+
@@ -0,0 +1,117 @@
+"""
+Cache of pre-rendered question JSON.
+
+Each entry holds the UTF-8 JSON of one question without its options, plus the
+JSON of every option, keyed by (question_id, content_version). Exam responses
+are assembled by splicing these bytes together in the per-student option
+order, so unchanged questions are never serialized twice. Editing a question
+or one of its options bumps its content_version, which makes the old entry
+unreachable; least recently used entries are evicted once the cache grows past
+QUESTION_FRAGMENT_CACHE_BYTES.
+"""
+import json
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+# Default memory budget for rendered fragments, in bytes
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+# Rough per-entry bookkeeping cost on top of the stored bytes
+ENTRY_OVERHEAD = 256
+
+QuestionFragment = namedtuple('QuestionFragment', ['head', 'options', 'option_ids'])
+
+
+def render_json(data):
+    # Same output as DRF's JSONRenderer
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def render_fragment(question):
+    """Turn a question dict (see exam_payload.load_questions) into a QuestionFragment."""
+    question = dict(question)
+    options = question.pop('options')
+    # Drop the closing brace so the options can be appended later
+    head = render_json(question)[:-1]
+    return QuestionFragment(
+        head,
+        [render_json(option) for option in options],
+        # Hex option IDs, recorded in the exam session manifest
+        [uuid.UUID(option['id']).hex for option in options],
+    )
+
+
+def splice_fragment(fragment, order):
+    """Return the question JSON with its options in `order` (a list of option positions)."""
+    options = b','.join(fragment.options[position] for position in order)
+    return b''.join((fragment.head, b',"options":[', options, b']}'))
+
+
+class FragmentCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def entry_size(fragment):
+        return len(fragment.head) + sum(len(option) + 32 for option in fragment.options) + ENTRY_OVERHEAD
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                fragment = self._entries.get(key)
+                if fragment is not None:
+                    self._entries.move_to_end(key)
+                    found[key] = fragment
+        return found
+
+    def set_many(self, fragments):
+        with self._lock:
+            for key, fragment in fragments.items():
+                previous = self._entries.pop(key, None)
+                if previous is not None:
+                    self.size -= self.entry_size(previous)
+                self._entries[key] = fragment
+                self.size += self.entry_size(fragment)
+
+            while self.size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self.entry_size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+fragment_cache = FragmentCache(getattr(settings, 'QUESTION_FRAGMENT_CACHE_BYTES', DEFAULT_CACHE_BYTES))
+
+
+def get_fragments(versions, load_questions):
+    """
+    Return {question_id: QuestionFragment} for `versions` ({question_id: content_version}).
+
+    Missing fragments are rendered from `load_questions(question_ids)`.
+    """
+    keys = {question_id: (question_id, version) for question_id, version in versions.items()}
+    cached = fragment_cache.get_many(keys.values())
+    fragments = {question_id: cached[key] for question_id, key in keys.items() if key in cached}
+
+    missing = [question_id for question_id in keys if question_id not in fragments]
+    if missing:
+        rendered = {
+            question_id: render_fragment(question)
+            for question_id, question in load_questions(missing).items()
+        }
+        fragment_cache.set_many({keys[question_id]: fragment for question_id, fragment in rendered.items()})
+        fragments.update(rendered)
+    return fragments
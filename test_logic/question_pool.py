@@ -0,0 +1,120 @@
+"""
+In-process index of every test's question bank.
+
+Exam assembly samples question IDs from these pools instead of scanning the
+Question table on every exam start. A pool is built with a single query the
+first time a test is requested and is dropped again when one of its questions
+or options changes (see signals.py). Other gunicorn workers do not receive
+those signals, so pools also expire after QUESTION_POOL_TTL seconds. Pools
+only drive which questions are picked; the content versions that rendered
+questions are cached under are read from the database on every exam start.
+"""
+import threading
+import time
+from collections import defaultdict, namedtuple
+from random import sample
+
+from django.conf import settings
+
+from .models import Question
+
+# Default lifetime of a pool in seconds
+DEFAULT_POOL_TTL = 300
+
+PoolEntry = namedtuple('PoolEntry', ['id', 'task_type', 'level', 'theme', 'source_id'])
+
+_pools = {}
+_lock = threading.Lock()
+
+
+class QuestionPool:
+    """All questions of one test, bucketed by task_type and by source text."""
+
+    def __init__(self, test_id, entries):
+        self.test_id = test_id
+        self.entries = entries
+        self.built_at = time.monotonic()
+
+        # task_type -> [entries]
+        self.by_task_type = defaultdict(list)
+        # task_type -> source_id -> [entries]
+        self.source_groups = defaultdict(lambda: defaultdict(list))
+
+        for entry in entries:
+            self.by_task_type[entry.task_type].append(entry)
+            if entry.source_id is not None:
+                self.source_groups[entry.task_type][entry.source_id].append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_expired(self, ttl):
+        return time.monotonic() - self.built_at > ttl
+
+    def question_ids(self):
+        return [entry.id for entry in self.entries]
+
+    def sample_ids(self, count, exclude=()):
+        """Return up to `count` random question IDs that are not in `exclude`."""
+        candidates = [entry.id for entry in self.entries if entry.id not in exclude] if exclude else self.question_ids()
+        return sample(candidates, min(count, len(candidates)))
+
+
+def build_question_pools(test_ids):
+    # One indexed scan over the tests' questions, only the columns we bucket on
+    entries = {test_id: [] for test_id in test_ids}
+    rows = Question.objects.filter(test_id__in=test_ids).values_list(
+        'test_id', 'id', 'task_type', 'level', 'theme', 'source_text_id'
+    )
+    for test_id, *row in rows:
+        entries[test_id].append(PoolEntry(*row))
+    return {test_id: QuestionPool(test_id, test_entries) for test_id, test_entries in entries.items()}
+
+
+def build_question_pool(test_id):
+    return build_question_pools([test_id])[test_id]
+
+
+def get_question_pool(test_id):
+    ttl = getattr(settings, 'QUESTION_POOL_TTL', DEFAULT_POOL_TTL)
+    pool = _pools.get(test_id)
+    if pool is not None and not pool.is_expired(ttl):
+        return pool
+
+    with _lock:
+        # Another thread may have rebuilt the pool while we were waiting
+        pool = _pools.get(test_id)
+        if pool is None or pool.is_expired(ttl):
+            pool = build_question_pool(test_id)
+            _pools[test_id] = pool
+    return pool
+
+
+def get_question_pools(test_ids):
+    """Return {test_id: pool}, building every missing pool with a single query."""
+    ttl = getattr(settings, 'QUESTION_POOL_TTL', DEFAULT_POOL_TTL)
+    pools = {}
+    missing = []
+    for test_id in test_ids:
+        pool = _pools.get(test_id)
+        if pool is not None and not pool.is_expired(ttl):
+            pools[test_id] = pool
+        else:
+            missing.append(test_id)
+
+    if missing:
+        built = build_question_pools(missing)
+        with _lock:
+            _pools.update(built)
+        pools.update(built)
+    return pools
+
+
+def invalidate_question_pool(test_id):
+    with _lock:
+        _pools.pop(test_id, None)
+
+
+def clear_question_pools():
+    with _lock:
+        _pools.clear()
@@ -0,0 +1,55 @@
+"""
+Stored result documents for get_completed_test_by_id.
+
+The result of an attempt never changes once it is graded, so the
+CCompletedTestSerializer output is rendered once, compressed with zlib and
+kept on the CompletedTest. The detail endpoint sends those bytes as they are.
+Attempts without a snapshot, or with one from an older SNAPSHOT_VERSION, are
+serialized on request and the snapshot is stored then. Bump SNAPSHOT_VERSION
+whenever the serializers change the document and run
+rebuild_result_snapshots.
+"""
+import logging
+import zlib
+
+from rest_framework.renderers import JSONRenderer
+
+from .models import CompletedTest
+from .serializers import CCompletedTestSerializer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def render_result(completed_test):
+    serializer = CCompletedTestSerializer(completed_test, context={'completed_test': completed_test})
+    return JSONRenderer().render(serializer.data)
+
+
+def store_snapshot(completed_test):
+    """Render the result document of `completed_test`, store it compressed and return the JSON bytes."""
+    document = render_result(completed_test)
+    CompletedTest.objects.filter(id=completed_test.id).update(
+        result_snapshot=zlib.compress(document),
+        snapshot_version=SNAPSHOT_VERSION,
+    )
+    return document
+
+
+def store_snapshot_quietly(completed_test):
+    # The snapshot is only a cache; failing to build it must not fail grading
+    try:
+        store_snapshot(completed_test)
+    except Exception:
+        logger.exception(f"Failed to store the result snapshot of completed test {completed_test.id}")
+
+
+def load_snapshot(completed_test_id, user):
+    """Return the stored JSON bytes for the user's attempt, or None if it has no current snapshot."""
+    row = CompletedTest.objects.filter(
+        id=completed_test_id, user=user, snapshot_version=SNAPSHOT_VERSION
+    ).values_list('result_snapshot', flat=True).first()
+    if row is None:
+        return None
+    return zlib.decompress(bytes(row))
@@ -0,0 +1,128 @@
+"""
+Stored scores of completed attempts.
+
+Grading writes CompletedQuestion.is_correct and the CompletedTest counters
+(correct_count, total_count and per-test test_scores) once, so result and
+statistics views read numbers instead of joining selected options. Attempts
+stored before these columns existed have them NULL until the backfill_scores
+command reaches them; readers fall back to compute_scores meanwhile.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from .models import CompletedTest, CompletedQuestion
+from .answer_keys import get_answer_key
+
+
+def add_score(test_scores, test_id, is_correct):
+    score = test_scores.setdefault(str(test_id), {'correct': 0, 'total': 0})
+    score['correct'] += bool(is_correct)
+    score['total'] += 1
+
+
+def compute_scores(completed_test_ids):
+    """
+    Grade stored attempts from their selected options against the cached
+    answer keys, in one query that does not touch the Option table (plus the
+    version check of each product's key).
+
+    Returns {completed_test_id: test_scores}.
+    """
+    # One row per selected option; questions without a selection come with None
+    rows = CompletedQuestion.objects.filter(
+        completed_test_id__in=completed_test_ids
+    ).values_list('id', 'completed_test_id', 'completed_test__product_id', 'test_id', 'question_id', 'selected_option')
+
+    questions = {}
+    for completed_question_id, completed_test_id, product_id, test_id, question_id, option_id in rows:
+        question = questions.setdefault(completed_question_id, (completed_test_id, product_id, test_id, question_id, []))
+        if option_id is not None:
+            question[4].append(option_id)
+
+    answer_keys = {}
+    scores = defaultdict(dict)
+    for completed_test_id, product_id, test_id, question_id, option_ids in questions.values():
+        if product_id not in answer_keys:
+            answer_keys[product_id] = get_answer_key(product_id)
+        is_correct = answer_keys[product_id].is_correct(question_id, option_ids)
+        add_score(scores[completed_test_id], test_id, is_correct)
+    return scores
+
+
+def totals(test_scores):
+    """Return (correct, total) over all tests of an attempt."""
+    correct = sum(score['correct'] for score in test_scores.values())
+    total = sum(score['total'] for score in test_scores.values())
+    return correct, total
+
+
+def get_test_scores(completed_test):
+    """Return {test_id: {'correct', 'total'}} for an attempt, computing it if not stored yet."""
+    if completed_test.test_scores is not None:
+        return completed_test.test_scores
+
+    # Keep the computed scores on the instance so serializers compute them once
+    if not hasattr(completed_test, '_computed_test_scores'):
+        scores = compute_scores([completed_test.id])
+        completed_test._computed_test_scores = scores.get(completed_test.id, {})
+    return completed_test._computed_test_scores
+
+
+def get_scores_for(completed_tests):
+    """Return {completed_test_id: test_scores} for many attempts, with at most one query."""
+    scores = {}
+    missing = []
+    for completed_test in completed_tests:
+        if completed_test.test_scores is not None:
+            scores[completed_test.id] = completed_test.test_scores
+        else:
+            missing.append(completed_test.id)
+
+    if missing:
+        computed = compute_scores(missing)
+        for completed_test_id in missing:
+            scores[completed_test_id] = computed.get(completed_test_id, {})
+    return scores
+
+
+def backfill_scores(completed_test_ids):
+    """
+    Store the score columns for the given attempts. Returns the number updated.
+
+    is_correct is set from the selected options in the database, and the
+    counters are then summed from is_correct, so both come from one source.
+    """
+    with transaction.atomic():
+        completed_questions = CompletedQuestion.objects.filter(completed_test_id__in=completed_test_ids)
+        # One set-based UPDATE instead of one per question
+        completed_questions.update(
+            is_correct=Exists(
+                CompletedQuestion.selected_option.through.objects.filter(
+                    completedquestion_id=OuterRef('pk'),
+                    option__is_correct=True,
+                )
+            )
+        )
+
+        scores = defaultdict(dict)
+        rows = completed_questions.order_by().values('completed_test_id', 'test_id').annotate(
+            correct=Count('id', filter=Q(is_correct=True)),
+            total=Count('id'),
+        )
+        for row in rows:
+            scores[row['completed_test_id']][str(row['test_id'])] = {'correct': row['correct'], 'total': row['total']}
+
+        completed_tests = []
+        for completed_test_id in completed_test_ids:
+            test_scores = scores.get(completed_test_id, {})
+            correct, total = totals(test_scores)
+            completed_tests.append(CompletedTest(
+                id=completed_test_id,
+                correct_count=correct,
+                total_count=total,
+                test_scores=test_scores,
+            ))
+        CompletedTest.objects.bulk_update(completed_tests, ['correct_count', 'total_count', 'test_scores'])
+    return len(completed_tests)
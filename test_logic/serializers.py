@@ -1,10 +1,14 @@
-from random import sample, shuffle
+from random import shuffle
 from rest_framework import serializers
 from .models import Product, Test, Question, Option, Result, BookSuggestion, CompletedTest, CompletedQuestion
 from accounts.models import User
 from accounts.serializers import UserSerializer
 from django.db.models import Q
 from django.db.models import Count
+from .question_pool import get_question_pool
+from .exam_blueprint import assemble_exam, get_blueprint_slots
+from .scoring import get_test_scores, totals
+from .answer_storage import get_completed_questions
 
 # new
 class CurrentOptionSerializer(serializers.ModelSerializer):
@@ -37,80 +41,21 @@ class CurrentTestSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'questions']
 
     def get_questions(self, obj):
-        # Fetch all questions related to the test as a queryset
-        all_questions = Question.objects.filter(test=obj)
-        
         # Check if the user is an admin
         request = self.context.get('request')
         if request and request.user.is_authenticated and request.user.is_staff:
             # For admin users, return all questions without filtering
+            all_questions = Question.objects.filter(test=obj).select_related('source_text')
             return CurrentQuestionSerializer(all_questions, many=True).data
 
-        # If the number of questions is not 40, return a random selection
-        if obj.number_of_questions != 40:
-            selected_questions = sample(list(all_questions), min(obj.number_of_questions, all_questions.count()))
-            return CurrentQuestionSerializer(selected_questions, many=True).data
-
-        # Initialize lists for selected questions
-        selected_questions = []
-
-        # Step 1: Select 25 questions (1–25) with any task_type except 10, 8, and 6
-        questions_1_to_25 = list(all_questions.exclude(task_type__in=[10, 8, 6])[:25])
-        selected_questions.extend(questions_1_to_25)
-
-        # Step 2: Select 5 questions (26–30) with task_type=10
-        questions_task_type_10 = list(all_questions.filter(task_type=10))
-        
-        # Group questions by source_id
-        source_groups = {}
-        for q in questions_task_type_10:
-            if q.source_text:
-                id = q.source_text
-                if id not in source_groups:
-                    source_groups[id] = []
-                source_groups[id].append(q)
-
-        # Select a group of 5 questions with the same source_id if available
-        selected_source_questions = []
-        for source_questions in source_groups.values():
-            if len(source_questions) >= 5:
-                selected_source_questions = sample(source_questions, 5)
-                break
-
-        # If no group of 5 found, take random questions
-        if not selected_source_questions:
-            selected_source_questions = sample(questions_task_type_10, min(5, len(questions_task_type_10)))
-        
-        selected_questions.extend(selected_source_questions)
-
-        # Step 3: Select 5 questions (31–35) with task_type=8
-        questions_task_type_8 = list(all_questions.filter(task_type=8)[:5])
-        selected_questions.extend(questions_task_type_8)
-
-        # If there are not enough questions with task_type=8, fill the gaps with random questions
-        if len(questions_task_type_8) < 5:
-            remaining_questions = all_questions.exclude(id__in=[q.id for q in selected_questions])
-            additional_questions = sample(list(remaining_questions), min(5 - len(questions_task_type_8), remaining_questions.count()))
-            selected_questions.extend(additional_questions)
-
-        # Step 4: Select 5 questions (36–40) with task_type=6
-        questions_task_type_6 = list(all_questions.filter(task_type=6)[:5])
-        selected_questions.extend(questions_task_type_6)
-
-        # If there are not enough questions with task_type=6, fill the gaps with random questions
-        if len(questions_task_type_6) < 5:
-            remaining_questions = all_questions.exclude(id__in=[q.id for q in selected_questions])
-            additional_questions = sample(list(remaining_questions), min(5 - len(questions_task_type_6), remaining_questions.count()))
-            selected_questions.extend(additional_questions)
-
-        # Step 5: Ensure the list has exactly 40 questions
-        if len(selected_questions) < 40:
-            remaining_questions = all_questions.exclude(id__in=[q.id for q in selected_questions])
-            additional_questions = sample(list(remaining_questions), min(40 - len(selected_questions), remaining_questions.count()))
-            selected_questions.extend(additional_questions)
+        # Fill the test's blueprint from the in-memory pool, then load only the chosen rows
+        pool = get_question_pool(obj.id)
+        selected_ids = assemble_exam(pool, get_blueprint_slots(obj))
+        questions = Question.objects.select_related('source_text').in_bulk(selected_ids)
+        selected_questions = [questions[question_id] for question_id in selected_ids if question_id in questions]
 
         # Serialize and return the selected questions
-        return CurrentQuestionSerializer(selected_questions[:40], many=True).data
+        return CurrentQuestionSerializer(selected_questions, many=True).data
 
 class CurrentProductSerializer(serializers.ModelSerializer):
     tests = CurrentTestSerializer(many=True)
@@ -197,11 +142,18 @@ class CompletedTestSerializer(serializers.ModelSerializer):
 
     # Method to calculate correct answers for the specific test
     def get_correct_answers_count(self, obj):
+        # Annotated by get_all_completed_tests for the whole list in one query
+        if getattr(obj, 'correct_answers', None) is not None:
+            return obj.correct_answers
+        if obj.correct_count is not None:
+            return obj.correct_count
         # Count questions where at least one selected option is correct
         return obj.completed_questions.filter(selected_option__is_correct=True).distinct().count()
 
     # Method to calculate incorrect answers for the specific test
     def get_incorrect_answers_count(self, obj):
+        if obj.correct_count is not None:
+            return obj.total_count - obj.correct_count
         # Count questions where no selected option is correct or no option is selected
         return obj.completed_questions.annotate(
             correct_options=Count('selected_option', filter=Q(selected_option__is_correct=True))
@@ -209,6 +161,8 @@ class CompletedTestSerializer(serializers.ModelSerializer):
 
     # Method to calculate total questions for the specific test
     def get_total_question_count(self, obj):
+        if obj.total_count is not None:
+            return obj.total_count
         return obj.completed_questions.count()
 
     # Method to return subjects with correct/incorrect counts for specific subjects
@@ -227,6 +181,26 @@ class CompletedTestSerializer(serializers.ModelSerializer):
 
 
 
+# Lightweight item for history list screens; expects the annotations of get_all_completed_tests
+class CompletedTestSummarySerializer(serializers.ModelSerializer):
+    product_title = serializers.CharField(source='product.title', read_only=True)
+    correct_answers_count = serializers.IntegerField(source='correct_answers', read_only=True)
+    total_question_count = serializers.IntegerField(source='total_questions', read_only=True)
+
+    class Meta:
+        model = CompletedTest
+        fields = [
+            'id',
+            'product',
+            'product_title',
+            'completed_date',
+            'time_spent',
+            'correct_answers_count',
+            'total_question_count'
+        ]
+
+
+
 # old
 # class QuestionSerializer(serializers.ModelSerializer):
 #     test = serializers.PrimaryKeyRelatedField(queryset=Test.objects.all())
@@ -328,21 +302,19 @@ class CTestSerializer(serializers.ModelSerializer):
 
     # Custom method to retrieve questions and their selected options for the test
     def get_questions(self, obj):
-        completed_questions = CompletedQuestion.objects.filter(test=obj, completed_test=self.context.get('completed_test'))
+        completed_questions = get_completed_questions(self.context.get('completed_test'), test_id=obj.id)
         return QuestionSerializer(completed_questions, many=True).data
 
     # Custom method to calculate total correct answers for the test
     def get_total_correct_by_test(self, obj):
-        completed_questions = CompletedQuestion.objects.filter(test=obj, completed_test=self.context.get('completed_test'))
-        return completed_questions.filter(selected_option__is_correct=True).count()
+        test_scores = get_test_scores(self.context.get('completed_test'))
+        return test_scores.get(str(obj.id), {}).get('correct', 0)
 
     # Custom method to calculate total incorrect answers for the test
     def get_total_incorrect_by_test(self, obj):
-        completed_test = self.context.get('completed_test')
-        # Retrieve completed questions for the given test
-        completed_questions = CompletedQuestion.objects.filter(test=obj, completed_test=completed_test)
-        # Filter for incorrect answers where selected_option__is_correct is either False or Null
-        return completed_questions.filter(Q(selected_option__is_correct=False) | Q(selected_option__is_correct__isnull=True)).count()
+        test_scores = get_test_scores(self.context.get('completed_test'))
+        score = test_scores.get(str(obj.id), {'correct': 0, 'total': 0})
+        return score['total'] - score['correct']
     
 # Serializer for products
 class CProductSerializer(serializers.ModelSerializer):
@@ -362,23 +334,17 @@ class CProductSerializer(serializers.ModelSerializer):
 
     # Custom method to calculate total correct answers across all tests
     def get_total_correct_by_all_tests(self, obj):
-        completed_test = self.context.get('completed_test')
-        return CompletedQuestion.objects.filter(completed_test=completed_test, selected_option__is_correct=True).count()
+        correct, _ = totals(get_test_scores(self.context.get('completed_test')))
+        return correct
 
     # Custom method to calculate total incorrect answers across all tests
     def get_total_incorrect_by_all_tests(self, obj):
-        completed_test = self.context.get('completed_test')
-        # Filter for incorrect answers where selected_option__is_correct is either False or Null
-        return CompletedQuestion.objects.filter(
-            completed_test=completed_test
-        ).filter(
-            Q(selected_option__is_correct=False) | Q(selected_option__is_correct__isnull=True)
-        ).count()
+        correct, total = totals(get_test_scores(self.context.get('completed_test')))
+        return total - correct
     
     def get_total_question_count_by_all_tests(self, obj):
-        completed_test = self.context.get('completed_test')
-        # Count the total number of completed questions for this test
-        return CompletedQuestion.objects.filter(completed_test=completed_test).count()
+        _, total = totals(get_test_scores(self.context.get('completed_test')))
+        return total
 
 # Serializer for the completed test
 class CCompletedTestSerializer(serializers.ModelSerializer):
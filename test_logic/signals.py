@@ -0,0 +1,64 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import Signal, receiver
+
+from .models import Product, Question, Option, Source, ExamBlueprint
+from .question_pool import invalidate_question_pool
+from .exam_blueprint import clear_blueprint_cache
+
+# Sent with `completed_test` inside the transaction storing a graded attempt,
+# so what receivers write commits or rolls back together with the attempt
+attempt_graded = Signal()
+
+
+@receiver(post_save, sender=Question)
+def bump_question_version(sender, instance, created, **kwargs):
+    # Rendered question fragments are keyed by this version, so it is only ever bumped in the database;
+    # a version computed from a stale instance could repeat one an option change already used
+    if not created:
+        Question.objects.filter(id=instance.id).update(content_version=F('content_version') + 1)
+        instance.refresh_from_db(fields=['content_version'])
+
+
+@receiver(pre_save, sender=Question)
+def remember_previous_test(sender, instance, **kwargs):
+    # A question moved to another test leaves the old test's pool and product's answer key stale too
+    if not instance._state.adding:
+        instance._previous_test_id = Question.objects.filter(id=instance.id).values_list('test_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    test_ids = {instance.test_id, getattr(instance, '_previous_test_id', None)} - {None}
+    for test_id in test_ids:
+        invalidate_question_pool(test_id)
+    # A question added to, moved out of or deleted from a product changes its answer key
+    Product.objects.filter(test__in=test_ids).update(answer_key_version=F('answer_key_version') + 1)
+
+
+@receiver([post_save, post_delete], sender=Option)
+def option_changed(sender, instance, **kwargs):
+    Question.objects.filter(id=instance.question_id).update(content_version=F('content_version') + 1)
+    # The option's question may already be gone when it is deleted in cascade
+    row = Question.objects.filter(id=instance.question_id).values_list('test_id', 'test__product_id').first()
+    if row is not None:
+        test_id, product_id = row
+        invalidate_question_pool(test_id)
+        # Every process checks this before grading with its cached answer key
+        Product.objects.filter(id=product_id).update(answer_key_version=F('answer_key_version') + 1)
+
+
+@receiver(post_save, sender=Source)
+def source_changed(sender, instance, **kwargs):
+    # The source text is part of every rendered question that uses it
+    questions = Question.objects.filter(source_text=instance)
+    test_ids = set(questions.values_list('test_id', flat=True))
+    if test_ids:
+        questions.update(content_version=F('content_version') + 1)
+        for test_id in test_ids:
+            invalidate_question_pool(test_id)
+
+
+@receiver([post_save, post_delete], sender=ExamBlueprint)
+def blueprint_changed(sender, instance, **kwargs):
+    clear_blueprint_cache()
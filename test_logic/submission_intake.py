@@ -0,0 +1,108 @@
+"""
+Asynchronous submission intake.
+
+In async mode complete_test_view only stores the raw payload as a
+StagedSubmission and answers 202 straight away. The grade_submissions command
+runs a pool of worker processes that claim pending submissions in batches and
+grade them into CompletedTest/CompletedQuestion with the same code as the
+synchronous path.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .exam_sessions import SubmissionError, session_answers
+from .grading import resolve_submission, save_completed_test
+from .models import CompletedTest, StagedSubmission
+
+logger = logging.getLogger(__name__)
+
+# Submissions that hit an unexpected error are retried this many times
+MAX_ATTEMPTS = 3
+
+
+def stage_submission(user, product, tests_data, session=None, start_test_time=None, submitted_at=None, time_spent=None):
+    return StagedSubmission.objects.create(
+        user=user,
+        product=product,
+        session=session,
+        payload=tests_data,
+        start_test_time=start_test_time,
+        submitted_at=submitted_at or now(),
+        time_spent=time_spent,
+    )
+
+
+def claim_batch(batch_size, reclaim_after=timedelta(minutes=10)):
+    """Mark up to `batch_size` pending submissions as processing and return them."""
+    # Submissions left in processing by a crashed worker are picked up again
+    stale = Q(status=StagedSubmission.Status.PROCESSING, claimed_at__lt=now() - reclaim_after)
+    with transaction.atomic():
+        ids = list(
+            StagedSubmission.objects.select_for_update(skip_locked=True).filter(
+                Q(status=StagedSubmission.Status.PENDING) | stale
+            ).order_by('submitted_at').values_list('id', flat=True)[:batch_size]
+        )
+        StagedSubmission.objects.filter(id__in=ids).update(
+            status=StagedSubmission.Status.PROCESSING,
+            claimed_at=now(),
+            attempts=F('attempts') + 1,
+        )
+    return list(StagedSubmission.objects.select_related('user', 'product', 'session').filter(id__in=ids))
+
+
+def grade_staged_submission(staged):
+    # A previous attempt may have stored the attempt and died before marking it done
+    if not CompletedTest.objects.filter(id=staged.completed_test_id).exists():
+        if not grade_into_completed_test(staged):
+            return False
+
+    staged.status = StagedSubmission.Status.DONE
+    staged.graded_at = now()
+    staged.error = ''
+    staged.save(update_fields=['status', 'graded_at', 'error'])
+    return True
+
+
+def grade_into_completed_test(staged):
+    try:
+        if staged.session is not None:
+            answers = session_answers(staged.session, staged.payload)
+        else:
+            answers = resolve_submission(staged.product, staged.payload)
+    except SubmissionError as e:
+        staged.status = StagedSubmission.Status.FAILED
+        staged.error = str(e)
+        staged.save(update_fields=['status', 'error'])
+        return False
+
+    try:
+        save_completed_test(
+            staged.user,
+            staged.product,
+            answers,
+            session=staged.session,
+            id=staged.completed_test_id,
+            start_test_time=staged.start_test_time or staged.submitted_at,
+            time_spent=staged.time_spent,
+            # The time the student actually submitted, not when the worker got to it
+            completed_date=staged.submitted_at,
+        )
+    except Exception as e:
+        logger.exception(f"Failed to grade staged submission {staged.id}")
+        staged.status = StagedSubmission.Status.PENDING if staged.attempts < MAX_ATTEMPTS else StagedSubmission.Status.FAILED
+        staged.error = str(e)
+        staged.save(update_fields=['status', 'error'])
+        return False
+
+    return True
+
+
+def process_batch(batch_size):
+    """Claim and grade one batch; returns (claimed, graded)."""
+    batch = claim_batch(batch_size)
+    graded = sum(grade_staged_submission(staged) for staged in batch)
+    return len(batch), graded
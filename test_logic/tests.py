@@ -1,3 +1,973 @@
-from django.test import TestCase
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from accounts.models import User
+
+from . import answer_keys, question_pool, result_snapshots
+from .answer_keys import clear_answer_keys, get_answer_key
+from .answer_storage import PACKED, PackedQuestion, get_completed_questions, pack_completed_tests, unpack_completed_tests
+from .exam_blueprint import assemble_exam, clear_blueprint_cache, get_blueprint_slots
+from .exam_payload import build_exam_payload
+from .exam_variants import issued_counts, pick_variants
+from .grading import resolve_submission, save_completed_test
+from .idempotency import idempotent
+from .ids import uuid7
+from .models import (
+    Product, Test, Source, Question, Option, CompletedTest, CompletedQuestion, ExamBlueprint, ExamSession,
+    ExamVariant, StagedSubmission, IdempotencyRecord,
+)
+from .partitioning import (
+    add_months, convert_to_partitioned, create_month_partitions, default_partition_name, partition_name,
+)
+from .question_fragments import fragment_cache
+from .question_pool import build_question_pool, clear_question_pools, get_question_pool
+from .scoring import backfill_scores
+from .serializers import CurrentTestSerializer
+from .submission_intake import MAX_ATTEMPTS, claim_batch, process_batch, stage_submission
+
+
+class ExamPayloadTests(TestCase):
+
+    def setUp(self):
+        clear_question_pools()
+        clear_blueprint_cache()
+        fragment_cache.clear()
+        self.product = Product.objects.create(title='ENT')
+        self.source = Source.objects.create(text='Reading passage')
+
+    def create_test(self, number_of_questions, question_count):
+        test = Test.objects.create(title='Subject', product=self.product, number_of_questions=number_of_questions)
+        for i in range(question_count):
+            task_type = [1, 10, 8, 6][i % 4]
+            question = Question.objects.create(
+                test=test,
+                text=f'Question {i}',
+                task_type=task_type,
+                source_text=self.source if task_type == 10 else None,
+            )
+            Option.objects.bulk_create([
+                Option(question=question, text=f'Option {j}', is_correct=j == 0) for j in range(4)
+            ])
+        return test
+
+    def test_query_count_does_not_depend_on_question_count(self):
+        tests = [self.create_test(40, 60), self.create_test(15, 20)]
+        clear_question_pools()
+        clear_blueprint_cache()
+        fragment_cache.clear()
+
+        # Pools, blueprints, content versions, questions with source texts, options
+        with self.assertNumQueries(5):
+            build_exam_payload(tests)
+
+        tests += [self.create_test(40, 120) for _ in range(3)]
+        clear_question_pools()
+        clear_blueprint_cache()
+        fragment_cache.clear()
+
+        with self.assertNumQueries(5):
+            payload = build_exam_payload(tests)
+
+        self.assertEqual([len(test['questions']) for test in payload], [40, 15, 40, 40, 40])
+
+        # Once every question of the bank is rendered, exams only read the content versions
+        build_exam_payload(tests, include_all=True)
+        with self.assertNumQueries(1):
+            build_exam_payload(tests)
+
+        # Warm pools and blueprints leave the version, question and option loads
+        fragment_cache.clear()
+        with self.assertNumQueries(3):
+            build_exam_payload(tests)
+
+    def test_payload_matches_serializer_shape(self):
+        test = self.create_test(40, 100)
+
+        payload = build_exam_payload([test])[0]
+        serialized = CurrentTestSerializer(test).data
+
+        self.assertEqual(set(payload), set(serialized))
+        self.assertEqual(len(payload['questions']), len(serialized['questions']))
+
+        by_task_type = {question['task_type']: question for question in serialized['questions']}
+        for question in payload['questions']:
+            expected = by_task_type[question['task_type']]
+            self.assertEqual(set(question), set(expected))
+            self.assertEqual(len(question['options']), 4)
+            self.assertEqual(set(question['options'][0]), {'id', 'text', 'img'})
+
+        reading = [question for question in payload['questions'] if question['task_type'] == 10]
+        self.assertEqual(len(reading), 5)
+        self.assertTrue(all(question['source_text'] == 'Reading passage' for question in reading))
+
+    def test_edited_question_is_rendered_again(self):
+        test = self.create_test(15, 15)
+        build_exam_payload([test])
+
+        question = Question.objects.filter(test=test).first()
+        question.text = 'Edited question'
+        question.save()
+
+        texts = {item['id']: item['text'] for item in build_exam_payload([test])[0]['questions']}
+        self.assertEqual(texts[str(question.id)], 'Edited question')
+
+    def test_question_edited_in_another_process_is_rendered_again(self):
+        test = self.create_test(15, 15)
+        build_exam_payload([test])
+
+        # No signal reaches this process's pool, only the database changes
+        question = Question.objects.filter(test=test).first()
+        Question.objects.filter(id=question.id).update(text='Edited elsewhere', content_version=F('content_version') + 1)
+
+        texts = {item['id']: item['text'] for item in build_exam_payload([test])[0]['questions']}
+        self.assertEqual(texts[str(question.id)], 'Edited elsewhere')
+
+    def test_stale_question_save_does_not_reuse_a_version(self):
+        test = self.create_test(15, 15)
+        question = Question.objects.filter(test=test).first()
+        stale = Question.objects.get(id=question.id)
+
+        option = question.options.first()
+        option.text = 'Edited option'
+        option.save()
+        used = {question.content_version, Question.objects.get(id=question.id).content_version}
+
+        stale.text = 'Edited question'
+        stale.save()
+
+        self.assertNotIn(stale.content_version, used)
+        self.assertEqual(Question.objects.get(id=question.id).content_version, stale.content_version)
+
+
+class ExamBlueprintTests(TestCase):
+
+    def setUp(self):
+        clear_question_pools()
+        clear_blueprint_cache()
+        self.product = Product.objects.create(title='ENT')
+        self.test = Test.objects.create(title='Subject', product=self.product, number_of_questions=40)
+
+    def create_questions(self, count, task_type, level=None, source=None):
+        return [
+            Question.objects.create(test=self.test, text='Question', task_type=task_type, level=level, source_text=source)
+            for _ in range(count)
+        ]
+
+    def assemble(self, slots=None):
+        if slots is not None:
+            ExamBlueprint.objects.create(product=self.product, slots=slots)
+        question_ids = assemble_exam(build_question_pool(self.test.id), get_blueprint_slots(self.test), random.Random(7))
+        self.assertEqual(len(question_ids), len(set(question_ids)))
+        questions = Question.objects.in_bulk(question_ids)
+        return [questions[question_id] for question_id in question_ids]
+
+    def test_slots_are_filled_in_order(self):
+        self.create_questions(3, task_type=1, level=1)
+        self.create_questions(3, task_type=1, level=2)
+        self.create_questions(4, task_type=8)
+
+        questions = self.assemble([{'count': 2, 'task_types': [1], 'levels': [2]}, {'count': 3, 'task_types': [8]}])
+
+        self.assertEqual([(question.task_type, question.level) for question in questions], [(1, 2)] * 2 + [(8, None)] * 3)
+
+    def test_source_group_is_taken_whole_and_not_reused(self):
+        first = Source.objects.create(text='First passage')
+        second = Source.objects.create(text='Second passage')
+        self.create_questions(3, task_type=10, source=first)
+        # Too few questions to make up a group
+        self.create_questions(2, task_type=10, source=second)
+        self.create_questions(2, task_type=1)
+
+        questions = self.assemble([{'count': 3, 'task_types': [10], 'source_group': 3}, {'count': 10}])
+
+        self.assertEqual({question.source_text_id for question in questions[:3]}, {first.id})
+        self.assertEqual(len(questions), 7)
+        self.assertEqual(sum(question.source_text_id == first.id for question in questions), 3)
+
+    def test_short_slot_is_topped_up_with_leftovers(self):
+        self.create_questions(1, task_type=8)
+        self.create_questions(4, task_type=1)
+        self.create_questions(1, task_type=6)
+
+        questions = self.assemble([{'count': 3, 'task_types': [8]}, {'count': 2, 'task_types': [6], 'fallback': False}])
+
+        self.assertEqual([question.task_type for question in questions], [8, 1, 1, 6])
+
+    def test_tests_without_blueprint_use_the_ent_layout(self):
+        source = Source.objects.create(text='Reading passage')
+        self.create_questions(30, task_type=1)
+        self.create_questions(6, task_type=10, source=source)
+        self.create_questions(6, task_type=8)
+        self.create_questions(6, task_type=6)
+
+        questions = self.assemble()
+
+        self.assertEqual([question.task_type for question in questions], [1] * 25 + [10] * 5 + [8] * 5 + [6] * 5)
+
+        self.test.number_of_questions = 15
+        self.test.save()
+        clear_blueprint_cache()
+        self.assertEqual(len(self.assemble()), 15)
+
+
+class ExamFixture:
+    """A product with two tests of three questions, each with one correct option out of four, and a student."""
+
+    def create_exam(self):
+        clear_answer_keys()
+        self.product = Product.objects.create(title='ENT')
+        self.tests = [Test.objects.create(title=f'Subject {i}', product=self.product) for i in range(2)]
+        # question -> (correct option, wrong option)
+        self.options = {}
+        for test in self.tests:
+            for i in range(3):
+                question = Question.objects.create(test=test, text=f'Question {i}', task_type=1)
+                options = Option.objects.bulk_create([
+                    Option(question=question, text=f'Option {j}', is_correct=j == 0) for j in range(4)
+                ])
+                self.options[question] = (options[0], options[1])
+        self.user = User.objects.create_user(username='student', password='pw', first_name='Aru', last_name='Sultan')
+
+    def create_session(self):
+        manifest = {}
+        for test in self.tests:
+            manifest[test.id.hex] = {
+                question.id.hex: [option.id.hex for option in question.options.all()] for question in self.questions(test)
+            }
+        return ExamSession.objects.create(user=self.user, product=self.product, manifest=manifest)
+
+    def questions(self, test):
+        return [question for question in self.options if question.test_id == test.id]
+
+    def submission(self, correct):
+        """A submission answering the first `correct` questions of every test correctly and the rest wrongly."""
+        return [
+            {
+                'id': str(test.id),
+                'questions': [
+                    {'id': str(question.id), 'option_id': str(self.options[question][0 if index < correct else 1].id)}
+                    for index, question in enumerate(self.questions(test))
+                ],
+            }
+            for test in self.tests
+        ]
+
+
+class SubmissionIntakeTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        self.submitted_at = datetime(2026, 3, 2, 9, 30)
+
+    def test_claim_takes_the_oldest_pending_submissions(self):
+        newer = stage_submission(self.user, self.product, [], submitted_at=self.submitted_at + timedelta(minutes=1))
+        older = stage_submission(self.user, self.product, [], submitted_at=self.submitted_at)
+        done = stage_submission(self.user, self.product, [], submitted_at=self.submitted_at - timedelta(minutes=1))
+        StagedSubmission.objects.filter(id=done.id).update(status=StagedSubmission.Status.DONE)
+
+        claimed = claim_batch(1)
+        self.assertEqual([staged.id for staged in claimed], [older.id])
+        self.assertEqual(claimed[0].status, StagedSubmission.Status.PROCESSING)
+        self.assertEqual(claimed[0].attempts, 1)
+
+        self.assertEqual([staged.id for staged in claim_batch(10)], [newer.id])
+        self.assertEqual(claim_batch(10), [])
+
+    def test_submission_left_processing_is_claimed_again(self):
+        staged = stage_submission(self.user, self.product, [], submitted_at=self.submitted_at)
+        claim_batch(10)
+        self.assertEqual(claim_batch(10), [])
+
+        StagedSubmission.objects.filter(id=staged.id).update(claimed_at=now() - timedelta(hours=1))
+        claimed = claim_batch(10)
+        self.assertEqual([staged.id for staged in claimed], [staged.id])
+        self.assertEqual(claimed[0].attempts, 2)
+
+    def test_attempt_is_dated_when_it_was_submitted(self):
+        staged = stage_submission(self.user, self.product, self.submission(correct=2), submitted_at=self.submitted_at)
+
+        self.assertEqual(process_batch(10), (1, 1))
+
+        completed_test = CompletedTest.objects.get(id=staged.completed_test_id)
+        self.assertEqual(completed_test.completed_date, self.submitted_at)
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (4, 6))
+        self.assertEqual(
+            set(CompletedQuestion.objects.filter(completed_test=completed_test).values_list('completed_date', flat=True)),
+            {self.submitted_at}
+        )
+        staged.refresh_from_db()
+        self.assertEqual(staged.status, StagedSubmission.Status.DONE)
+
+    def test_unexpected_errors_are_retried_up_to_max_attempts(self):
+        staged = stage_submission(self.user, self.product, self.submission(correct=2), submitted_at=self.submitted_at)
+
+        save_failing = mock.patch('test_logic.submission_intake.save_completed_test', side_effect=RuntimeError('Connection lost'))
+        with save_failing, self.assertLogs('test_logic.submission_intake', 'ERROR'):
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                self.assertEqual(process_batch(10), (1, 0))
+                staged.refresh_from_db()
+                self.assertEqual(staged.attempts, attempt)
+                expected = StagedSubmission.Status.PENDING if attempt < MAX_ATTEMPTS else StagedSubmission.Status.FAILED
+                self.assertEqual(staged.status, expected)
+
+        self.assertEqual(staged.error, 'Connection lost')
+        self.assertEqual(process_batch(10), (0, 0))
+        self.assertFalse(CompletedTest.objects.filter(id=staged.completed_test_id).exists())
+
+    def test_invalid_submission_fails_without_retrying(self):
+        tests_data = self.submission(correct=3)
+        tests_data[0]['questions'][0]['option_id'] = str(self.options[self.questions(self.tests[1])[0]][0].id)
+        staged = stage_submission(self.user, self.product, tests_data, submitted_at=self.submitted_at)
+
+        self.assertEqual(process_batch(10), (1, 0))
+
+        staged.refresh_from_db()
+        self.assertEqual((staged.status, staged.attempts), (StagedSubmission.Status.FAILED, 1))
+        self.assertIn('One or more options not found', staged.error)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class SubmissionClaimLockingTests(ExamFixture, TransactionTestCase):
+
+    def test_submissions_locked_by_another_worker_are_skipped(self):
+        self.create_exam()
+        locked = stage_submission(self.user, self.product, [], submitted_at=datetime(2026, 3, 2, 9, 30))
+        free = stage_submission(self.user, self.product, [], submitted_at=datetime(2026, 3, 2, 9, 31))
+        holding = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            # A worker in the middle of claiming; threads get their own connection
+            try:
+                with transaction.atomic():
+                    list(StagedSubmission.objects.select_for_update().filter(id=locked.id))
+                    holding.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        worker = threading.Thread(target=hold_lock)
+        worker.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            claimed = claim_batch(10)
+        finally:
+            release.set()
+            worker.join()
+
+        self.assertEqual([staged.id for staged in claimed], [free.id])
+        self.assertEqual(StagedSubmission.objects.get(id=locked.id).status, StagedSubmission.Status.PENDING)
+
+
+class AnswerKeyTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+
+    def test_grading_sees_answer_changes_made_in_other_processes(self):
+        stale_key = get_answer_key(self.product.id)
+        question = self.questions(self.tests[0])[0]
+        option = self.options[question][1]
+        option.is_correct = True
+        option.save()
+        # Another worker still holds the key it built before the change
+        answer_keys._keys[self.product.id] = stale_key
+
+        answers = resolve_submission(self.product, self.submission(correct=0))
+        completed_test = save_completed_test(self.user, self.product, answers)
+
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (1, 6))
+        self.assertIsNot(get_answer_key(self.product.id), stale_key)
+
+    def test_grading_sees_questions_moved_to_another_product(self):
+        other = Product.objects.create(title='NIS')
+        other_test = Test.objects.create(title='Subject', product=other)
+        get_answer_key(other.id)
+        stale_key = get_answer_key(self.product.id)
+
+        question = self.questions(self.tests[0])[0]
+        question.test = other_test
+        question.save()
+
+        answers = resolve_submission(other, [{
+            'id': str(other_test.id),
+            'questions': [{'id': str(question.id), 'option_id': str(self.options[question][0].id)}],
+        }])
+        completed_test = save_completed_test(self.user, other, answers)
+
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (1, 1))
+        self.assertIsNot(get_answer_key(self.product.id), stale_key)
+        self.assertNotIn(question.id, get_answer_key(self.product.id).correct_options)
+
+
+class QuestionPoolTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        clear_question_pools()
+        self.test = self.tests[0]
+
+    def test_pool_is_rebuilt_when_questions_or_options_change(self):
+        pool = get_question_pool(self.test.id)
+        self.assertIs(get_question_pool(self.test.id), pool)
+
+        added = Question.objects.create(test=self.test, text='New question', task_type=1)
+        pool = get_question_pool(self.test.id)
+        self.assertIn(added.id, pool.question_ids())
+
+        option = self.options[self.questions(self.test)[0]][1]
+        option.text = 'Edited option'
+        option.save()
+        self.assertIsNot(get_question_pool(self.test.id), pool)
+
+        self.assertIn(added.id, get_question_pool(self.test.id).question_ids())
+        added.delete()
+        self.assertNotIn(added.id, get_question_pool(self.test.id).question_ids())
+
+    @override_settings(QUESTION_POOL_TTL=60)
+    def test_pool_expires_after_its_ttl(self):
+        pool = get_question_pool(self.test.id)
+        # bulk_create sends no signals, like a change made by another process
+        added, = Question.objects.bulk_create([Question(test=self.test, text='New question', task_type=1)])
+
+        with mock.patch.object(question_pool.time, 'monotonic', return_value=pool.built_at + 59):
+            self.assertIs(get_question_pool(self.test.id), pool)
+        with mock.patch.object(question_pool.time, 'monotonic', return_value=pool.built_at + 61):
+            self.assertIn(added.id, get_question_pool(self.test.id).question_ids())
+
+    def test_next_exam_start_returns_the_edited_question(self):
+        self.user.balance = self.product.sum * 2
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        def start():
+            response = client.post(reverse('get-tests'), {
+                'product_id': str(self.product.id), 'tests_ids': [str(self.test.id)],
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+            return {question['id']: question for question in response.json()['tests'][0]['questions']}
+
+        start()
+        question = self.questions(self.test)[0]
+        question.text = 'Edited question'
+        question.save()
+        option = self.options[question][0]
+        option.text = 'Edited option'
+        option.save()
+
+        issued = start()[str(question.id)]
+        self.assertEqual(issued['text'], 'Edited question')
+        self.assertIn('Edited option', [item['text'] for item in issued['options']])
+
+
+class ExamVariantTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        clear_question_pools()
+        clear_blueprint_cache()
+
+    def build(self, count):
+        call_command('build_exam_variants', str(self.product.id), '--count', str(count), stdout=io.StringIO())
+
+    def test_build_replaces_the_active_generation(self):
+        self.build(3)
+        self.build(2)
+
+        active = ExamVariant.objects.filter(product=self.product, is_active=True)
+        self.assertEqual(active.count(), 4)
+        self.assertEqual(set(active.values_list('generation', flat=True)), {2})
+        self.assertEqual(ExamVariant.objects.filter(product=self.product, is_active=False).count(), 6)
+        for variant in active:
+            self.assertEqual(
+                sorted(variant.question_ids), sorted(str(question.id) for question in self.questions(variant.test))
+            )
+
+    def test_pick_only_returns_the_active_generation(self):
+        self.assertEqual(pick_variants(self.tests), {})
+        self.build(1)
+        first = pick_variants(self.tests)
+        self.assertEqual(set(first), {test.id for test in self.tests})
+
+        self.build(2)
+
+        for _ in range(10):
+            picked = pick_variants(self.tests)
+            self.assertEqual(set(picked), {test.id for test in self.tests})
+            self.assertFalse({variant.id for variant in picked.values()} & {variant.id for variant in first.values()})
+
+    def test_exam_start_issues_a_variant_per_test(self):
+        self.build(1)
+        self.user.balance = self.product.sum
+        self.user.save()
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.post(reverse('get-tests'), {
+            'product_id': str(self.product.id), 'tests_ids': [str(test.id) for test in self.tests],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        session = ExamSession.objects.get(id=response.json()['session_id'])
+        variants = {variant.test_id: variant for variant in ExamVariant.objects.filter(is_active=True)}
+        self.assertEqual(sorted(session.variant_ids), sorted(variant.id.hex for variant in variants.values()))
+        for test_data in response.json()['tests']:
+            variant = variants[uuid.UUID(test_data['id'])]
+            self.assertEqual([question['id'] for question in test_data['questions']], variant.question_ids)
+        self.assertEqual(issued_counts(ExamSession.objects.all()), {variant.id.hex: 1 for variant in variants.values()})
+
+
+class ScoreBackfillTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+
+    def test_counters_agree_with_question_flags(self):
+        answers = resolve_submission(self.product, self.submission(correct=2))
+        completed_test = save_completed_test(self.user, self.product, answers)
+        CompletedTest.objects.filter(id=completed_test.id).update(test_scores=None, correct_count=None, total_count=None)
+        CompletedQuestion.objects.filter(completed_test=completed_test).update(is_correct=None)
+
+        # The answer key cached by this process no longer matches the options
+        get_answer_key(self.product.id)
+        question = self.questions(self.tests[0])[2]
+        Option.objects.filter(id=self.options[question][1].id).update(is_correct=True)
+
+        self.assertEqual(backfill_scores([completed_test.id]), 1)
+
+        completed_test.refresh_from_db()
+        flags = CompletedQuestion.objects.filter(completed_test=completed_test)
+        self.assertEqual(completed_test.correct_count, flags.filter(is_correct=True).count())
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (5, 6))
+        self.assertEqual(completed_test.test_scores, {
+            str(self.tests[0].id): {'correct': 3, 'total': 3},
+            str(self.tests[1].id): {'correct': 2, 'total': 3},
+        })
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Table partitioning is only supported on PostgreSQL')
+class PartitioningTests(ExamFixture, TestCase):
+    table = CompletedQuestion._meta.db_table
+
+    def setUp(self):
+        # Like any DDL on PostgreSQL the conversion is rolled back with the test
+        convert_to_partitioned(self.table, months=1)
+        self.create_exam()
+
+    def grade(self, month):
+        answers = resolve_submission(self.product, self.submission(correct=2))
+        return save_completed_test(self.user, self.product, answers, completed_date=datetime(month.year, month.month, 15, 10, 0))
+
+    def count_rows(self, partition):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {connection.ops.quote_name(partition)}')
+            return cursor.fetchone()[0]
+
+    def test_rows_in_the_default_partition_move_to_their_new_month(self):
+        # The cron job creating this month's partition was missed
+        month = add_months(date.today(), 6)
+        completed_test = self.grade(month)
+        self.assertEqual(self.count_rows(default_partition_name(self.table)), 6)
+
+        created = create_month_partitions(self.table, month, 1)
+
+        self.assertEqual(created, [partition_name(self.table, month)])
+        self.assertEqual(self.count_rows(created[0]), 6)
+        self.assertEqual(self.count_rows(default_partition_name(self.table)), 0)
+        questions = get_completed_questions(CompletedTest.objects.get(id=completed_test.id))
+        self.assertEqual(sum(question.is_correct for question in questions), 4)
+        self.assertEqual(sum(len(question.selected_option.all()) for question in questions), 6)
+
+    def test_answer_rows_are_read_from_the_attempts_month_only(self):
+        this_month = date.today()
+        next_month = add_months(this_month, 1)
+        create_month_partitions(self.table, next_month, 1)
+        completed_test = self.grade(this_month)
+        self.grade(next_month)
+
+        with CaptureQueriesContext(connection) as queries:
+            get_completed_questions(CompletedTest.objects.get(id=completed_test.id))
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + queries[1]['sql'])
+            plan = ' '.join(row[0] for row in cursor.fetchall())
+
+        self.assertIn(partition_name(self.table, this_month), plan)
+        self.assertNotIn(partition_name(self.table, next_month), plan)
+        self.assertNotIn(default_partition_name(self.table), plan)
+
+    def test_create_partitions_warns_about_rows_in_the_default_partition(self):
+        self.grade(add_months(date.today(), 24))
+        stderr = io.StringIO()
+
+        call_command('create_partitions', stdout=io.StringIO(), stderr=stderr)
+
+        self.assertIn('6 row(s)', stderr.getvalue())
+        self.assertIn('default partition', stderr.getvalue())
+
+
+class PackedAnswerTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+
+    def grade(self):
+        return save_completed_test(self.user, self.product, resolve_submission(self.product, self.submission(correct=2)))
+
+    def stored_answers(self, completed_test):
+        completed_test = CompletedTest.objects.get(id=completed_test.id)
+        answers = set()
+        for answer in get_completed_questions(completed_test):
+            options = answer.selected_option if isinstance(answer, PackedQuestion) else answer.selected_option.all()
+            answers.add((answer.id, answer.question_id, answer.is_correct, frozenset(option.id for option in options)))
+        return answers
+
+    def change_answer(self):
+        question = self.questions(self.tests[0])[2]
+        option = self.options[question][1]
+        option.is_correct = True
+        option.save()
+
+    def test_packing_keeps_answer_ids_and_grades(self):
+        completed_test = self.grade()
+        rows = self.stored_answers(completed_test)
+        self.assertEqual(sum(is_correct for _, _, is_correct, _ in rows), completed_test.correct_count)
+
+        pack_completed_tests([completed_test.id])
+        self.assertFalse(CompletedQuestion.objects.filter(completed_test=completed_test).exists())
+        self.change_answer()
+        self.assertEqual(self.stored_answers(completed_test), rows)
+
+        unpack_completed_tests([CompletedTest.objects.get(id=completed_test.id)])
+        self.assertEqual(self.stored_answers(completed_test), rows)
+
+    @override_settings(COMPLETED_ANSWERS_STORAGE=PACKED)
+    def test_packed_attempt_keeps_its_grades(self):
+        completed_test = self.grade()
+        self.assertFalse(CompletedQuestion.objects.filter(completed_test=completed_test).exists())
+        self.change_answer()
+
+        answers = self.stored_answers(completed_test)
+        self.assertEqual(len(answers), 6)
+        self.assertEqual(sum(is_correct for _, _, is_correct, _ in answers), completed_test.correct_count)
+        self.assertFalse({answer_id for answer_id, _, _, _ in answers} & {question_id for _, question_id, _, _ in answers})
+
+
+class ExamAutosaveTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        self.session = self.create_session()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def autosave(self, tests_data):
+        return self.client.post(reverse('autosave-test'), {
+            'product_id': str(self.product.id), 'session_id': str(self.session.id), 'tests': tests_data,
+        }, format='json')
+
+    def saved(self):
+        response = self.client.get(reverse('autosave-test'), {'product_id': str(self.product.id)})
+        self.assertEqual(response.status_code, 200)
+        return {
+            question['id']: question['option_id'] for test in response.json()['tests'] for question in test['questions']
+        }
+
+    def test_autosaved_deltas_are_merged_and_restored(self):
+        all_correct = self.submission(correct=3)
+        response = self.autosave(all_correct[:1])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['saved_questions'], 3)
+
+        # Only the question that changed is sent again
+        first_question = all_correct[0]['questions'][0]
+        changed = dict(first_question, option_id=str(self.options[self.questions(self.tests[0])[0]][1].id))
+        self.assertEqual(self.autosave([{'id': all_correct[0]['id'], 'questions': [changed]}]).status_code, 200)
+
+        saved = self.saved()
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(saved[first_question['id']], [changed['option_id']])
+        self.assertEqual(saved[all_correct[0]['questions'][1]['id']], [all_correct[0]['questions'][1]['option_id']])
+
+    def test_options_not_issued_in_the_session_are_rejected(self):
+        self.autosave(self.submission(correct=3)[:1])
+        tests_data = self.submission(correct=3)[:1]
+        tests_data[0]['questions'][0]['option_id'] = str(self.options[self.questions(self.tests[1])[0]][0].id)
+
+        response = self.autosave(tests_data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(len(self.saved()), 3)
+
+    def test_other_students_cannot_restore_the_session(self):
+        self.autosave(self.submission(correct=3)[:1])
+        other = User.objects.create_user(username='other', password='pw', first_name='Dana', last_name='Bek')
+        self.client.force_authenticate(other)
+
+        response = self.client.get(reverse('autosave-test'), {'product_id': str(self.product.id)})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_submission_completes_the_autosaved_answers(self):
+        tests_data = self.submission(correct=3)
+        self.autosave(tests_data[:1])
+
+        response = self.client.post(reverse('complete-test'), {
+            'product_id': str(self.product.id), 'session_id': str(self.session.id), 'tests': self.submission(correct=1)[1:],
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        completed_test = CompletedTest.objects.get(id=response.json()['completed_test_id'])
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (4, 6))
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.status, ExamSession.Status.COMPLETED)
+
+    def finalize(self, session_id):
+        return self.client.post(reverse('complete-test'), {
+            'product_id': str(self.product.id), 'session_id': session_id,
+        }, format='json')
+
+    def test_completed_session_cannot_be_finalized_again(self):
+        self.autosave(self.submission(correct=3))
+        self.assertEqual(self.finalize(str(self.session.id)).status_code, 201)
+
+        response = self.finalize(str(self.session.id))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(CompletedTest.objects.filter(user=self.user).count(), 1)
+
+    def test_unknown_session_is_not_found(self):
+        for session_id in ['nonsense', str(uuid7())]:
+            with self.subTest(session_id=session_id):
+                self.assertEqual(self.finalize(session_id).status_code, 404)
+
+        self.assertFalse(CompletedTest.objects.filter(user=self.user).exists())
+
+    def test_submission_without_a_session_is_not_matched_to_the_newest_one(self):
+        # A second exam start issued other questions; the client still submits the first exam
+        newer = ExamSession.objects.create(user=self.user, product=self.product, manifest={self.tests[1].id.hex: {}})
+
+        response = self.client.post(reverse('complete-test'), {
+            'product_id': str(self.product.id), 'tests': self.submission(correct=2),
+        }, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        completed_test = CompletedTest.objects.get(id=response.json()['completed_test_id'])
+        self.assertEqual((completed_test.correct_count, completed_test.total_count), (4, 6))
+        self.assertEqual(
+            set(ExamSession.objects.filter(id__in=[self.session.id, newer.id]).values_list('status', flat=True)),
+            {ExamSession.Status.STARTED},
+        )
+
+
+class CompletedTestHistoryTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_of_attempts_completed_at_the_same_time_do_not_overlap(self):
+        answers = resolve_submission(self.product, self.submission(correct=2))
+        completed_tests = [save_completed_test(self.user, self.product, answers) for _ in range(5)]
+        CompletedTest.objects.update(completed_date=datetime(2024, 5, 1, 10, 0))
+
+        seen = []
+        response = self.client.get(reverse('get-all-completed-tests'), {'summary': '1', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.json()['results'])
+            if response.json()['next'] is None:
+                break
+            response = self.client.get(response.json()['next'])
+
+        self.assertEqual(seen, sorted((str(completed_test.id) for completed_test in completed_tests), reverse=True))
+
+
+class ResultSnapshotTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        self.completed_test = save_completed_test(self.user, self.product, resolve_submission(self.product, self.submission(correct=2)))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def result(self):
+        response = self.client.get(reverse('get-completed-test-by-id', args=[self.completed_test.id]))
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def replace_snapshot(self, document):
+        CompletedTest.objects.filter(id=self.completed_test.id).update(result_snapshot=zlib.compress(json.dumps(document).encode()))
+
+    def snapshot_version(self):
+        return CompletedTest.objects.values_list('snapshot_version', flat=True).get(id=self.completed_test.id)
+
+    def test_the_snapshot_stored_at_grading_is_served_as_is(self):
+        self.assertEqual(self.snapshot_version(), result_snapshots.SNAPSHOT_VERSION)
+        self.assertEqual(self.result()['id'], str(self.completed_test.id))
+
+        self.replace_snapshot({'stored': True})
+
+        self.assertEqual(self.result(), {'stored': True})
+
+    def test_outdated_snapshots_are_rendered_again_on_request(self):
+        self.replace_snapshot({'stored': True})
+
+        with mock.patch.object(result_snapshots, 'SNAPSHOT_VERSION', result_snapshots.SNAPSHOT_VERSION + 1):
+            self.assertEqual(self.result()['id'], str(self.completed_test.id))
+            self.assertEqual(self.snapshot_version(), result_snapshots.SNAPSHOT_VERSION)
+
+    def test_rebuild_only_touches_outdated_snapshots(self):
+        current = save_completed_test(self.user, self.product, resolve_submission(self.product, self.submission(correct=1)))
+        CompletedTest.objects.filter(id=self.completed_test.id).update(snapshot_version=None, result_snapshot=None)
+        output = io.StringIO()
+
+        call_command('rebuild_result_snapshots', stdout=output)
+
+        self.assertIn('1 snapshot(s) to build', output.getvalue())
+        self.assertEqual(self.snapshot_version(), result_snapshots.SNAPSHOT_VERSION)
+        self.assertEqual(self.result()['id'], str(self.completed_test.id))
+        self.assertEqual(CompletedTest.objects.get(id=current.id).snapshot_version, result_snapshots.SNAPSHOT_VERSION)
+
+    def test_other_students_cannot_read_the_result(self):
+        other = User.objects.create_user(username='other', password='pw', first_name='Dana', last_name='Bek')
+        self.client.force_authenticate(other)
+
+        response = self.client.get(reverse('get-completed-test-by-id', args=[self.completed_test.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class IdempotencyTests(ExamFixture, TestCase):
+
+    def setUp(self):
+        self.create_exam()
+        self.calls = []
+
+        @api_view(['POST'])
+        @idempotent('tests')
+        def view(request):
+            self.calls.append(request.data)
+            if request.data.get('fail'):
+                raise RuntimeError('Failed')
+            return Response({'call': len(self.calls)}, status=request.data.get('status', 201))
+
+        self.view = view
+
+    def post(self, data, key='retry-1'):
+        request = APIRequestFactory().post('/tests/', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, self.user)
+        response = self.view(request)
+        # Replays are plain HttpResponses
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_retry_gets_the_first_response(self):
+        first = self.post({'answer': 1})
+        retry = self.post({'answer': 1})
+
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(json.loads(self.post({'answer': 1}, key='retry-2').content), {'call': 2})
+
+    def test_key_reused_with_another_body_is_rejected(self):
+        self.post({'answer': 1})
+
+        response = self.post({'answer': 2})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_duplicate_of_a_running_request_is_answered_at_once(self):
+        self.post({'answer': 1})
+        # As if the first request were still running
+        IdempotencyRecord.objects.update(status=IdempotencyRecord.Status.PENDING)
+
+        response = self.post({'answer': 1})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_server_errors_release_the_key(self):
+        self.assertEqual(self.post({'status': 503}).status_code, 503)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        with self.assertRaises(RuntimeError):
+            self.post({'fail': True}, key='retry-2')
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        self.assertEqual(json.loads(self.post({'status': 503}).content), {'call': 3})
+
+    def test_retried_submission_stores_one_attempt(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        data = {'product_id': str(self.product.id), 'tests': self.submission(correct=2)}
+
+        responses = [
+            client.post(reverse('complete-test'), data, format='json', HTTP_IDEMPOTENCY_KEY='submit-1') for _ in range(2)
+        ]
+
+        self.assertEqual([response.status_code for response in responses], [201, 201])
+        self.assertEqual(responses[0].json(), responses[1].json())
+        self.assertEqual(CompletedTest.objects.filter(user=self.user).count(), 1)
+
+
+class Uuid7Tests(TestCase):
+
+    def setUp(self):
+        # Keys generated here must not push the process's last timestamp into the future
+        state = mock.patch.multiple('test_logic.ids', _last_ms=0, _counter=0)
+        state.start()
+        self.addCleanup(state.stop)
+
+    def timestamp_ms(self, value):
+        return value.int >> 80
+
+    def test_version_and_variant_bits(self):
+        before = time.time_ns() // 1_000_000
+        value = uuid7()
+        after = time.time_ns() // 1_000_000
+
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, uuid.RFC_4122)
+        self.assertTrue(before <= self.timestamp_ms(value) <= after)
+
+    def test_keys_increase_within_a_millisecond(self):
+        frozen = time.time_ns() + 10 ** 9
+        with mock.patch('test_logic.ids.time.time_ns', return_value=frozen):
+            # More keys than the 12-bit counter holds, so it overflows into the next millisecond
+            values = [uuid7() for _ in range(5000)]
+
+        self.assertEqual(values, sorted(values, key=lambda value: value.int))
+        self.assertEqual(len(set(values)), len(values))
+        self.assertEqual(self.timestamp_ms(values[0]), frozen // 1_000_000)
+        self.assertGreater(self.timestamp_ms(values[-1]), frozen // 1_000_000)
+
+    def test_keys_increase_when_the_clock_goes_back(self):
+        latest = uuid7()
+        with mock.patch('test_logic.ids.time.time_ns', return_value=time.time_ns() - 60 * 10 ** 9):
+            earlier_clock = uuid7()
+
+        self.assertGreater(earlier_clock.int, latest.int)
+        self.assertEqual(earlier_clock.version, 7)
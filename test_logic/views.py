@@ -3,23 +3,29 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Product, Test, Question, Option, CompletedTest, CompletedQuestion
+from .models import Product, Test, Question, Option, CompletedTest, CompletedQuestion, ExamSession, StagedSubmission
 from .serializers import (
     ProductSerializer, TestSerializer, QuestionSerializer,
-    CurrentTestSerializer, CompletedTestSerializer, OptionSerializer,
-    CCompletedTestSerializer
+    CompletedTestSerializer, OptionSerializer,
+    CompletedTestSummarySerializer
 )
-from rest_framework.decorators import api_view
-from django.db.models import Sum
+from .pagination import CompletedTestCursorPagination
+from .exam_payload import render_exam_payload
+from .question_fragments import render_json
+from .exam_variants import pick_variants
+from .exam_sessions import find_session, find_open_session, session_answers, autosave_answers, saved_tests_data, SubmissionError
+from .grading import resolve_submission, save_completed_test
+from .submission_intake import stage_submission
+from .idempotency import idempotent, idempotency_key_parameter
+from .result_snapshots import load_snapshot, store_snapshot
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from django.conf import settings
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from datetime import timezone
 from django.utils.timezone import now
-from django.utils import timezone
 import logging
-import uuid
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import permission_classes
 from decimal import Decimal
 from random import shuffle
 from django.db.models import Q
@@ -103,6 +109,7 @@ class OptionViewSet(viewsets.ModelViewSet):
 @swagger_auto_schema(
     method='post',
     operation_description="Retrieve tests and their questions based on product and test IDs",
+    manual_parameters=[idempotency_key_parameter],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         required=['product_id', 'tests_ids'],
@@ -147,6 +154,7 @@ class OptionViewSet(viewsets.ModelViewSet):
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('exam_start')
 def product_tests_view(request):
     user = request.user
     product_id = request.data.get('product_id')
@@ -171,13 +179,23 @@ def product_tests_view(request):
     user.save()
 
     # Get the tests based on the provided IDs
-    tests = Test.objects.filter(product=product, id__in=tests_ids)
+    tests = list(Test.objects.filter(product=product, id__in=tests_ids))
 
     # Get total time for all tests
-    total_time = tests.aggregate(total_time=Sum('time'))['total_time'] or 0
+    total_time = sum(test.time or 0 for test in tests)
 
-    # Serialize the tests
-    serialized_tests = CurrentTestSerializer(tests, many=True).data
+    # Hand out a pre-built variant where one exists and build the payload in a fixed number of queries
+    variants = pick_variants(tests)
+    manifest = {}
+    rendered_tests = render_exam_payload(tests, variants=variants, manifest=manifest)
+
+    # Remember what was issued so the submission can be checked against it
+    session = ExamSession.objects.create(
+        user=user,
+        product=product,
+        manifest=manifest,
+        variant_ids=[variant.id.hex for variant in variants.values()],
+    )
 
     # Set the product, test start flag, and times for the user
     user.product = product  # Set the product for the user
@@ -186,12 +204,13 @@ def product_tests_view(request):
     user.test_start_time = now()  # Store the start time
     user.save()
 
-    # Return the response
-    return Response({
+    # Return the response, splicing the pre-rendered tests in as they are
+    head = render_json({
         "time": user.total_time,
         "test_is_started": user.test_is_started,
-        "tests": serialized_tests
-    }, status=status.HTTP_200_OK)
+        "session_id": str(session.id),
+    })[:-1]
+    return HttpResponse(head + b',"tests":' + rendered_tests + b'}', content_type='application/json', status=status.HTTP_200_OK)
 
 test_schema = openapi.Schema(
     type=openapi.TYPE_OBJECT,
@@ -257,14 +276,24 @@ def required_tests_by_product(request, product_id):
 
 
 
+def reset_test_state(user):
+    user.test_is_started = False
+    user.test_start_time = None
+    user.finish_test_time = None
+    user.save()
+
+
 @swagger_auto_schema(
     method='post',
     operation_description="Submit completed test data and store selected options for each question.",
+    manual_parameters=[idempotency_key_parameter],
     request_body=openapi.Schema(
         type=openapi.TYPE_OBJECT,
         required=['product_id', 'tests'],
         properties={
             'product_id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the product'),
+            'session_id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the exam session returned at exam start. Autosaved answers of the session are included in the submission, so `tests` may be omitted.'),
+            'async': openapi.Schema(type=openapi.TYPE_BOOLEAN, description='Queue the submission for background grading and return 202'),
             'tests': openapi.Schema(
                 type=openapi.TYPE_ARRAY,
                 items=openapi.Items(
@@ -296,12 +325,23 @@ def required_tests_by_product(request, product_id):
                 }
             }
         ),
+        202: openapi.Response(
+            description="Submission queued for grading",
+            examples={
+                "application/json": {
+                    "completed_test_id": "some-completed-test-uuid",
+                    "status": "PENDING"
+                }
+            }
+        ),
         400: openapi.Response(description="Invalid input data"),
-        404: openapi.Response(description="Product or Test/Question/Option not found")
+        404: openapi.Response(description="Product, exam session or Test/Question/Option not found"),
+        409: openapi.Response(description="Exam session is already completed")
     }
 )
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@idempotent('complete_test')
 def complete_test_view(request):
     user = request.user
     
@@ -309,12 +349,13 @@ def complete_test_view(request):
     logger.debug(f"Request headers: {request.headers}")
     
     product_id = request.data.get('product_id')
+    session_id = request.data.get('session_id')
     tests_data = request.data.get('tests')
     
     logger.debug(f"Received data - product_id: {product_id}, tests_data length: {len(tests_data) if tests_data else 0}")
 
-    # Validate request data
-    if not product_id or not isinstance(tests_data, list):
+    # Validate request data; with an exam session the answers may all have been autosaved already
+    if not product_id or not (isinstance(tests_data, list) or (tests_data is None and session_id)):
         logger.error(f"Invalid input data: product_id={product_id}, tests_data type={type(tests_data)}")
         return Response({"detail": "Invalid input data"}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -324,6 +365,18 @@ def complete_test_view(request):
     except Product.DoesNotExist:
         return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    if session_id:
+        session = find_session(user, product, session_id)
+        if session is None:
+            return Response({"detail": "Exam session not found."}, status=status.HTTP_404_NOT_FOUND)
+        if session.status != ExamSession.Status.STARTED:
+            return Response({"detail": "Exam session is already completed."}, status=status.HTTP_409_CONFLICT)
+        if tests_data is None:
+            tests_data = []
+    else:
+        # Legacy clients do not say which exam they are submitting, so do not guess a session
+        session = None
+
     # Calculate time spent
     test_finish_test_time = now()
     test_start_time = user.test_start_time
@@ -335,83 +388,192 @@ def complete_test_view(request):
     else:
         time_spent = (test_finish_test_time - test_start_time).total_seconds()
 
-    # Create the CompletedTest instance
-    completed_test = CompletedTest.objects.create(
-        user=user,
-        product=product,
-        completed_date=test_finish_test_time,
+    # In async mode only store the raw submission; grade_submissions workers grade it later
+    if getattr(settings, 'ASYNC_SUBMISSION_INTAKE', False) or request.data.get('async') is True:
+        staged = stage_submission(
+            user,
+            product,
+            tests_data,
+            session=session,
+            start_test_time=test_start_time,
+            submitted_at=test_finish_test_time,
+            time_spent=time_spent
+        )
+        reset_test_state(user)
+        return Response({
+            "completed_test_id": str(staged.completed_test_id),
+            "status": staged.status,
+            "time_spent_minutes": time_spent / 60
+        }, status=status.HTTP_202_ACCEPTED)
+
+    # Check the submission against what was issued at exam start, if we know it,
+    # and apply it on top of the autosaved answers.
+    # Clients without a session are validated with set-based lookups instead.
+    try:
+        if session is not None:
+            answers = session_answers(session, tests_data)
+        else:
+            answers = resolve_submission(product, tests_data)
+    except SubmissionError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+    # Grade in memory and store the attempt with bulk inserts in one transaction
+    completed_test = save_completed_test(
+        user,
+        product,
+        answers,
+        session=session,
         start_test_time=test_start_time or test_finish_test_time,
         time_spent=time_spent
     )
+    logger.debug(f"Graded completed test {completed_test.id}: {completed_test.correct_count}/{completed_test.total_count} correct")
 
-    # Process each test and its questions
-    for test_data in tests_data:
-        test_id = test_data.get('id')
-        questions_data = test_data.get('questions')
+    # Reset user test state after completion
+    reset_test_state(user)
+    
+    logger.debug(f"User {user.username} completed test {product.title}, test_is_started: {user.test_is_started}, test_start_time: {user.test_start_time}, finish_test_time: {user.finish_test_time}")
 
-        # Validate test existence
-        try:
-            test = Test.objects.select_related('product').get(id=test_id, product=product)
-        except Test.DoesNotExist:
-            return Response({"detail": f"Test with id {test_id} not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        "completed_test_id": str(completed_test.id),
+        "time_spent_minutes": time_spent / 60  # Convert seconds to minutes
+    }, status=status.HTTP_201_CREATED)
 
-        # Link the test to CompletedTest
-        completed_test.tests.add(test)
 
-        # Process each question
-        for question_data in questions_data:
-            question_id = question_data.get('id')
-            selected_option_ids = question_data.get('option_id')
-            
-            # Convert single option_id to list if necessary
-            if selected_option_ids is None:
-                selected_option_ids = []
-            elif isinstance(selected_option_ids, (str, uuid.UUID)):
-                selected_option_ids = [selected_option_ids]
-            elif isinstance(selected_option_ids, list):
-                selected_option_ids = selected_option_ids
-            else:
-                selected_option_ids = []
+autosave_tests_schema = openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    items=openapi.Items(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the test'),
+            'questions': openapi.Schema(
+                type=openapi.TYPE_ARRAY,
+                items=openapi.Items(
+                    type=openapi.TYPE_OBJECT,
+                    properties={
+                        'id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the question'),
+                        'option_id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID (or list of UUIDs) of the selected option')
+                    }
+                )
+            )
+        }
+    ),
+    description='Only the questions whose answers changed since the last autosave'
+)
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Return the answers autosaved in the open exam session, to restore an interrupted exam.",
+    manual_parameters=[
+        openapi.Parameter('product_id', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='UUID of the product'),
+        openapi.Parameter('session_id', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='UUID of the exam session'),
+    ],
+    responses={
+        200: openapi.Response(description="Autosaved answers"),
+        404: openapi.Response(description="Product or open exam session not found")
+    }
+)
+@swagger_auto_schema(
+    method='post',
+    operation_description="Save the answers changed since the last autosave into the open exam session.",
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        required=['product_id', 'tests'],
+        properties={
+            'product_id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the product'),
+            'session_id': openapi.Schema(type=openapi.TYPE_STRING, description='UUID of the exam session returned at exam start'),
+            'tests': autosave_tests_schema
+        }
+    ),
+    responses={
+        200: openapi.Response(
+            description="Answers saved",
+            examples={
+                "application/json": {
+                    "session_id": "some-session-uuid",
+                    "saved_questions": 3,
+                    "saved_at": "2024-01-01T15:30:00Z"
+                }
+            }
+        ),
+        400: openapi.Response(description="Invalid input data"),
+        404: openapi.Response(description="Product, open exam session or Test/Question/Option not found")
+    }
+)
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def autosave_test_view(request):
+    params = request.query_params if request.method == 'GET' else request.data
+    product_id = params.get('product_id')
+    if not product_id:
+        return Response({"detail": "Invalid input data"}, status=status.HTTP_400_BAD_REQUEST)
 
-            try:
-                question = Question.objects.select_related('test').get(id=question_id, test=test)
-            except Question.DoesNotExist:
-                return Response({"detail": f"Question with id {question_id} not found in test {test_id}."}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        product = Product.objects.get(id=product_id)
+    except Product.DoesNotExist:
+        return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            # Create the CompletedQuestion instance
-            completed_question = CompletedQuestion.objects.create(
-                completed_test=completed_test,
-                test=test,
-                question=question
-            )
+    session = find_open_session(request.user, product, params.get('session_id'))
+    if session is None:
+        return Response({"detail": "Exam session not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            # Add selected options (if any)
-            if selected_option_ids:
-                # Prefetch all selected options in a single query
-                selected_options = Option.objects.filter(
-                    id__in=selected_option_ids, 
-                    question=question
-                )
-                
-                # Check if any options were not found
-                if len(selected_options) != len(selected_option_ids):
-                    return Response({"detail": f"One or more options not found for question {question_id}."}, status=status.HTTP_404_NOT_FOUND)
-                
-                # Add all options at once
-                completed_question.selected_option.add(*selected_options)
+    if request.method == 'GET':
+        return Response({
+            "session_id": str(session.id),
+            "saved_at": session.answers_saved_at,
+            "tests": saved_tests_data(session)
+        }, status=status.HTTP_200_OK)
 
-    # Reset user test state after completion
-    user.test_is_started = False
-    user.test_start_time = None
-    user.finish_test_time = None
-    user.save()
-    
-    print(f"user: {user.email} completed test {product.title}, user.test_is_started: {user.test_is_started}, user.test_start_time: {user.test_start_time}, user.finish_test_time: {user.finish_test_time}" )
+    tests_data = request.data.get('tests')
+    if not isinstance(tests_data, list):
+        return Response({"detail": "Invalid input data"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        session = autosave_answers(session, tests_data)
+    except SubmissionError as e:
+        return Response({"detail": str(e)}, status=status.HTTP_404_NOT_FOUND)
 
     return Response({
-        "completed_test_id": str(completed_test.id),
-        "time_spent_minutes": time_spent / 60  # Convert seconds to minutes
-    }, status=status.HTTP_201_CREATED)
+        "session_id": str(session.id),
+        "saved_questions": sum(len(test_data.get('questions') or []) for test_data in tests_data),
+        "saved_at": session.answers_saved_at
+    }, status=status.HTTP_200_OK)
+
+
+@swagger_auto_schema(
+    method='get',
+    operation_description="Poll the grading status of a submission queued with async intake.",
+    responses={
+        200: openapi.Response(
+            description="Grading status",
+            examples={
+                "application/json": {
+                    "completed_test_id": "some-completed-test-uuid",
+                    "status": "DONE",
+                    "detail": ""
+                }
+            }
+        ),
+        404: openapi.Response(description="Submission not found.")
+    }
+)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def submission_status_view(request, completed_test_id):
+    staged = StagedSubmission.objects.filter(
+        completed_test_id=completed_test_id, user=request.user
+    ).values('status', 'error').first()
+
+    if staged is None:
+        # Submissions graded synchronously never go through the staging table
+        if not CompletedTest.objects.filter(id=completed_test_id, user=request.user).exists():
+            return Response({"detail": "Submission not found."}, status=status.HTTP_404_NOT_FOUND)
+        staged = {'status': StagedSubmission.Status.DONE, 'error': ''}
+
+    return Response({
+        "completed_test_id": str(completed_test_id),
+        "status": staged['status'],
+        "detail": staged['error']
+    }, status=status.HTTP_200_OK)
 
 
 @swagger_auto_schema(
@@ -467,30 +629,37 @@ def complete_test_view(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_completed_test_by_id(request, completed_test_id):
+    # Serve the result document stored at grading time as it is
+    snapshot = load_snapshot(completed_test_id, request.user)
+    if snapshot is not None:
+        return HttpResponse(snapshot, content_type='application/json', status=status.HTTP_200_OK)
+
     try:
         completed_test = CompletedTest.objects.select_related(
             'user', 
             'product'
         ).prefetch_related(
-            'tests',
-            'completed_questions',
-            'completed_questions__question',
-            'completed_questions__question__options',
-            'completed_questions__selected_option',
-            'completed_questions__test'
+            'tests'
         ).get(id=completed_test_id, user=request.user)
     except CompletedTest.DoesNotExist:
         return Response({"detail": "CompletedTest not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    # Pass the completed test to the serializer context
-    serializer = CCompletedTestSerializer(completed_test, context={'completed_test': completed_test})
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    # Attempts graded before snapshots existed, or with an outdated one, are
+    # serialized now and the snapshot is stored for the next request
+    return HttpResponse(store_snapshot(completed_test), content_type='application/json', status=status.HTTP_200_OK)
 
 
 
 @swagger_auto_schema(
     method='get',
-    operation_description="Retrieve all completed tests for the authenticated user.",
+    operation_description="Retrieve all completed tests for the authenticated user, newest first. "
+                          "Pass `page_size` (and then the returned `next` cursor) to paginate, "
+                          "and `summary=1` for the lightweight list format.",
+    manual_parameters=[
+        openapi.Parameter('cursor', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Cursor from the previous page'),
+        openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Attempts per page (max 100)'),
+        openapi.Parameter('summary', openapi.IN_QUERY, type=openapi.TYPE_BOOLEAN, description='Return id, product, date, time and score only'),
+    ],
     responses={
         200: openapi.Response(
             description="List of all CompletedTests",
@@ -542,13 +711,35 @@ def get_completed_test_by_id(request, completed_test_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_all_completed_tests(request):
+    # Attempts graded before the score columns existed are counted in the same query;
+    # COALESCE only runs the subqueries for those rows
+    counted_questions = CompletedQuestion.objects.filter(
+        completed_test=OuterRef('pk')
+    ).values('completed_test').annotate(count=Count('id', distinct=True)).values('count')
     completed_tests = CompletedTest.objects.select_related(
         'user',
         'product'
-    ).filter(user=request.user)
+    ).filter(user=request.user).defer(
+        'answers', 'result_snapshot'
+    ).annotate(
+        correct_answers=Coalesce(
+            'correct_count',
+            Subquery(counted_questions.filter(selected_option__is_correct=True)),
+            Value(0)
+        ),
+        total_questions=Coalesce('total_count', Subquery(counted_questions), Value(0))
+    ).order_by('-completed_date', '-id')
+
+    serializer_class = CompletedTestSummarySerializer if request.query_params.get('summary') in ('1', 'true') else CompletedTestSerializer
+
+    # Paginate only when asked to, so existing clients keep getting the full list
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        paginator = CompletedTestCursorPagination()
+        page = paginator.paginate_queryset(completed_tests, request)
+        return paginator.get_paginated_response(serializer_class(page, many=True).data)
 
     # Serialize all CompletedTests
-    serializer = CompletedTestSerializer(completed_tests, many=True)
+    serializer = serializer_class(completed_tests, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 @api_view(['GET'])